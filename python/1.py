@@ -4,14 +4,24 @@ import csv
 import glob
 import math
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
-from typing import Set, Dict, List, Any, Tuple
+from typing import Set, Dict, List, Any, Tuple, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from tracing import Tracer, span
 
 # Configuration
 EKIDATA_PATH = os.path.join('public', 'ekidata', 'station20251211free.csv')
 GEOJSON_SEARCH_ROOT = './public/'  # Root directory to search for GeoJSON files
 GEOJSON_NAME_KEYS = ['name', 'station_name', 'stationName', 'title'] # Priority keys for station name
 GEOJSON_LINE_KEYS = ['line_name', 'line', 'railway', 'company'] # Priority keys for line/company name
+PARALLEL_MIN_FILES = 8 # Below this, a process pool costs more than it saves
+DUPLICATE_RADIUS_KM = 0.5 # Stations of different companies closer than this are compared
+NAME_SIMILARITY = 0.8 # SequenceMatcher ratio above which two cleaned names count as the same station
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON_EQUATOR = 111.32
 
 def normalize_name(name: str) -> str:
     """
@@ -105,131 +115,249 @@ def load_ekidata_names(filepath: str) -> Set[str]:
     print(f"Loaded {len(names)} unique stations from Ekidata.")
     return names
 
-def extract_geojson_data(root_dir: str) -> Dict[str, List[Dict[str, Any]]]:
+def parse_geojson_file(file_path: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Parses one GeoJSON file into station entries (first entry per station name).
+    Runs in a worker process, so it only takes and returns picklable values.
+    Returns None for files without a line feature.
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Warning: Failed to parse {file_path}: {e}")
+        return None
+
+    features = []
+    if data.get('type') == 'FeatureCollection':
+        features = data.get('features', [])
+    elif data.get('type') == 'Feature':
+        features = [data]
+
+    if not any((feature.get('properties') or {}).get('type') == 'line' for feature in features):
+        return None
+
+    company_name = os.path.splitext(os.path.basename(file_path))[0]
+    entries = {}
+
+    for feature in features:
+        props = feature.get('properties', {})
+        geom = feature.get('geometry', {})
+
+        if not props or props.get('type') != 'station':
+            continue
+
+        found_name = None
+        for key in GEOJSON_NAME_KEYS:
+            if key in props:
+                found_name = props[key]
+                break
+
+        clean_name = normalize_name(found_name) if found_name else ""
+        if not clean_name or clean_name in entries:
+            continue
+
+        line_name = company_name
+        for key in GEOJSON_LINE_KEYS:
+            if key in props and props[key]:
+                line_name = normalize_name(props[key])
+                break
+
+        transfers_raw = props.get('transfers', [])
+        transfers_set = set()
+        if isinstance(transfers_raw, list):
+            for t in transfers_raw:
+                if isinstance(t, str):
+                    transfers_set.add(normalize_name(t))
+
+        coords = None
+        if geom and geom.get('type') == 'Point':
+            c = geom.get('coordinates')
+            if c and len(c) >= 2:
+                coords = (float(c[0]), float(c[1]))
+
+        entries[clean_name] = {
+            'company': company_name,
+            'file': file_path,
+            'line': line_name,
+            'transfers': transfers_set,
+            'coords': coords,
+            'original_name': clean_name
+        }
+
+    return company_name, list(entries.values())
+
+def extract_geojson_data(root_dir: str, pool: Optional[ProcessPoolExecutor] = None) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Parses all GeoJSON files (in the pool when given) and indexes stations by name.
+    Each company appears at most once per name (first file wins, as before).
+    """
     station_map: Dict[str, List[Dict[str, Any]]] = {}
-    
+    seen: Set[Tuple[str, str]] = set() # (name, company)
+
     search_pattern = os.path.join(root_dir, '**', '*.geojson')
-    files = glob.glob(search_pattern, recursive=True)
-    
+    files = sorted(glob.glob(search_pattern, recursive=True))
+
     print(f"Found {len(files)} GeoJSON files. Scanning contents...")
 
-    for file_path in files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                features = []
-                if data.get('type') == 'FeatureCollection':
-                    features = data.get('features', [])
-                elif data.get('type') == 'Feature':
-                    features = [data]
-                
-                has_valid_line_feature = False
-                for feature in features:
-                    props = feature.get('properties', {})
-                    if props.get('type') == 'line':
-                        has_valid_line_feature = True
-                        break
-                
-                if not has_valid_line_feature:
-                    continue
+    if pool is not None and len(files) >= PARALLEL_MIN_FILES:
+        results = pool.map(parse_geojson_file, files, chunksize=max(1, len(files) // 64))
+    else:
+        results = map(parse_geojson_file, files)
 
-                company_name = os.path.splitext(os.path.basename(file_path))[0]
-
-                for feature in features:
-                    props = feature.get('properties', {})
-                    geom = feature.get('geometry', {})
-                    
-                    if not props:
-                        continue
-                    
-                    if props.get('type') != 'station':
-                        continue
-
-                    found_name = None
-                    for key in GEOJSON_NAME_KEYS:
-                        if key in props:
-                            found_name = props[key]
-                            break
-                    
-                    if not found_name:
-                        continue
-
-                    clean_name = normalize_name(found_name)
-                    if not clean_name:
-                        continue
-
-                    line_name = company_name
-                    for key in GEOJSON_LINE_KEYS:
-                        if key in props and props[key]:
-                            line_name = normalize_name(props[key])
-                            break
-                    
-                    transfers_raw = props.get('transfers', [])
-                    transfers_set = set()
-                    if isinstance(transfers_raw, list):
-                        for t in transfers_raw:
-                            if isinstance(t, str):
-                                transfers_set.add(normalize_name(t))
-                    
-                    coords = None
-                    if geom and geom.get('type') == 'Point':
-                        c = geom.get('coordinates')
-                        if c and len(c) >= 2:
-                            coords = (float(c[0]), float(c[1]))
-
-                    entry = {
-                        'company': company_name,
-                        'file': file_path,
-                        'line': line_name,
-                        'transfers': transfers_set,
-                        'coords': coords,
-                        'original_name': clean_name
-                    }
-
-                    if clean_name not in station_map:
-                        station_map[clean_name] = []
-                    
-                    is_existing = any(e['company'] == company_name for e in station_map[clean_name])
-                    if not is_existing:
-                        station_map[clean_name].append(entry)
-
-        except Exception as e:
-            print(f"Warning: Failed to parse {file_path}: {e}")
+    for result in results:
+        if result is None:
+            continue
+        company_name, entries = result
+        for entry in entries:
+            key = (entry['original_name'], company_name)
+            if key in seen:
+                continue
+            seen.add(key)
+            station_map.setdefault(entry['original_name'], []).append(entry)
 
     print(f"Loaded {len(station_map)} unique station names from GeoJSONs.")
     return station_map
 
-def check_inter_company_duplicates(station_map: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
-    duplicates_report = {}
+def _bigrams(text: str) -> Set[str]:
+    return {text[i:i + 2] for i in range(len(text) - 1)}
 
-    for name, entries in station_map.items():
-        if len(entries) < 2:
+def suggest_matches(geojson_only: Set[str], ekidata_only: Set[str], min_score: int = 2) -> Dict[str, Dict[str, Any]]:
+    """
+    Best LCS match in ekidata_only for each unmatched GeoJSON name.
+    An LCS of at least 2 needs a shared bigram, so only names sharing one are scored.
+    Ties go to the alphabetically first candidate.
+    """
+    index: Dict[str, Set[str]] = {}
+    for e_name in ekidata_only:
+        for bg in _bigrams(e_name):
+            index.setdefault(bg, set()).add(e_name)
+
+    suggestions = {}
+    for g_name in geojson_only:
+        cleaned_g = clean_for_fuzzy(g_name)
+        if not cleaned_g:
             continue
-            
-        collisions = []
-        for i in range(len(entries)):
-            for j in range(i + 1, len(entries)):
-                entry_a = entries[i]
-                entry_b = entries[j]
-                
-                line_a = entry_a['line']
-                line_b = entry_b['line']
-                
-                is_valid_transfer = (line_a in entry_b['transfers']) or (line_b in entry_a['transfers'])
-                
-                if not is_valid_transfer:
-                    dist = calculate_distance(entry_a['coords'], entry_b['coords'])
-                    collisions.append({
-                        'company1': entry_a['company'],
-                        'company2': entry_b['company'],
-                        'distance': dist
-                    })
-        
-        if collisions:
-            duplicates_report[name] = collisions
 
-    return duplicates_report
+        candidates = set()
+        for bg in _bigrams(cleaned_g):
+            candidates |= index.get(bg, set())
+
+        best_candidate = None
+        best_score = 0
+        for e_name in sorted(candidates):
+            score = get_lcs_length(cleaned_g, e_name)
+            if score > best_score:
+                best_score = score
+                best_candidate = e_name
+
+        if best_candidate and best_score >= min_score:
+            suggestions[g_name] = {
+                'match': best_candidate,
+                'score': best_score,
+                'cleaned': cleaned_g
+            }
+    return suggestions
+
+def names_similar(a: str, b: str) -> bool:
+    """
+    Same station under a different spelling: equal after cleaning
+    (JR prefix, brackets, full-width, ヶ) or nearly equal.
+    """
+    ca = normalize_advanced(clean_for_fuzzy(a))
+    cb = normalize_advanced(clean_for_fuzzy(b))
+    if not ca or not cb:
+        return False
+    return ca == cb or SequenceMatcher(None, ca, cb).ratio() >= NAME_SIMILARITY
+
+def cluster_stations(points: List[Tuple[float, float]], radius_km: float) -> Tuple[List[List[int]], List[Tuple[int, int, float]]]:
+    """
+    Groups points (lon, lat) into clusters of stations chained within radius_km.
+    Uses a uniform grid with radius-sized cells, so each point is only compared
+    against the 3x3 neighbouring cells (near-linear for station densities).
+    Returns (clusters as index lists, close pairs (i, j, km)).
+    """
+    parent = list(range(len(points)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    for i, (lon, lat) in enumerate(points):
+        # Equirectangular km at the point's latitude; exact enough at sub-km radius
+        x = lon * KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat))
+        y = lat * KM_PER_DEG_LAT
+        grid.setdefault((int(x // radius_km), int(y // radius_km)), []).append(i)
+
+    pairs = []
+    for (cx, cy), members in grid.items():
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                neighbours = grid.get((cx + dx, cy + dy))
+                if not neighbours:
+                    continue
+                for i in members:
+                    for j in neighbours:
+                        if j <= i:
+                            continue
+                        dist = calculate_distance(points[i], points[j])
+                        if dist <= radius_km:
+                            pairs.append((i, j, dist))
+                            parent[find(i)] = find(j)
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(points)):
+        clusters.setdefault(find(i), []).append(i)
+    return [c for c in clusters.values() if len(c) > 1], pairs
+
+def check_inter_company_duplicates(station_map: Dict[str, List[Dict[str, Any]]], radius_km: float = DUPLICATE_RADIUS_KM) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, List[Dict[str, Any]]]]:
+    """
+    Clusters all stations spatially, then classifies each cross-company pair in a
+    cluster that has no transfer link between their lines:
+      - similar names   -> duplicate (same station entered twice)
+      - different names -> co-located (probably a missing transfer)
+    Stations without Point coordinates cannot be placed on the grid; as before they are
+    compared by exact name with the other same-name stations and reported with distance N/A.
+    Returns (duplicates, colocated), keyed by station name (\"A / B\" when the names differ).
+    """
+    entries = [e for es in station_map.values() for e in es if e['coords']]
+    _, pairs = cluster_stations([e['coords'] for e in entries], radius_km)
+    pairs = [(entries[i], entries[j], dist) for i, j, dist in pairs]
+
+    for es in station_map.values():
+        missing = [e for e in es if not e['coords']]
+        located = [e for e in es if e['coords']]
+        for i, entry_a in enumerate(missing):
+            for entry_b in missing[i + 1:] + located:
+                pairs.append((entry_a, entry_b, -1.0))
+
+    duplicates_report: Dict[str, List[Dict[str, Any]]] = {}
+    colocated_report: Dict[str, List[Dict[str, Any]]] = {}
+    for entry_a, entry_b, dist in pairs:
+        if entry_a['company'] == entry_b['company']:
+            continue
+        if entry_a['line'] in entry_b['transfers'] or entry_b['line'] in entry_a['transfers']:
+            continue
+
+        # Stable ordering so reruns produce identical reports
+        if (entry_a['company'], entry_a['original_name']) > (entry_b['company'], entry_b['original_name']):
+            entry_a, entry_b = entry_b, entry_a
+        name_a, name_b = entry_a['original_name'], entry_b['original_name']
+        collision = {'company1': entry_a['company'], 'company2': entry_b['company'], 'distance': dist}
+        if name_a == name_b:
+            duplicates_report.setdefault(name_a, []).append(collision)
+        elif names_similar(name_a, name_b):
+            duplicates_report.setdefault(f"{name_a} / {name_b}", []).append(collision)
+        else:
+            colocated_report.setdefault(f"{name_a} / {name_b}", []).append(collision)
+
+    for report in (duplicates_report, colocated_report):
+        for collisions in report.values():
+            collisions.sort(key=lambda c: (c['company1'], c['company2']))
+    return duplicates_report, colocated_report
 
 def write_diff_report(filename: str, title: str, dataset: Set[str], metadata: Dict[str, List[Dict]] = None, suggestions: Dict[str, Dict] = None):
     """
@@ -276,97 +404,84 @@ def write_duplicate_report(filename: str, title: str, duplicate_map: Dict[str, L
     print(f"Generated report: {filename}")
 
 def main():
-    ekidata_names = load_ekidata_names(EKIDATA_PATH)
-    geojson_data = extract_geojson_data(GEOJSON_SEARCH_ROOT)
-    geojson_raw_names = set(geojson_data.keys())
-
-    # --- Matching Process ---
-    
-    # Step 2a: Direct Match
-    matched_names = geojson_raw_names & ekidata_names
-    geojson_unmatched_1 = geojson_raw_names - ekidata_names
-    
-    # Step 2b: Advanced Match (Fullwidth, ヶ->ケ)
-    extra_matches_original_names = set()
-    for g_name in geojson_unmatched_1:
-        adv_name = normalize_advanced(g_name)
-        if adv_name in ekidata_names:
-            extra_matches_original_names.add(g_name)
-    
-    final_matched_geojson_names = matched_names | extra_matches_original_names
-    final_geojson_only = geojson_raw_names - final_matched_geojson_names
-    
-    # Reconstruct matched ekidata names to find what's TRULY unmatched in Ekidata
-    ekidata_matched_names = matched_names.copy()
-    for g_name in extra_matches_original_names:
-        adv_name = normalize_advanced(g_name)
-        if adv_name in ekidata_names:
-            ekidata_matched_names.add(adv_name)
-            
-    final_ekidata_only = ekidata_names - ekidata_matched_names
-
-    # --- Step 3: Fuzzy Suggestions for GeoJSON Unmatched ---
-    # Goal: Find best match in final_ekidata_only for stations in final_geojson_only
-    # Strategy: Clean name (remove JR/brackets) -> Find Longest Common Substring in unmatched ekidata
-    
-    fuzzy_suggestions = {}
-    
-    for g_name in final_geojson_only:
-        # Clean the GeoJSON name
-        cleaned_g = clean_for_fuzzy(g_name)
-        if not cleaned_g:
-            continue
-            
-        best_candidate = None
-        best_score = 0
-        
-        for e_name in final_ekidata_only:
-            # We compare cleaned GeoJSON name vs Raw Ekidata Unmatched Name
-            # (assuming Ekidata names are already reasonably standard)
-            score = get_lcs_length(cleaned_g, e_name)
-            
-            if score > best_score:
-                best_score = score
-                best_candidate = e_name
-        
-        # Threshold: At least 2 chars match to avoid noise
-        if best_candidate and best_score >= 2:
-            fuzzy_suggestions[g_name] = {
-                'match': best_candidate, 
-                'score': best_score,
-                'cleaned': cleaned_g
-            }
-
-    # --- Check for Inter-Company Duplicates ---
-    duplicate_map = check_inter_company_duplicates(geojson_data)
-    
-    # --- Output ---
-    print("\n--- Comparison Results ---")
-    print(f"Total GeoJSON Stations (Raw): {len(geojson_raw_names)}")
-    print(f"Total Ekidata Stations: {len(ekidata_names)}")
-    print("-" * 30)
-    print(f"Exact Matches: {len(matched_names)}")
-    print(f"Advanced Matches (Full-width/ケ): {len(extra_matches_original_names)}")
-    print(f"Total Matches: {len(final_matched_geojson_names)}")
-    print("-" * 30)
-    print(f"Only in GeoJSON: {len(final_geojson_only)}")
-    print(f"Only in Ekidata: {len(final_ekidata_only)}")
-    print(f"Potential Duplicates (No Transfer Link): {len(duplicate_map)}")
-
-    write_diff_report("diff_in_geojson_only.txt", 
-                     "Stations found in GeoJSON but NOT in Ekidata (with Suggestions)", 
-                     final_geojson_only, 
-                     geojson_data, 
-                     fuzzy_suggestions)
-                     
-    write_diff_report("diff_in_ekidata_only.txt", 
-                     "Stations found in Ekidata but NOT in GeoJSON", 
-                     final_ekidata_only)
-    
-    if duplicate_map:
-        write_duplicate_report("duplicate_stations_across_companies.txt", 
-                             "Stations with inter-company name collisions (No Transfer Link)", 
-                             duplicate_map)
+    with Tracer() as tracer:
+        with ProcessPoolExecutor() as pool:
+            # Ekidata CSV loads in a worker while the GeoJSON files are parsed
+            with span('load'):
+                ekidata_future = pool.submit(load_ekidata_names, EKIDATA_PATH)
+                geojson_data = extract_geojson_data(GEOJSON_SEARCH_ROOT, pool)
+                ekidata_names = ekidata_future.result()
+        geojson_raw_names = set(geojson_data.keys())
+
+        # --- Matching Process ---
+        with span('match'):
+            # Step 2a: Direct Match
+            matched_names = geojson_raw_names & ekidata_names
+            geojson_unmatched_1 = geojson_raw_names - ekidata_names
+
+            # Step 2b: Advanced Match (Fullwidth, ヶ->ケ)
+            advanced = {g_name: normalize_advanced(g_name) for g_name in geojson_unmatched_1}
+            extra_matches_original_names = {g for g, adv in advanced.items() if adv in ekidata_names}
+
+            final_matched_geojson_names = matched_names | extra_matches_original_names
+            final_geojson_only = geojson_raw_names - final_matched_geojson_names
+
+            # Matched ekidata names, to find what's TRULY unmatched in Ekidata
+            ekidata_matched_names = matched_names | {advanced[g] for g in extra_matches_original_names}
+            final_ekidata_only = ekidata_names - ekidata_matched_names
+
+        # --- Step 3: Fuzzy Suggestions for GeoJSON Unmatched ---
+        # Clean name (remove JR/brackets) -> Longest Common Substring in unmatched ekidata
+        with span('suggest'):
+            fuzzy_suggestions = suggest_matches(final_geojson_only, final_ekidata_only)
+
+        # --- Check for Inter-Company Duplicates / Co-located Stations ---
+        with span('duplicates'):
+            duplicate_map, colocated_map = check_inter_company_duplicates(geojson_data)
+
+        # --- Output ---
+        print("\n--- Comparison Results ---")
+        print(f"Total GeoJSON Stations (Raw): {len(geojson_raw_names)}")
+        print(f"Total Ekidata Stations: {len(ekidata_names)}")
+        print("-" * 30)
+        print(f"Exact Matches: {len(matched_names)}")
+        print(f"Advanced Matches (Full-width/ケ): {len(extra_matches_original_names)}")
+        print(f"Total Matches: {len(final_matched_geojson_names)}")
+        print("-" * 30)
+        print(f"Only in GeoJSON: {len(final_geojson_only)}")
+        print(f"Only in Ekidata: {len(final_ekidata_only)}")
+        print(f"Potential Duplicates (No Transfer Link): {len(duplicate_map)}")
+        print(f"Co-located Without Transfer Link: {len(colocated_map)}")
+        no_coords = sum(1 for es in geojson_data.values() for e in es if not e['coords'])
+        if no_coords:
+            print(f"Stations Without Coordinates (name match only, distance N/A): {no_coords}")
+
+        with span('write_reports'):
+            write_diff_report("diff_in_geojson_only.txt",
+                             "Stations found in GeoJSON but NOT in Ekidata (with Suggestions)",
+                             final_geojson_only,
+                             geojson_data,
+                             fuzzy_suggestions)
+
+            write_diff_report("diff_in_ekidata_only.txt",
+                             "Stations found in Ekidata but NOT in GeoJSON",
+                             final_ekidata_only)
+
+            if duplicate_map:
+                write_duplicate_report("duplicate_stations_across_companies.txt",
+                                     f"Stations with inter-company name collisions within {DUPLICATE_RADIUS_KM} km (No Transfer Link)",
+                                     duplicate_map)
+
+            if colocated_map:
+                write_duplicate_report("colocated_stations_without_transfer.txt",
+                                     f"Differently named stations of different companies within {DUPLICATE_RADIUS_KM} km (No Transfer Link)",
+                                     colocated_map)
+
+    report = tracer.report()
+    print("\n--- Phase Timing ---")
+    for stage in report['stages']:
+        print(f"{stage['name']:<15} {stage['seconds']:>8.3f}s")
+    print(f"{'total':<15} {report['duration']:>8.3f}s")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,39 @@
 import logging
 import json
-import psutil
-import time
 from worker_manager import manager
+from metrics import registry as metrics_registry
+from tracing import load_build_runs
+from line_pyramid import query_lines, level_for_zoom
+from railway_api import get_pool, get_route_graph
+from station_search import search
+from perf_sampler import sampler
+from dashboard_feed import DashboardFeed
 
 frontend_logger = logging.getLogger("Frontend")
 
+# 仪表盘变更推送, 前端 (webview) 与 SSE 路由共用
+feed = DashboardFeed(manager)
+
 class Api:
     
     def __init__(self):
         self._window=None
         self._is_maximized = False
-        self._last_net = psutil.net_io_counters()
-        self._last_disk = psutil.disk_io_counters()
-        self._last_time = time.time()  
+        sampler.start()
         
     def setWindow(self,window):
         self._window=window
+        feed.subscribe(self._push_dashboard)
+
+    def _push_dashboard(self, payload):
+        """合并后的差分一次 evaluate_js 推送到前端"""
+        if not self._window:
+            return
+        js_payload = json.dumps(payload, ensure_ascii=False, default=str)
+        try:
+            self._window.evaluate_js(f"window.applyDashboardDiff && window.applyDashboardDiff({js_payload})")
+        except Exception:
+            pass
         
     def sendLog(self, level, msg):
         try:
@@ -67,38 +84,32 @@ class Api:
             logging.error(e)'''
 
     def retrive_performance_data(self):
-        """获取性能数据"""
-        curr_net = psutil.net_io_counters()
-        curr_disk = psutil.disk_io_counters()
-        curr_time = time.time()
-
-        dt = curr_time - self._last_time
-        try:
-            disk_r = (curr_disk.read_bytes - self._last_disk.read_bytes) / 1024 / 1024 / dt
-            disk_w = (curr_disk.write_bytes - self._last_disk.write_bytes) / 1024 / 1024 / dt
-            
-            net_d = (curr_net.bytes_recv - self._last_net.bytes_recv) / 1024 / dt
-            net_u = (curr_net.bytes_sent - self._last_net.bytes_sent) / 1024 / dt
-            
-            self._last_net = curr_net
-            self._last_disk = curr_disk
-            self._last_time = curr_time
-
-            return [int(psutil.cpu_percent(interval=1)), int(psutil.virtual_memory().percent), int(disk_r), int(disk_w), int(net_d), int(net_u)]
-        except:
-            return[0,0,0,0,0,0]
+        """获取性能数据 (后台采样的最新值, 不阻塞)"""
+        sample = sampler.latest()
+        if not sample:
+            return [0,0,0,0,0,0]
+        return [int(sample[k]) for k in ('cpu', 'ram', 'disk_r', 'disk_w', 'net_d', 'net_u')]
         # 顺序: CPU, RAM, DISK, NET
 
+    def get_performance(self, points=60, seconds=None):
+        """最新样本 (含本进程与子进程) 与降采样历史"""
+        return {
+            "latest": sampler.latest(),
+            "history": sampler.history(int(points), seconds)
+        }
+
     def get_workers_status(self):
         return [w.get_dashboard_view() for w in manager.get_all_workers()]
 
+    def get_workers_snapshot(self):
+        """完整视图与当前版本号, 之后的变化由 applyDashboardDiff 推送"""
+        return feed.snapshot()
+
     def start_worker(self, name):
-        worker = manager.get_worker(name)
-        if worker:
-            worker.status['nextrun'] = 0
-            worker.status['statcode'] = 0
-            return True
-        return False
+        return manager.start_worker(name)
+
+    def cancel_worker(self, name):
+        return manager.cancel_worker(name)
 
     def start_full_cycle(self):
         manager.start_full_cycle()
@@ -108,14 +119,74 @@ class Api:
         manager.cycle_active = False
         return True
 
+    def get_worker_history(self, name, limit=50):
+        return manager.get_history(name, int(limit))
+
+    def get_metrics(self):
+        return metrics_registry.snapshot()
+
+    def get_cycle_report(self):
+        return manager.last_cycle_report
+
+    def get_build_status(self):
+        builds = manager.get_workers_by_type("build")
+        return builds[0].runner.get_view() if builds else None
+
+    def get_build_runs(self, limit=20):
+        '''历次构建的阶段耗时/最慢公司/相对上次变慢的 span'''
+        builds = manager.get_workers_by_type("build")
+        return load_build_runs(builds[0].db_path, int(limit)) if builds else []
+
+    def get_lines(self, company_id=None, bbox=None, zoom=None):
+        '''按缩放级别选取化简几何; bbox 为 [min_lon, min_lat, max_lon, max_lat]'''
+        builds = manager.get_workers_by_type("build")
+        if not builds:
+            return None
+        pool = get_pool(builds[0].db_path)
+        if pool.refresh() is None:
+            return None
+        level = level_for_zoom(None if zoom is None else float(zoom))
+        with pool.connection() as conn:
+            return json.loads(query_lines(conn, level, company_id, bbox))
+
+    def search_stations(self, query, limit=10):
+        '''车站名 / 读音 / 罗马字检索 (输入联想)'''
+        builds = manager.get_workers_by_type("build")
+        if not builds:
+            return []
+        pool = get_pool(builds[0].db_path)
+        if pool.refresh() is None:
+            return []
+        with pool.connection() as conn:
+            return search(conn, query, int(limit))
+
+    def _route_graph(self):
+        builds = manager.get_workers_by_type("build")
+        if not builds:
+            return None
+        pool = get_pool(builds[0].db_path)
+        return get_route_graph(pool) if pool.refresh() else None
+
+    def find_route(self, origin, destination, metric='distance', transfer_penalty=None):
+        '''两站 (station_g_cd / station_cd) 间最短路'''
+        graph = self._route_graph()
+        return graph.shortest_path(int(origin), int(destination), metric, transfer_penalty) if graph else None
+
+    def route_matrix(self, origins, destinations, metric='distance', transfer_penalty=None):
+        graph = self._route_graph()
+        return graph.many_to_many([int(o) for o in origins], [int(d) for d in destinations], metric, transfer_penalty) if graph else None
+
+    def start_build(self):
+        return any(manager.start_worker(w.name) for w in manager.get_workers_by_type("build"))
+
+    def cancel_build(self):
+        return any(manager.cancel_worker(w.name) for w in manager.get_workers_by_type("build"))
+
     def update_worker_period(self, name, period):
-        worker = manager.get_worker(name)
-        if worker:
-            try:
-                p = int(period)
-                if p > 0:
-                    worker.period = p
-                    return True
-            except:
-                pass
+        try:
+            p = int(period)
+            if p > 0:
+                return manager.set_worker_period(name, p)
+        except:
+            pass
         return False
\ No newline at end of file
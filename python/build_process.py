@@ -0,0 +1,188 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+import log_setup
+from worker_base import ProgressTracker
+from metrics import BUILD_STAGE_DURATION, SQLITE_WRITE_DURATION, CACHE_REQUESTS
+
+logger = logging.getLogger()
+
+def _build_entry(db_path, data_dir, event_queue):
+    '''子进程入口: 运行构建, 将日志与阶段事件经队列发回主进程'''
+    log_setup.forward_to(event_queue)
+
+    from railway_processer import RailwayDataService
+
+    service = RailwayDataService(db_path=db_path, data_dir=data_dir)
+    service.on_event = lambda kind, **data: event_queue.put(('event', kind, data))
+    try:
+        service.build()
+    except Exception as e:
+        logging.getLogger().exception("Build failed")
+        event_queue.put(('event', 'error', {'message': str(e)}))
+
+class BuildRunner:
+    '''
+    在独立进程中运行 RailwayDataService.build, 不占用调度线程与 GIL.
+    子进程写入临时库后原子替换 db_path; 主进程只接收进度事件.
+    '''
+    # 0: Idle, 1: Running, 200: Success, 500: Error, 499: Cancelled
+    def __init__(self, db_path="railway.db", data_dir="./public", on_finished=None):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.on_finished = on_finished # on_finished(runner), 构建结束后在监视线程中调用
+
+        self.tracker = ProgressTracker()
+        self.statcode = 0
+        self.stage = ''
+        self.version = 0 # 每次成功构建 +1
+        self.last_result = None
+        self.last_report = None # 最近一次成功构建的耗时报告 (tracing.Tracer.report)
+        self.started_at = 0.0
+        self.finished_at = 0.0
+
+        self._ctx = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._process = None
+        self._cancelled = False
+        self._stage_started = 0.0
+        self._finished = threading.Event()
+        self._finished.set()
+
+    def is_running(self):
+        with self._lock:
+            return self._process is not None
+
+    def start(self):
+        '''启动构建; 已在运行时返回 False'''
+        with self._lock:
+            if self._process is not None:
+                return False
+            event_queue = self._ctx.Queue()
+            self._process = self._ctx.Process(
+                target=_build_entry,
+                args=(self.db_path, self.data_dir, event_queue),
+                name="RailwayBuild",
+                daemon=True
+            )
+            self._cancelled = False
+            self._finished.clear()
+            self.statcode = 1
+            self.stage = 'starting'
+            self.started_at = time.time()
+            self.tracker.start(0, f"build-{self.version + 1}")
+            self._process.start()
+
+        threading.Thread(target=self._monitor, args=(self._process, event_queue), daemon=True).start()
+        return True
+
+    def cancel(self, timeout=5):
+        '''终止构建进程, 超时未退出则强制结束. 原有数据库不受影响'''
+        with self._lock:
+            process = self._process
+            if process is None:
+                return False
+            self._cancelled = True
+        process.terminate()
+        process.join(timeout)
+        if process.is_alive():
+            process.kill()
+        return True
+
+    def _handle(self, item, result):
+        if isinstance(item, logging.LogRecord):
+            # 子进程日志归入 Build.* , 可单独设置级别并写入 build.log
+            item.name = "Build" if item.name == "root" else f"Build.{item.name}"
+            record_logger = logging.getLogger(item.name)
+            if record_logger.isEnabledFor(item.levelno):
+                record_logger.handle(item)
+            return
+
+        _, kind, data = item
+        if kind in ('stage', 'done', 'error'):
+            self._close_stage()
+        if kind == 'stage':
+            self.stage = data['name']
+            self._stage_started = time.time()
+            self.tracker.phase(data['name'])
+            if 'total' in data:
+                self.tracker.set_total(data['total'])
+        elif kind == 'progress':
+            self.tracker.update(data['current'])
+        elif kind == 'timing' and data.get('name') == 'sqlite_write':
+            SQLITE_WRITE_DURATION.observe(data['seconds'], db='railway')
+        elif kind == 'done':
+            result['done'] = data
+            for key, result_name in (('reused', 'hit'), ('matched', 'miss')):
+                CACHE_REQUESTS.inc(data.get('match_stats', {}).get(key, 0), cache='ekidata_match', result=result_name)
+            for key, result_name in (('hits', 'hit'), ('misses', 'miss')):
+                CACHE_REQUESTS.inc(data.get('reading_stats', {}).get(key, 0), cache='kana_reading', result=result_name)
+        elif kind == 'error':
+            result['error'] = data.get('message')
+
+    def _close_stage(self):
+        '''记录上一阶段耗时'''
+        if self.stage and self.stage != 'starting' and self._stage_started:
+            BUILD_STAGE_DURATION.observe(time.time() - self._stage_started, stage=self.stage)
+        self._stage_started = 0.0
+
+    def _monitor(self, process, event_queue):
+        result = {}
+        while True:
+            try:
+                self._handle(event_queue.get(timeout=0.5), result)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+
+        # 进程退出后取尽剩余事件
+        while True:
+            try:
+                self._handle(event_queue.get_nowait(), result)
+            except queue.Empty:
+                break
+
+        process.join()
+        with self._lock:
+            self._process = None
+            self.finished_at = time.time()
+            if self._cancelled:
+                self.statcode = 499
+                self.last_result = "Cancelled"
+            elif 'done' in result and process.exitcode == 0:
+                self.statcode = 200
+                self.version += 1
+                self.last_report = result['done'].pop('report', None)
+                self.last_result = result['done']
+            else:
+                self.statcode = 500
+                self.last_result = result.get('error') or f"Build process exited with code {process.exitcode}"
+            self.stage = ''
+
+        logger.info(f"[Build] 结束: {self.last_result} ({round(self.finished_at - self.started_at, 2)}s)")
+        self._finished.set()
+        if self.on_finished:
+            self.on_finished(self)
+
+    def wait(self, timeout=None):
+        '''等待当前构建结束'''
+        return self._finished.wait(timeout)
+
+    def get_view(self):
+        '''前端展示的构建状态'''
+        report = self.last_report
+        return {
+            "status_code": self.statcode,
+            "stage": self.stage,
+            "timing": {
+                "stages": report['stages'],
+                "slow_items": report['slow_items'][:5]
+            } if report else None,
+            "version": self.version,
+            "progress": self.tracker.get_view_model(),
+            "last_result": self.last_result,
+            "duration": round((time.time() if self.statcode == 1 else self.finished_at) - self.started_at, 2) if self.started_at else 0
+        }
@@ -0,0 +1,25 @@
+import pytest
+
+from worker_manager import WorkerRegistry, WorkerProcess
+
+class CountingWorker(WorkerProcess):
+    '''记录运行次数的空 Worker'''
+    def __init__(self, name, period):
+        super().__init__(name, period, "counting")
+        self.runs = 0
+
+    def trigger(self):
+        self.runs += 1
+        return "ok"
+
+@pytest.fixture
+def registry(monkeypatch):
+    '''
+    独立的 WorkerRegistry: 测试内注册的类型在结束后撤销, 不影响其他测试.
+    已注册 "counting" (CountingWorker), 返回 WorkerRegistry.
+    '''
+    monkeypatch.setattr(WorkerRegistry, "_name_to_cls", {})
+    monkeypatch.setattr(WorkerRegistry, "_cls_to_name", {})
+    monkeypatch.setattr(WorkerRegistry, "_dependencies", {})
+    WorkerRegistry.register("counting", CountingWorker)
+    return WorkerRegistry
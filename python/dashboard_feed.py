@@ -0,0 +1,122 @@
+import threading
+
+from event_scheduler import SystemClock
+
+# 每次视图都会变化、单独变化时不值得推送的字段
+VOLATILE_KEYS = ('last_update_ts',)
+
+def diff_view(old, new):
+    '''浅层差分: 仅返回值有变化的顶层字段 (嵌套字段整体替换)'''
+    if old is None:
+        return dict(new)
+    changes = {k: v for k, v in new.items() if old.get(k) != v and k not in VOLATILE_KEYS}
+    if changes:
+        for k in VOLATILE_KEYS:
+            if k in new:
+                changes[k] = new[k]
+    return changes
+
+class DashboardFeed:
+    '''
+    仪表盘变更推送.
+    Worker 状态/进度变化只标记 dirty (O(1)); 推送线程按 min_interval 合并,
+    仅为 dirty 的 Worker 生成视图, 与上次推送的视图比较后把差分发给订阅者.
+    无变化时推送线程一直睡眠, 不产生任何开销.
+
+    推送内容: {"version": n, "changes": {worker_id: {字段: 值}}, "removed": [worker_id]}
+    version 连续递增, 订阅方发现跳号时应重新调用 snapshot().
+    clock 用于推送间隔, 测试时可替换为 VirtualClock.
+    '''
+    def __init__(self, manager, min_interval=0.25, clock=None):
+        self.manager = manager
+        self.min_interval = min_interval
+        self.clock = clock or SystemClock()
+        self.version = 0
+
+        self._cond = threading.Condition()
+        self._dirty = set()
+        self._views = {} # worker_id -> 上次推送的视图
+        self._subscribers = []
+        self._thread = None
+        self._last_push = 0.0
+        manager.add_change_listener(self.mark_dirty)
+        self.clock.subscribe(self._wake)
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def mark_dirty(self, name):
+        with self._cond:
+            self._dirty.add(name)
+            self._cond.notify()
+
+    def subscribe(self, callback):
+        '''callback(payload) 在推送线程中调用, 应尽快返回'''
+        with self._cond:
+            self._subscribers.append(callback)
+        self.start()
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def start(self):
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="DashboardFeed", daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        '''完整视图, 订阅方初始化或跳号后重新同步'''
+        with self._cond:
+            version = self.version
+        return {
+            "version": version,
+            "workers": [w.get_dashboard_view() for w in self.manager.get_all_workers()]
+        }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty:
+                    self._cond.wait()
+                # 限制推送频率: 等待期间的变化合并到同一批.
+                # mark_dirty 的 notify 也会唤醒 wait, 须等到截止时间为止
+                deadline = self._last_push + self.min_interval
+                while self.clock.time() < deadline:
+                    self.clock.wait(self._cond, deadline - self.clock.time())
+                dirty, self._dirty = self._dirty, set()
+
+            self._push(dirty)
+
+    def _push(self, dirty):
+        changes = {}
+        removed = []
+        for name in dirty:
+            worker = self.manager.get_worker(name)
+            if worker is None:
+                if self._views.pop(name, None) is not None:
+                    removed.append(name)
+                continue
+            view = worker.get_dashboard_view()
+            diff = diff_view(self._views.get(name), view)
+            if diff:
+                changes[view["id"]] = diff
+                self._views[name] = view
+
+        self._last_push = self.clock.time()
+        if not changes and not removed:
+            return
+
+        with self._cond:
+            self.version += 1
+            payload = {"version": self.version, "changes": changes, "removed": removed}
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(payload)
+            except Exception:
+                pass
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import http.cookies
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+class AuthProvider(ABC):
+    '''认证方式抽象: 完成登录并返回 (cookie 字典, 过期时间戳或 None)'''
+    name = ''
+
+    @abstractmethod
+    def login(self, worker):
+        pass
+
+class WebviewAuthProvider(AuthProvider):
+    '''启动(隐形)浏览器注入登录脚本, 需要主线程已运行 webview.start()'''
+    name = 'webview'
+
+    def login(self, worker):
+        import webview # 仅此方式依赖 GUI
+
+        worker.logger.info("启动 Webview 进行认证...")
+        cookies = []
+
+        # 创建窗口 (注意：不要调用 webview.start()，因为主线程应该已经在运行它)
+        window = webview.create_window(
+            'Auth Worker',
+            worker.LOGIN_URL,
+            hidden=True,
+            width=800, height=600
+        )
+
+        # 定义认证逻辑 (注入 JS)
+        def auth_logic():
+            time.sleep(2) # 等待DOM加载
+
+            worker.logger.info("注入登录脚本...")
+            js = f"""
+                document.querySelector("{worker.SELECTOR_USER}").value = "{worker.USERNAME}";
+                document.querySelector("{worker.SELECTOR_PASS}").value = "{worker.PASSWORD}";
+                document.querySelector("{worker.SELECTOR_BTN}").click();
+            """
+            window.evaluate_js(js)
+
+            # 等待跳转和Cookie写入
+            time.sleep(3)
+
+            raw_cookies = window.get_cookies()
+            for c in raw_cookies:
+                cookies.append(c)
+
+            worker.logger.info(f"获取到 {len(cookies)} 个 Cookie，关闭窗口...")
+            window.destroy()
+
+        # 在当前线程执行认证逻辑，等待窗口操作完成
+        # 等待一下窗口创建
+        time.sleep(0.3)
+
+        try:
+            auth_logic()
+        except Exception as e:
+            worker.logger.error(f"Auth logic error: {e}")
+            if window:
+                window.destroy()
+
+        # 转换 pywebview cookie 对象为 dict
+        cookie_dict = {}
+        expires = None
+        for c in cookies:
+            try:
+                # 处理 SimpleCookie 类型
+                if isinstance(c, http.cookies.BaseCookie):
+                    # SimpleCookie 像字典一样存储 Morsel 对象
+                    for key, morsel in c.items():
+                        cookie_dict[key] = morsel.value
+                        ts = _morsel_expiry(morsel)
+                        if ts and (expires is None or ts < expires):
+                            expires = ts
+                else:
+                    raise ValueError(f"未知 Cookie 类型: {type(c)}")
+
+            except Exception as e:
+                worker.logger.warning(f"无法解析单个Cookie: {c} - {e}")
+
+        return cookie_dict, expires
+
+class FormAuthProvider(AuthProvider):
+    '''纯 HTTP 表单登录, 可在无界面的服务器上运行'''
+    name = 'form'
+
+    def login(self, worker):
+        worker.logger.info("通过表单进行认证...")
+        resp = worker.session.get(worker.LOGIN_URL, timeout=30)
+        resp.raise_for_status()
+
+        soup = BeautifulSoup(resp.text, 'html.parser')
+        pass_input = soup.select_one(worker.SELECTOR_PASS)
+        form = pass_input.find_parent('form') if pass_input else None
+        if not form:
+            raise Exception("登录页中未找到登录表单")
+
+        # 保留隐藏字段, 再填入账号密码
+        payload = {}
+        for inp in form.select('input[name]'):
+            if inp.get('type') in ('submit', 'button', 'image'):
+                continue
+            payload[inp['name']] = inp.get('value', '')
+        payload[worker.FIELD_USER] = worker.USERNAME
+        payload[worker.FIELD_PASS] = worker.PASSWORD
+
+        action = urljoin(resp.url, str(form.get('action') or resp.url))
+        resp = worker.session.post(action, data=payload, timeout=30)
+        resp.raise_for_status()
+
+        cookie_dict = {}
+        expires = None
+        for c in worker.session.cookies:
+            cookie_dict[c.name] = c.value
+            if c.expires and (expires is None or c.expires < expires):
+                expires = c.expires
+
+        worker.logger.info(f"获取到 {len(cookie_dict)} 个 Cookie")
+        return cookie_dict, expires
+
+AUTH_PROVIDERS = {
+    WebviewAuthProvider.name: WebviewAuthProvider,
+    FormAuthProvider.name: FormAuthProvider,
+}
+
+def get_auth_provider(provider):
+    '''按名称或实例获取认证方式'''
+    if isinstance(provider, AuthProvider):
+        return provider
+    provider_cls = AUTH_PROVIDERS.get(provider or WebviewAuthProvider.name)
+    if not provider_cls:
+        raise ValueError(f"未知认证方式: '{provider}'")
+    return provider_cls()
+
+class SessionCache:
+    '''磁盘上的认证 Cookie 缓存: {"cookies": {...}, "expires": ts, "saved": ts}'''
+    def __init__(self, path, default_ttl=12 * 3600):
+        self.path = path
+        self.default_ttl = default_ttl
+
+    def load(self):
+        '''返回未过期的 Cookie 字典, 无缓存或已过期时返回 None'''
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if not data.get('cookies') or data.get('expires', 0) <= time.time():
+            return None
+        return data['cookies']
+
+    def save(self, cookies, expires=None):
+        '''原子写入; 服务端未给出过期时间时使用 default_ttl'''
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        now = time.time()
+        data = {
+            'cookies': cookies,
+            'expires': expires if expires else now + self.default_ttl,
+            'saved': now
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _morsel_expiry(morsel):
+    '''解析 Morsel 的 max-age / expires 为时间戳'''
+    try:
+        if morsel['max-age']:
+            return time.time() + int(morsel['max-age'])
+        if morsel['expires']:
+            return parsedate_to_datetime(morsel['expires']).timestamp()
+    except Exception:
+        pass
+    return None
@@ -1,13 +1,17 @@
 import requests
-import webview
 import os
-import http.cookies
+import json
+import hashlib
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse, parse_qs
 from email.message import EmailMessage
 from urllib.parse import urljoin
 from worker_base import WorkerProcess
+from ekidata_auth import SessionCache, get_auth_provider
+from metrics import instrument_session, CACHE_REQUESTS
 
 class EkidataWorker(WorkerProcess):
     # --- 配置区域 ---
@@ -20,36 +24,38 @@ class EkidataWorker(WorkerProcess):
     SELECTOR_USER = "input[name='ac']"
     SELECTOR_PASS = "input[name='ps']"
     SELECTOR_BTN = "input[type='submit']"
+    FIELD_USER = "ac"
+    FIELD_PASS = "ps"
     
     DOWNLOAD_DIR = "./downloads"
+    MANIFEST_NAME = "manifest.json" # {t: {date, filename, size, sha256}}
+    SESSION_CACHE_NAME = ".session.json" # 认证 Cookie 缓存
+    SESSION_TTL = 12 * 3600 # 服务端未给出过期时间时的缓存时长(秒)
+    MAX_PARALLEL = 2 # 并发下载数, 保持较小以免被封禁
+    DOWNLOAD_DELAY = 2 # 每个下载线程的礼貌延时(秒)
+    CHUNK_SIZE = 65536
     DEBUG_MODE = True  # 设置为 False 可在屏幕上显示浏览器窗口进行调试
 
-    def __init__(self, name, period, max_retry=3):
+    def __init__(self, name, period, max_retry=3, auth_provider=None):
         super().__init__(name, period, "ekidata_crawler", max_retry)
         self.session = requests.Session()
         # 伪装 User-Agent 防止被服务端拒绝
         self.session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         })
+        instrument_session(self.session, 'ekidata')
+        self.manifest_path = os.path.join(self.DOWNLOAD_DIR, self.MANIFEST_NAME)
+        self._manifest_lock = threading.Lock()
+        # 认证方式: 'webview' (默认) / 'form' (无界面) / AuthProvider 实例
+        self.auth_provider = get_auth_provider(auth_provider)
+        self.session_cache = SessionCache(os.path.join(self.DOWNLOAD_DIR, self.SESSION_CACHE_NAME), self.SESSION_TTL)
 
     def trigger(self):
         if not os.path.exists(self.DOWNLOAD_DIR):
             os.makedirs(self.DOWNLOAD_DIR)
 
-        # 1. 获取并应用 Cookie
-        cookies = self._get_cookies_via_webview()
-        if not cookies:
-            self.logger.error("未获取到 Cookie，终止任务")
-            raise Exception("Failed to get cookies")
-
-        self.session.cookies.update(cookies)
-
-        # 2. 获取列表页
-        self.logger.info(f"访问数据页: {self.TARGET_URL}")
-        resp = self.session.get(self.TARGET_URL)
-        if resp.status_code != 200:
-            self.logger.error(f"访问失败 Code: {resp.status_code}")
-            raise Exception(f"Failed to access target URL: {resp.status_code}")
+        # 1-2. 认证并获取列表页 (优先使用缓存的会话)
+        resp = self._open_target()
 
         # 3. 解析与下载
         soup = BeautifulSoup(resp.text, 'html.parser')
@@ -88,95 +94,135 @@ class EkidataWorker(WorkerProcess):
 
         # 对分类 t 进行排序，保证下载顺序
         sorted_t_keys = sorted(latest_map.keys(), key=lambda x: int(x) if x.isdigit() else x)
-        self.logger.info(f"筛选完成，即将下载 {len(sorted_t_keys)} 个最新文件")
-
-        self.tracker.start(len(sorted_t_keys), self.run_id)
-
-        # 4. 执行下载
-        for t_val in sorted_t_keys:
-            item = latest_map[t_val]
-            self._download_smart(item['url'], self.DOWNLOAD_DIR, item['date'])
-            self.tracker.increment()
-            time.sleep(2)  # 礼貌延时防止封禁
-
-        return f"Completed. Downloaded/Checked {len(sorted_t_keys)} latest files."
-
-    def _get_cookies_via_webview(self):
-        """启动(隐形)浏览器完成认证并提取Cookie"""
-        self.logger.info("启动 Webview 进行认证...")
-        cookies = []
-        
-        # 创建窗口 (注意：不要调用 webview.start()，因为主线程应该已经在运行它)
-        window = webview.create_window(
-            'Auth Worker',
-            self.LOGIN_URL,
-            hidden=True,
-            width=800, height=600
-        )
-        
-
-        # 定义认证逻辑 (注入 JS)
-        def auth_logic():
-            time.sleep(2) # 等待DOM加载
-            
-            self.logger.info("注入登录脚本...")
-            js = f"""
-                document.querySelector("{self.SELECTOR_USER}").value = "{self.USERNAME}";
-                document.querySelector("{self.SELECTOR_PASS}").value = "{self.PASSWORD}";
-                document.querySelector("{self.SELECTOR_BTN}").click();
-            """
-            window.evaluate_js(js)
-            
-            # 等待跳转和Cookie写入
-            time.sleep(3) 
-            
-            raw_cookies = window.get_cookies()
-            for c in raw_cookies:
-                cookies.append(c)
-            
-            self.logger.info(f"获取到 {len(cookies)} 个 Cookie，关闭窗口...")
-            window.destroy()
-
-        # 在当前线程执行认证逻辑，等待窗口操作完成
-        # 等待一下窗口创建
-        time.sleep(0.3)
 
+        # 与本地 manifest 比对, 仅下载更新的条目
+        manifest = self._load_manifest()
+        pending = [t for t in sorted_t_keys if self._needs_download(manifest.get(t), latest_map[t]['date'])]
+        CACHE_REQUESTS.inc(len(sorted_t_keys) - len(pending), cache='ekidata_manifest', result='hit')
+        CACHE_REQUESTS.inc(len(pending), cache='ekidata_manifest', result='miss')
+        self.logger.info(f"筛选完成，共 {len(sorted_t_keys)} 个最新文件, 其中 {len(pending)} 个需要下载")
+
+        self.tracker.start(len(pending), self.run_id)
+
+        # 4. 执行下载 (有界并发)
+        downloaded = 0
+        with ThreadPoolExecutor(max_workers=self.MAX_PARALLEL) as pool:
+            futures = {
+                pool.submit(self._download_task, t_val, latest_map[t_val]): t_val
+                for t_val in pending
+            }
+            for future in as_completed(futures):
+                t_val = futures[future]
+                entry = future.result()
+                if entry:
+                    downloaded += 1
+                    with self._manifest_lock:
+                        manifest[t_val] = entry
+                        self._save_manifest(manifest)
+                else:
+                    self.tracker.recErr(f"t={t_val}")
+
+        return f"Completed. Downloaded {downloaded}/{len(pending)} files, {len(sorted_t_keys) - len(pending)} up to date."
+
+    def _needs_download(self, entry, date):
+        '''manifest 中无记录 / 日期更旧 / 文件已丢失时需要下载'''
+        if not entry:
+            return True
+        if int(entry.get('date', 0)) < date:
+            return True
+        return not os.path.exists(os.path.join(self.DOWNLOAD_DIR, entry.get('filename', '')))
+
+    def _load_manifest(self):
         try:
-            auth_logic()
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
         except Exception as e:
-            self.logger.error(f"Auth logic error: {e}")
-            if window:
-                window.destroy()
-        
-        # 转换 pywebview cookie 对象为 dict
-        cookie_dict = {}
-        for c in cookies:
-            try:
-                # 处理 SimpleCookie 类型
-                if isinstance(c, http.cookies.BaseCookie):
-                    # SimpleCookie 像字典一样存储 Morsel 对象
-                    for key, morsel in c.items():
-                        cookie_dict[key] = morsel.value
-                else:
-                    raise ValueError(f"未知 Cookie 类型: {type(c)}")
-                    
-            except Exception as e:
-                self.logger.warning(f"无法解析单个Cookie: {c} - {e}")
-        
-        return cookie_dict
+            self.logger.warning(f"manifest 读取失败, 将重新下载: {e}")
+            return {}
+
+    def _save_manifest(self, manifest):
+        '''原子写入 manifest'''
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _download_task(self, t_val, item):
+        '''线程池任务: 下载单个文件并礼貌延时'''
+        started = time.perf_counter()
+        try:
+            self.check_cancelled()
+            return self._download_smart(item['url'], self.DOWNLOAD_DIR, item['date'], t_val)
+        finally:
+            self.tracker.increment(t_val, latency=time.perf_counter() - started)
+            time.sleep(self.DOWNLOAD_DELAY)  # 礼貌延时防止封禁
+
+    def _open_target(self):
+        '''访问数据页; 缓存会话被拒绝时才重新登录'''
+        cookies = self.session_cache.load()
+        if cookies:
+            self.session.cookies.update(cookies)
+            self.logger.info(f"使用缓存会话访问数据页: {self.TARGET_URL}")
+            resp = self.session.get(self.TARGET_URL, timeout=30)
+            if self._is_authenticated(resp):
+                CACHE_REQUESTS.inc(cache='ekidata_session', result='hit')
+                return resp
+            CACHE_REQUESTS.inc(cache='ekidata_session', result='rejected')
+            self.logger.info("缓存会话已失效, 重新认证")
+            self.session_cache.clear()
+            self.session.cookies.clear()
+        else:
+            CACHE_REQUESTS.inc(cache='ekidata_session', result='miss')
+
+        cookies, expires = self.auth_provider.login(self)
+        if not cookies:
+            self.logger.error("未获取到 Cookie，终止任务")
+            raise Exception("Failed to get cookies")
+
+        self.session.cookies.update(cookies)
+
+        self.logger.info(f"访问数据页: {self.TARGET_URL}")
+        resp = self.session.get(self.TARGET_URL, timeout=30)
+        if resp.status_code != 200:
+            self.logger.error(f"访问失败 Code: {resp.status_code}")
+            raise Exception(f"Failed to access target URL: {resp.status_code}")
+        if not self._is_authenticated(resp):
+            raise Exception("Authentication rejected by target URL")
+
+        self.session_cache.save(cookies, expires)
+        return resp
 
-    def _download_smart(self, url, save_dir, date_hint):
-        """优先使用响应头中的文件名"""
+    def _is_authenticated(self, resp):
+        '''数据页返回 200 且不再显示登录表单'''
+        if resp.status_code != 200:
+            return False
+        soup = BeautifulSoup(resp.text, 'html.parser')
+        return soup.select_one(self.SELECTOR_PASS) is None
+
+    def _download_smart(self, url, save_dir, date_hint, t_val=''):
+        """
+        优先使用响应头中的文件名.
+        写入 .part 临时文件, 存在残留时以 HTTP Range 续传, 完成后原子重命名.
+        成功返回 manifest 条目, 失败返回 None.
+        """
+        part_path = os.path.join(save_dir, f".{t_val or 'file'}_{date_hint}.part")
         try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f"bytes={offset}-"} if offset else {}
 
-            with self.session.get(url, stream=True, timeout=30) as r:
+            with self.session.get(url, stream=True, timeout=30, headers=headers) as r:
+                if r.status_code == 416:
+                    # 残留文件已失效, 丢弃后下次重新下载
+                    os.remove(part_path)
                 r.raise_for_status()
 
                 # 检查内容类型，防止下载到报错页面
                 if 'text/html' in r.headers.get('Content-Type', ''):
                     self.logger.warning(f"目标疑似非文件(HTML): {url}")
-                    return
-
+                    return None
 
                 filename = None
                 content_disposition = r.headers.get('Content-Disposition')
@@ -196,15 +242,36 @@ class EkidataWorker(WorkerProcess):
 
                 if os.path.exists(save_path):
                     self.logger.info(f"跳过已存在: {filename}")
-                    return
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    return self._manifest_entry(save_path, filename, date_hint)
+
+                # 服务器不支持 Range 时返回 200, 需从头写入
+                resumed = offset > 0 and r.status_code == 206
+                if resumed:
+                    self.logger.info(f"续传 {filename}: 从 {offset} 字节开始")
 
-                # 开始正式写入文件
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
+                with open(part_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
                         if chunk:
                             f.write(chunk)
 
-                self.logger.info(f"下载成功: {filename}")
+            os.replace(part_path, save_path)
+            self.logger.info(f"下载成功: {filename}")
+            return self._manifest_entry(save_path, filename, date_hint)
 
         except Exception as e:
             self.logger.error(f"下载出错 {url}: {e}")
+            return None
+
+    def _manifest_entry(self, path, filename, date):
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                sha.update(block)
+        return {
+            'date': date,
+            'filename': filename,
+            'size': os.path.getsize(path),
+            'sha256': sha.hexdigest()
+        }
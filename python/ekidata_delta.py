@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import pandas as pd
+
+logger = logging.getLogger()
+
+# 各类 CSV 的主键
+PRIMARY_KEYS = {
+    'company': 'company_cd',
+    'line': 'line_cd',
+    'station': 'station_cd',
+}
+
+DELTA_NAME = "delta.json"
+_CSV_PATTERN = re.compile(r'^(company|line|station|join)(\d{8})(free)?\.csv$')
+
+def latest_csv(directory, kind, default=None):
+    '''返回目录下日期最新的某类 CSV (如 station20251211free.csv), 不存在时返回 default'''
+    best_date, best_path = '', default
+    if not os.path.isdir(directory):
+        return best_path
+    for filename in os.listdir(directory):
+        m = _CSV_PATTERN.match(filename)
+        if m and m.group(1) == kind and m.group(2) > best_date:
+            best_date, best_path = m.group(2), os.path.join(directory, filename)
+    return best_path
+
+def _csv_date(path):
+    m = _CSV_PATTERN.match(os.path.basename(path)) if path else None
+    return m.group(2) if m else ''
+
+def _read_keyed(path, key):
+    '''全部按字符串读取, 避免 NaN/浮点导致的误判'''
+    df = pd.read_csv(path, encoding='utf-8', dtype=str, keep_default_na=False)
+    return df.drop_duplicates(subset=key, keep='last').set_index(key, drop=False)
+
+def diff_csv(old_path, new_path, key):
+    '''按主键比较两个版本, 返回 {added, removed, changed} 行集合'''
+    new_df = _read_keyed(new_path, key)
+    if old_path and os.path.exists(old_path):
+        old_df = _read_keyed(old_path, key)
+    else:
+        old_df = new_df.iloc[0:0]
+
+    old_keys = set(old_df.index)
+    new_keys = set(new_df.index)
+
+    # 列集合变化时按并集对齐
+    columns = list(dict.fromkeys(list(new_df.columns) + list(old_df.columns)))
+    common = sorted(old_keys & new_keys)
+    old_common = old_df.reindex(index=common, columns=columns, fill_value='')
+    new_common = new_df.reindex(index=common, columns=columns, fill_value='')
+    changed_mask = old_common.ne(new_common).any(axis=1)
+    changed_keys = [k for k, flag in zip(common, changed_mask) if flag]
+
+    return {
+        'key': key,
+        'old': os.path.basename(old_path) if old_path else None,
+        'new': os.path.basename(new_path),
+        'added': new_df.loc[sorted(new_keys - old_keys)].to_dict('records'),
+        'removed': old_df.loc[sorted(old_keys - new_keys)].to_dict('records'),
+        'changed': [
+            {'before': old_common.loc[k].to_dict(), 'after': new_common.loc[k].to_dict()}
+            for k in changed_keys
+        ]
+    }
+
+def ingest(download_dir, ekidata_dir):
+    '''
+    将下载目录中较新的 CSV 与 ekidata_dir 当前使用的版本比较,
+    复制新版本并写出 delta.json. 返回 EkidataDelta.
+    '''
+    kinds = {}
+    for kind, key in PRIMARY_KEYS.items():
+        new_path = latest_csv(download_dir, kind)
+        if not new_path:
+            continue
+        old_path = latest_csv(ekidata_dir, kind)
+        if old_path and _csv_date(old_path) >= _csv_date(new_path):
+            # 当前版本不旧于下载版本
+            continue
+
+        kinds[kind] = diff_csv(old_path, new_path, key)
+        shutil.copy2(new_path, os.path.join(ekidata_dir, os.path.basename(new_path)))
+        d = kinds[kind]
+        logger.info(f"Ekidata {kind} delta: +{len(d['added'])} -{len(d['removed'])} ~{len(d['changed'])} ({d['old']} -> {d['new']})")
+
+    delta_path = os.path.join(ekidata_dir, DELTA_NAME)
+    delta = EkidataDelta(kinds, created=time.time())
+
+    # 上一个差分尚未被构建使用时合并, 避免丢失受影响的键
+    pending = EkidataDelta.load(delta_path)
+    if pending and not pending.applied:
+        delta = pending.merge(delta)
+
+    delta.save(delta_path)
+    return delta
+
+def _to_int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return v
+
+class EkidataDelta:
+    '''一次 ekidata 更新的差分, 供 RailwayDataService 增量匹配'''
+    def __init__(self, kinds=None, created=0, applied=False):
+        self.kinds = kinds or {}
+        self.created = created
+        self.applied = applied
+
+    @classmethod
+    def load(cls, path):
+        '''读取 delta.json, 不存在或损坏时返回 None'''
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return cls(data.get('kinds', {}), data.get('created', 0), data.get('applied', False))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created': self.created, 'applied': self.applied, 'kinds': self.kinds}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def merge(self, other):
+        '''合并两个差分 (行集合直接拼接, 受影响范围取并集)'''
+        kinds = {k: dict(v) for k, v in self.kinds.items()}
+        for kind, d in other.kinds.items():
+            if kind not in kinds:
+                kinds[kind] = d
+                continue
+            merged = kinds[kind]
+            merged['new'] = d['new']
+            for field in ('added', 'removed', 'changed'):
+                merged[field] = merged[field] + d[field]
+        return EkidataDelta(kinds, created=other.created)
+
+    def _rows(self, kind):
+        d = self.kinds.get(kind, {})
+        for row in d.get('added', []):
+            yield row
+        for row in d.get('removed', []):
+            yield row
+        for c in d.get('changed', []):
+            yield c['before']
+            yield c['after']
+
+    def affected_company_cds(self):
+        '''线路候选集合发生变化的公司: 公司本身变动, 或其线路增删改'''
+        cds = {_to_int(r.get('company_cd')) for r in self._rows('company')}
+        cds |= {_to_int(r.get('company_cd')) for r in self._rows('line')}
+        return cds
+
+    def affected_line_cds(self):
+        '''车站候选集合发生变化的线路: 线路本身变动, 或其车站增删改'''
+        cds = {_to_int(r.get('line_cd')) for r in self._rows('line')}
+        cds |= {_to_int(r.get('line_cd')) for r in self._rows('station')}
+        return cds
+
+    def is_empty(self):
+        return not any(
+            d.get('added') or d.get('removed') or d.get('changed')
+            for d in self.kinds.values()
+        )
+
+    def summary(self):
+        return {
+            kind: {'added': len(d['added']), 'removed': len(d['removed']), 'changed': len(d['changed'])}
+            for kind, d in self.kinds.items()
+        }
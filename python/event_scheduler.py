@@ -0,0 +1,109 @@
+import time
+import heapq
+import itertools
+import threading
+
+class SystemClock:
+    '''真实时钟'''
+    def time(self):
+        return time.time()
+
+    def wait(self, cond, timeout):
+        cond.wait(timeout)
+
+    def subscribe(self, callback):
+        pass
+
+class VirtualClock:
+    '''测试用虚拟时钟: 时间只随 advance() 前进, 前进时唤醒订阅者'''
+    def __init__(self, start=0.0):
+        self._now = start
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def time(self):
+        with self._lock:
+            return self._now
+
+    def wait(self, cond, timeout):
+        # 忽略真实超时, 仅由 notify / advance 唤醒
+        cond.wait()
+
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += seconds
+        for cb in self._listeners:
+            cb()
+
+class EventScheduler:
+    '''
+    基于截止时间小顶堆 + 条件变量的调度器.
+    schedule() 覆盖同一 key 的旧截止时间 (旧堆项惰性作废), wake() 立即唤醒等待方.
+    '''
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        self._cond = threading.Condition()
+        self._heap = [] # (deadline, seq, key)
+        self._entries = {} # key -> seq, 用于作废旧项
+        self._seq = itertools.count()
+        self._woken = False
+        self.clock.subscribe(self.wake)
+
+    def schedule(self, key, deadline):
+        '''设置 key 的下一次截止时间并唤醒'''
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = seq
+            heapq.heappush(self._heap, (deadline, seq, key))
+            self._woken = True
+            self._cond.notify_all()
+
+    def cancel(self, key):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def wake(self):
+        '''外部事件 (手动启动 / 运行结束 / 周期变化) 唤醒等待方'''
+        with self._cond:
+            self._woken = True
+            self._cond.notify_all()
+
+    def _prune(self):
+        while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        with self._cond:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self):
+        '''弹出所有已到期的 key'''
+        now = self.clock.time()
+        due = []
+        with self._cond:
+            self._prune()
+            while self._heap and self._heap[0][0] <= now:
+                _, seq, key = heapq.heappop(self._heap)
+                if self._entries.get(key) == seq:
+                    del self._entries[key]
+                    due.append(key)
+                self._prune()
+        return due
+
+    def wait(self):
+        '''睡眠直到最近的截止时间或被唤醒; 无任务时无限期睡眠'''
+        with self._cond:
+            while not self._woken:
+                self._prune()
+                now = self.clock.time()
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                timeout = self._heap[0][0] - now if self._heap else None
+                self.clock.wait(self._cond, timeout)
+                if timeout is not None and self.clock.time() >= now + timeout:
+                    break
+            self._woken = False
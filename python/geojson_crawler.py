@@ -7,6 +7,74 @@ import requests
 from rdflib import Graph, Namespace
 import time
 from worker_base import WorkerProcess
+from metrics import instrument_session
+
+def round_coordinates(coords, precision):
+    '''递归截断坐标精度 (Point / LineString / MultiLineString 通用)'''
+    if isinstance(coords, (list, tuple)):
+        if coords and not isinstance(coords[0], (list, tuple)):
+            return [round(v, precision) for v in coords]
+        return [round_coordinates(c, precision) for c in coords]
+    return coords
+
+class GeoJsonStreamWriter:
+    '''
+    流式写出 FeatureCollection: 逐个 Feature 写入临时文件, close() 时原子替换目标文件.
+    compact=True 时不缩进; precision 不为 None 时截断坐标小数位.
+    '''
+    def __init__(self, path, compact=False, precision=None):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.compact = compact
+        self.precision = precision
+        self.count = 0
+        self._f = open(self.tmp_path, 'w', encoding='utf-8')
+        if self.compact:
+            self._f.write('{"type":"FeatureCollection","features":[')
+        else:
+            self._f.write('{\n  "type": "FeatureCollection",\n  "features": [')
+
+    def write(self, feature):
+        '''写出单个 Feature, 写出后调用方即可释放引用'''
+        if self.precision is not None and feature.get('geometry'):
+            geometry = dict(feature['geometry'])
+            geometry['coordinates'] = round_coordinates(geometry.get('coordinates'), self.precision)
+            feature = dict(feature, geometry=geometry)
+
+        if self.compact:
+            text = json.dumps(feature, ensure_ascii=False, separators=(',', ':'))
+            self._f.write(text if self.count == 0 else ',' + text)
+        else:
+            text = json.dumps(feature, ensure_ascii=False, indent=2).replace('\n', '\n    ')
+            self._f.write(('\n    ' if self.count == 0 else ',\n    ') + text)
+        self.count += 1
+
+    def close(self):
+        '''补全文件尾并原子替换'''
+        if self.compact:
+            self._f.write(']}')
+        else:
+            self._f.write('\n  ]\n}' if self.count else ']\n}')
+        self._f.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        '''异常时丢弃临时文件, 不影响已有的目标文件'''
+        try:
+            self._f.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
 
 class GeoJsonWorker(WorkerProcess):
     # 静态常量配置
@@ -20,13 +88,16 @@ class GeoJsonWorker(WorkerProcess):
     ODPT = Namespace("http://vocab.odpt.org/ODPT/")
     SCHEMA = Namespace("http://schema.org/")
 
-    def __init__(self, name, period, config_file='public/company_data.json', output_dir='test_geojson_output/'):
+    def __init__(self, name, period, config_file='public/company_data.json', output_dir='test_geojson_output/', compact=False, precision=None):
         # 传递类型为 "geojson_process"
         super().__init__(name, period, "geojson_process")
         self.config_file = config_file
         self.output_dir = output_dir
+        self.compact = compact # 紧凑输出 (无缩进)
+        self.precision = precision # 坐标小数位, None 为不截断 (如 6 约为 0.1m)
         self.session = requests.Session()
         self.session.headers.update(self.HEADERS)
+        instrument_session(self.session, 'geojson')
 
     def trigger(self):
         '''执行爬虫与生成逻辑'''
@@ -43,20 +114,17 @@ class GeoJsonWorker(WorkerProcess):
             if not isinstance(companies, dict):
                 companies = {}
 
-        self.tracker.start(0, self.run_id)
+        pending = [c for c in companies if not os.path.exists(os.path.join(self.output_dir, f"{c}.geojson"))]
+        skipped_count = len(companies) - len(pending)
+
+        # 线路总数在遍历中才逐个公司得知, 按公司数估算总量
+        self.tracker.start(0, self.run_id, units=len(pending))
 
         processed_count = 0
-        skipped_count = 0
 
         # 2. 遍历处理
-        for company_name in list(companies.keys()):
-            if company_name != '東日本旅客鉄道':
-                pass
-            filename = os.path.join(self.output_dir, f"{company_name}.geojson")
-
-            if os.path.exists(filename):
-                skipped_count += 1
-                continue
+        for company_name in pending:
+            self.check_cancelled()
 
             # 执行生成逻辑
             self._generate_for_company(company_name)
@@ -73,48 +141,50 @@ class GeoJsonWorker(WorkerProcess):
     def _generate_for_company(self, company_name):
         self.logger.info(f"Generating for company: {company_name}")
         filename = os.path.join(self.output_dir, f"{company_name}.geojson")
-        all_features = []
-        feature_map = {}
+        seen_uris = set() # 只保留 URI, Feature 写出后即释放
 
         # 获取线路
         lines = self._get_company_lines(company_name)
         self.logger.info(f"Found {len(lines)} lines for {company_name}")
         self.tracker.add_to_total(len(lines))
 
-        for line_uri in lines:
-            line_name = urllib.parse.unquote(line_uri.split('/')[-1])
-            self.logger.debug(f"Processing line: {line_name}")
-
-            # 1. 处理线路轨迹
-            if line_uri not in feature_map:
-                line_feats, _ = self._get_line_data(line_uri)
-                if line_feats:
-                    all_features.extend(line_feats)
-                    feature_map[line_uri] = line_feats[0]
-
-            # 2. 处理车站
-            g_line = self._fetch_graph(line_uri)
-            if not g_line:
-                self.tracker.increment(line_name)
-                continue
-
-            station_uris = [str(o) for s, p, o in g_line.triples((None, self.WDT.P527, None))]
-            self.logger.debug(f"Found {len(station_uris)} stations for line {line_name}")
-
-            for st_uri in station_uris:
-                existing = feature_map.get(st_uri)
-                feat, updated = self._update_or_create_station(st_uri, line_name, existing)
-                if updated:
-                    if not existing:
-                        all_features.append(feat)
-                        feature_map[st_uri] = feat
-
-            self.tracker.increment(line_name)
-
-        # 保存文件
-        self.logger.info(f"Saving {len(all_features)} features to {filename}")
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump({ "type": "FeatureCollection", "features": all_features }, f, ensure_ascii=False, indent=2)
+        with GeoJsonStreamWriter(filename, compact=self.compact, precision=self.precision) as writer:
+            for line_uri in lines:
+                self.check_cancelled()
+                started = time.perf_counter()
+                line_name = urllib.parse.unquote(line_uri.split('/')[-1])
+                self.logger.debug(f"Processing line: {line_name}")
+
+                # 1. 处理线路轨迹
+                if line_uri not in seen_uris:
+                    line_feats, _ = self._get_line_data(line_uri)
+                    if line_feats:
+                        for feat in line_feats:
+                            writer.write(feat)
+                        seen_uris.add(line_uri)
+
+                # 2. 处理车站
+                g_line = self._fetch_graph(line_uri)
+                if not g_line:
+                    self.tracker.increment(line_name, latency=time.perf_counter() - started)
+                    continue
+
+                station_uris = [str(o) for s, p, o in g_line.triples((None, self.WDT.P527, None))]
+                self.logger.debug(f"Found {len(station_uris)} stations for line {line_name}")
+
+                for st_uri in station_uris:
+                    # 已写出的车站均已带换乘信息, 无需再次更新
+                    if st_uri in seen_uris:
+                        continue
+                    feat, updated = self._update_or_create_station(st_uri, line_name)
+                    if updated:
+                        writer.write(feat)
+                        seen_uris.add(st_uri)
+
+                self.tracker.increment(line_name, latency=time.perf_counter() - started)
+
+            # 保存文件
+            self.logger.info(f"Saving {writer.count} features to {filename}")
 
     def _fetch_graph(self, url):
         safe_url = self._get_encoded_uri(url)
@@ -0,0 +1,10 @@
+from shapely.geometry import LineString, MultiLineString
+
+def line_geometry(coords):
+    '''geojson 的 LineString / MultiLineString 坐标 -> shapely 几何; 无有效线段时为 None'''
+    if not coords:
+        return None
+    if isinstance(coords[0][0], (int, float)):
+        return LineString(coords) if len(coords) >= 2 else None
+    parts = [c for c in coords if len(c) >= 2]
+    return MultiLineString(parts) if parts else None
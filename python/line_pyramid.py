@@ -0,0 +1,138 @@
+import json
+import math
+import sqlite3
+
+import numpy as np
+import shapely
+
+from geometry import line_geometry
+
+# 分辨率级别: (级别, 适用的最小缩放级别). 级别 0 为原始几何,
+# 其余级别的容差取该缩放带最小级别下半个像素 (256px 瓦片), 屏幕上看不出差别
+LEVELS = (
+    (0, 13),
+    (1, 11),
+    (2, 9),
+    (3, 7),
+    (4, 0),
+)
+
+LINE_GEOMETRY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS line_geometry (
+        company_id TEXT,
+        line_name TEXT,
+        level INTEGER,
+        min_x REAL,
+        min_y REAL,
+        max_x REAL,
+        max_y REAL,
+        points INTEGER,
+        geometry TEXT,
+        FOREIGN KEY(company_id) REFERENCES companies(id)
+    )
+'''
+LINE_GEOMETRY_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_line_geometry_company ON line_geometry (company_id, level)",
+    "CREATE INDEX IF NOT EXISTS idx_line_geometry_bbox ON line_geometry (level, min_x, max_x)",
+)
+
+def tolerance_for(level):
+    '''级别对应的 Douglas-Peucker 容差 (度), 级别 0 不化简'''
+    if level == 0:
+        return 0.0
+    zoom = dict(LEVELS)[level]
+    # 经度方向 1 像素 = 360 / (256 * 2^z) 度, 取一半. 级别 4 按 z5 计算, 更小级别差别已不可见
+    return 180.0 / (256 * 2 ** max(zoom, 5))
+
+def level_for_zoom(zoom):
+    '''缩放级别 -> 分辨率级别; 未指定时返回原始几何'''
+    if zoom is None:
+        return 0
+    for level, min_zoom in LEVELS:
+        if zoom >= min_zoom:
+            return level
+    return LEVELS[-1][0]
+
+def _precision(tolerance):
+    '''坐标保留的小数位: 比容差多一位, 原始几何保持 6 位 (约 0.1m)'''
+    if tolerance <= 0:
+        return 6
+    return min(6, int(math.ceil(-math.log10(tolerance))) + 1)
+
+def _coordinates(geom, digits):
+    '''shapely 几何 -> GeoJSON 坐标 (按 digits 取整)'''
+    if geom.geom_type == 'LineString':
+        return 'LineString', np.round(shapely.get_coordinates(geom), digits).tolist()
+    return 'MultiLineString', [np.round(shapely.get_coordinates(g), digits).tolist() for g in geom.geoms]
+
+def build_pyramid(companies):
+    '''
+    为全部线路生成各级别化简几何, 返回待写入 line_geometry 的行.
+    化简前先把首尾相接的分段合并 (爬取的线路常由上千段组成, 每段至少保留 2 点),
+    再使用保持拓扑的 Douglas-Peucker (不产生自相交, 端点与交点保留).
+    '''
+    keys = []
+    geoms = []
+    for c in companies:
+        for l in c.lineList:
+            geom = line_geometry(l.rawGeometry)
+            if geom is not None:
+                keys.append((c.id, l.name))
+                geoms.append(geom)
+    if not geoms:
+        return []
+
+    geoms = np.array(geoms, dtype=object)
+    bounds = shapely.bounds(geoms)
+    merged = shapely.line_merge(geoms)
+    rows = []
+    for level, _ in LEVELS:
+        tolerance = tolerance_for(level)
+        simplified = shapely.simplify(merged, tolerance, preserve_topology=True) if tolerance else geoms
+        counts = shapely.get_num_coordinates(simplified)
+        digits = _precision(tolerance)
+        for (company_id, line_name), geom, bbox, n in zip(keys, simplified, bounds, counts):
+            geom_type, coords = _coordinates(geom, digits)
+            rows.append((company_id, line_name, level, *bbox.tolist(), int(n),
+                         json.dumps({"type": geom_type, "coordinates": coords}, separators=(',', ':'))))
+    return rows
+
+def write_pyramid(cursor, rows):
+    cursor.execute(LINE_GEOMETRY_SCHEMA)
+    for sql in LINE_GEOMETRY_INDEXES:
+        cursor.execute(sql)
+    cursor.executemany("INSERT INTO line_geometry VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+def query_lines(conn, level=0, company_id=None, bbox=None):
+    '''
+    读取某一级别的线路为 GeoJSON FeatureCollection.
+    company_id: 只取该公司; bbox: (min_x, min_y, max_x, max_y) 只取包围盒相交的线路.
+    旧库无 line_geometry 表时返回空集合.
+    '''
+    sql = ["SELECT g.company_id, g.line_name, g.geometry, l.line_cd, l.type, l.stroke, l.stroke_width",
+           "FROM line_geometry g LEFT JOIN lines l ON l.company_id = g.company_id AND l.name = g.line_name",
+           "WHERE g.level = ?"]
+    params = [level]
+    if company_id is not None:
+        sql.append("AND g.company_id = ?")
+        params.append(company_id)
+    if bbox is not None:
+        min_x, min_y, max_x, max_y = bbox
+        sql.append("AND g.min_x <= ? AND g.max_x >= ? AND g.min_y <= ? AND g.max_y >= ?")
+        params += [max_x, min_x, max_y, min_y]
+
+    try:
+        rows = conn.execute(" ".join(sql), params).fetchall()
+    except sqlite3.OperationalError:
+        rows = [] # 旧库无 line_geometry 表
+
+    features = []
+    for company, name, geometry, line_cd, line_type, stroke, stroke_width in rows:
+        features.append(
+            '{"type":"Feature","geometry":%s,"properties":%s}' % (geometry, json.dumps({
+                "company": company, "name": name, "line_cd": line_cd, "type": line_type,
+                "stroke": stroke, "stroke-width": stroke_width
+            }, ensure_ascii=False))
+        )
+    # 几何已是 JSON 文本, 直接拼接, 避免逐条解析再序列化
+    return '{"type":"FeatureCollection","level":%d,"features":[%s]}' % (level, ",".join(features))
@@ -0,0 +1,171 @@
+import os
+import copy
+import json
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# 环境变量:
+#   RAILROUND_LOG_LEVELS="Worker.geojson=DEBUG,Build=WARNING"  按 logger 覆盖级别
+#   RAILROUND_LOG_JSON=1                                       日志文件写 JSON lines
+LOG_DIR = 'logs'
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+TEXT_FORMAT = '[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_lock = threading.Lock()
+_listener = None
+_queue = None
+_levels = {} # logger 名称 -> 级别
+
+class JsonLinesFormatter(logging.Formatter):
+    '''每条记录一行 JSON'''
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        # 经队列传来的记录 exc_info 已清空, 异常文本保存在 exc_text (见 ExcQueueHandler)
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, ensure_ascii=False)
+
+class ExcQueueHandler(logging.handlers.QueueHandler):
+    '''
+    入队前把异常格式化到 exc_text.
+    标准 QueueHandler.prepare 把堆栈拼进 msg 并清空 exc_info / exc_text, 监听方的格式化器无法再区分异常;
+    这里 msg 只保留消息本身, 堆栈放在 exc_text (可 pickle, 也适用于子进程的 multiprocessing 队列).
+    '''
+    _formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+class RotatingFileRouter(logging.Handler):
+    '''
+    按 logger 名称分文件: Worker.<name> -> <name>.log, Build.* -> build.log, 其余 -> app.log.
+    文件按大小轮转, 仅在 QueueListener 线程中调用.
+    '''
+    def __init__(self, log_dir, max_bytes, backup_count):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._files = {}
+
+    @staticmethod
+    def target(name):
+        if name.startswith('Worker.'):
+            return name[len('Worker.'):]
+        if name == 'Build' or name.startswith('Build.'):
+            return 'build'
+        return 'app'
+
+    def emit(self, record):
+        target = self.target(record.name)
+        handler = self._files.get(target)
+        if handler is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(self.log_dir, f"{target}.log"),
+                maxBytes=self.max_bytes,
+                backupCount=self.backup_count,
+                encoding='utf-8',
+                delay=True
+            )
+            handler.setFormatter(self.formatter)
+            self._files[target] = handler
+        handler.emit(record)
+
+    def close(self):
+        for handler in self._files.values():
+            handler.close()
+        self._files.clear()
+        super().close()
+
+class _PipelineFilter(logging.Filter):
+    '''控制台只输出 Worker / 构建日志 (与原先每个 Worker 自带的控制台输出一致)'''
+    def filter(self, record):
+        return record.name.startswith('Worker.') or RotatingFileRouter.target(record.name) == 'build'
+
+def _parse_levels(spec):
+    levels = {}
+    for part in (spec or '').split(','):
+        if '=' in part:
+            name, level = part.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure(log_dir=None, max_bytes=MAX_BYTES, backup_count=BACKUP_COUNT, json_lines=None, levels=None, console=True):
+    '''
+    安装根 logger 上的 QueueHandler 与唯一的后台 QueueListener.
+    日志调用方只做入队, 文件 I/O 与格式化都在监听线程中完成. 重复调用无效果.
+    只由应用入口 (test.py) 调用一次; 构建子进程使用 forward_to.
+    '''
+    global _listener, _queue
+    with _lock:
+        if _listener is not None:
+            return
+        if json_lines is None:
+            json_lines = os.environ.get('RAILROUND_LOG_JSON') == '1'
+
+        formatter = JsonLinesFormatter() if json_lines else logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+        router = RotatingFileRouter(log_dir or LOG_DIR, max_bytes, backup_count)
+        router.setFormatter(formatter)
+        handlers = [router]
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+            console_handler.addFilter(_PipelineFilter())
+            handlers.append(console_handler)
+
+        _queue = queue.SimpleQueue()
+        logging.getLogger().addHandler(ExcQueueHandler(_queue))
+        _listener = logging.handlers.QueueListener(_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+
+    for name, level in {**_parse_levels(os.environ.get('RAILROUND_LOG_LEVELS')), **(levels or {})}.items():
+        set_level(name, level)
+
+def forward_to(event_queue, level=logging.INFO):
+    '''子进程入口调用: 根 logger 只把记录经 event_queue 发回主进程, 由主进程写入'''
+    root = logging.getLogger()
+    root.handlers = [ExcQueueHandler(event_queue)]
+    root.setLevel(level)
+
+def shutdown():
+    '''停止监听线程并写出剩余日志'''
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+def set_level(name, level):
+    '''运行时覆盖某个 logger 的级别 (如 "Worker.geojson" -> DEBUG)'''
+    level = logging.getLevelName(level) if isinstance(level, str) else level
+    _levels[name] = level
+    logging.getLogger(name).setLevel(level)
+
+def get_logger(name, default_level=logging.INFO):
+    '''取得 logger, 未被覆盖时使用 default_level. 不做任何 handler 配置 (见 configure)'''
+    logger = logging.getLogger(name)
+    logger.setLevel(_levels.get(name, default_level))
+    return logger
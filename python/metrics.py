@@ -0,0 +1,193 @@
+import time
+import bisect
+import threading
+from typing import Dict, Tuple
+
+# Prometheus 默认延迟分桶 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 1800.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, registry, name, help_text, labels):
+        self._registry = registry
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric '{self.name}' 需要标签 {self.label_names}, 实际为 {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.label_names)
+
+class Counter(_Metric):
+    '''单调递增计数'''
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render(self):
+        for key, v in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {v}"
+
+    def _snapshot(self):
+        return {','.join(k) or '_': v for k, v in self._values.items()}
+
+class Gauge(_Metric):
+    '''可升可降的瞬时值'''
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._registry._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    _render = Counter._render
+    _snapshot = Counter._snapshot
+
+class Histogram(_Metric):
+    '''延迟分布: 累计分桶 + sum + count'''
+    type_name = 'histogram'
+
+    def __init__(self, registry, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._registry._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def time(self, **labels):
+        '''上下文管理器: 记录代码块耗时'''
+        return _Timer(self, labels)
+
+    def _render(self):
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, state['counts']):
+                cumulative += n
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state['count']}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {round(state['sum'], 6)}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {state['count']}"
+
+    def _snapshot(self):
+        return {
+            ','.join(k) or '_': {
+                'count': s['count'],
+                'sum': round(s['sum'], 6),
+                'avg': round(s['sum'] / s['count'], 6) if s['count'] else 0
+            }
+            for k, s in self._values.items()
+        }
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+class MetricsRegistry:
+    '''进程内指标注册表, 同名指标重复注册时返回已有实例'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, cls, name, help_text, labels, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, help_text, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' 已注册为 {metric.type_name}.")
+            return metric
+
+    def counter(self, name, help_text='', labels=()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', labels=()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labels)
+
+    def histogram(self, name, help_text='', labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels, buckets=buckets)
+
+    def render(self):
+        '''Prometheus 文本格式 (text/plain; version=0.0.4)'''
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                metric = self._metrics[name]
+                lines.append(f"# HELP {name} {metric.help}")
+                lines.append(f"# TYPE {name} {metric.type_name}")
+                lines.extend(metric._render())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        '''供 Api 返回的字典形式'''
+        with self._lock:
+            return {
+                name: {'type': m.type_name, 'values': m._snapshot()}
+                for name, m in sorted(self._metrics.items())
+            }
+
+registry = MetricsRegistry()
+
+# --- 常用指标 ---
+WORKER_RUN_DURATION = registry.histogram(
+    'railround_worker_run_duration_seconds', 'Worker 单次运行耗时', ('worker', 'type', 'status'))
+WORKER_ITEMS = registry.counter(
+    'railround_worker_items_total', 'Worker 处理的条目数', ('worker',))
+WORKER_ITEMS_PER_SECOND = registry.gauge(
+    'railround_worker_items_per_second', 'Worker 上次运行的吞吐量', ('worker',))
+HTTP_REQUEST_DURATION = registry.histogram(
+    'railround_http_request_duration_seconds', '爬虫 HTTP 请求耗时', ('client', 'method'))
+HTTP_RESPONSES = registry.counter(
+    'railround_http_responses_total', '爬虫 HTTP 响应状态码', ('client', 'status'))
+CACHE_REQUESTS = registry.counter(
+    'railround_cache_requests_total', '缓存命中/未命中次数', ('cache', 'result'))
+BUILD_STAGE_DURATION = registry.histogram(
+    'railround_build_stage_duration_seconds', '构建各阶段耗时', ('stage',))
+SQLITE_WRITE_DURATION = registry.histogram(
+    'railround_sqlite_write_duration_seconds', 'SQLite 写入耗时', ('db',))
+
+def instrument_session(session, client):
+    '''为 requests.Session 添加响应钩子, 记录请求耗时与状态码'''
+    def _hook(resp, *args, **kwargs):
+        HTTP_REQUEST_DURATION.observe(resp.elapsed.total_seconds(), client=client, method=resp.request.method)
+        HTTP_RESPONSES.inc(client=client, status=resp.status_code)
+        return resp
+    session.hooks.setdefault('response', []).append(_hook)
+    return session
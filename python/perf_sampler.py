@@ -0,0 +1,127 @@
+import time
+import threading
+from collections import deque
+
+import psutil
+
+# 历史序列中参与降采样的数值字段
+FIELDS = ('cpu', 'ram', 'disk_r', 'disk_w', 'net_d', 'net_u', 'proc_cpu', 'proc_rss', 'children_cpu', 'children_rss')
+
+class PerformanceSampler:
+    '''
+    后台线程按固定间隔采集 系统 CPU/内存/磁盘/网络 与 本进程及子进程 (构建/爬虫) 的 CPU/RSS,
+    存入定长环形缓冲. 读取方直接取最新样本, 不阻塞, 速率也不再依赖前端的调用频率.
+    '''
+    def __init__(self, interval=1.0, capacity=3600):
+        self.interval = interval
+        self._samples = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._process = psutil.Process()
+        self._children = {} # pid -> psutil.Process, 保留对象以便 cpu_percent 计算增量
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="PerformanceSampler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # 首次调用只建立基准
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+        last_net = psutil.net_io_counters()
+        last_disk = psutil.disk_io_counters()
+        last_time = time.time()
+
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            net = psutil.net_io_counters()
+            disk = psutil.disk_io_counters()
+            dt = max(now - last_time, 1e-6)
+            sample = {
+                "ts": now,
+                "cpu": psutil.cpu_percent(interval=None),
+                "ram": psutil.virtual_memory().percent,
+                "disk_r": (disk.read_bytes - last_disk.read_bytes) / 1024 / 1024 / dt if disk and last_disk else 0.0, # MB/s
+                "disk_w": (disk.write_bytes - last_disk.write_bytes) / 1024 / 1024 / dt if disk and last_disk else 0.0,
+                "net_d": (net.bytes_recv - last_net.bytes_recv) / 1024 / dt, # KB/s
+                "net_u": (net.bytes_sent - last_net.bytes_sent) / 1024 / dt,
+            }
+            sample.update(self._sample_processes())
+            last_net, last_disk, last_time = net, disk, now
+
+            with self._lock:
+                self._samples.append(sample)
+
+    def _sample_processes(self):
+        '''本进程与全部子进程的 CPU (%) 与 RSS (MB)'''
+        with self._process.oneshot():
+            proc_cpu = self._process.cpu_percent(interval=None)
+            proc_rss = self._process.memory_info().rss / 1024 / 1024
+
+        children = []
+        alive = {}
+        try:
+            current = self._process.children(recursive=True)
+        except psutil.Error:
+            current = []
+        for child in current:
+            proc = self._children.get(child.pid, child)
+            try:
+                with proc.oneshot():
+                    children.append({
+                        "pid": proc.pid,
+                        "name": proc.name(),
+                        # 新出现的子进程第一次读数为 0
+                        "cpu": proc.cpu_percent(interval=None),
+                        "rss": round(proc.memory_info().rss / 1024 / 1024, 1)
+                    })
+                alive[proc.pid] = proc
+            except psutil.Error:
+                continue # 采样间隙中已退出
+        self._children = alive
+
+        return {
+            "proc_cpu": proc_cpu,
+            "proc_rss": proc_rss,
+            "children_cpu": sum(c["cpu"] for c in children),
+            "children_rss": sum(c["rss"] for c in children),
+            "children": children
+        }
+
+    def latest(self):
+        with self._lock:
+            return self._samples[-1] if self._samples else None
+
+    def history(self, points=60, seconds=None):
+        '''
+        降采样后的历史: 最近 seconds 秒 (缺省为全部) 均分为 points 段取平均.
+        返回 {字段: [值...], "ts": [...]}
+        '''
+        with self._lock:
+            samples = list(self._samples)
+        if seconds:
+            cutoff = time.time() - seconds
+            samples = [s for s in samples if s["ts"] >= cutoff]
+
+        result = {f: [] for f in FIELDS}
+        result["ts"] = []
+        if not samples:
+            return result
+
+        size = max(1, -(-len(samples) // points)) # 向上取整, 保证不超过 points 段
+        for i in range(0, len(samples), size):
+            bucket = samples[i:i + size]
+            result["ts"].append(bucket[-1]["ts"])
+            for f in FIELDS:
+                result[f].append(round(sum(s[f] for s in bucket) / len(bucket), 2))
+        return result
+
+sampler = PerformanceSampler()
@@ -0,0 +1,82 @@
+import os
+import time
+import hashlib
+
+from worker_base import WorkerProcess, RunCancelled
+from ekidata_delta import ingest
+from build_process import BuildRunner
+
+def files_fingerprint(paths, exts=None):
+    '''按 文件名/大小/修改时间 计算目录或文件集合的指纹, 不读取内容'''
+    h = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            entries = [os.path.join(path, n) for n in names if not exts or n.endswith(exts)]
+        else:
+            entries = [path]
+        for entry in entries:
+            try:
+                st = os.stat(entry)
+                h.update(f"{entry}|{st.st_size}|{st.st_mtime_ns}\n".encode('utf-8'))
+            except FileNotFoundError:
+                h.update(f"{entry}|missing\n".encode('utf-8'))
+    return h.hexdigest()
+
+class EkidataDeltaWorker(WorkerProcess):
+    '''ekidata 下载完成后生成差分并更新 public/ekidata'''
+    def __init__(self, name, period=3600, download_dir="./downloads", ekidata_dir="./public/ekidata"):
+        super().__init__(name, period, "ekidata_delta")
+        self.download_dir = download_dir
+        self.ekidata_dir = ekidata_dir
+
+    def input_fingerprint(self):
+        return files_fingerprint([self.download_dir], exts='.csv')
+
+    def trigger(self):
+        self.tracker.start(1, self.run_id)
+        started = time.perf_counter()
+        delta = ingest(self.download_dir, self.ekidata_dir)
+        self.tracker.increment(latency=time.perf_counter() - started)
+        return f"Delta: {delta.summary() or 'no new release'}"
+
+class BuildWorker(WorkerProcess):
+    '''在独立进程中运行 RailwayDataService.build, 进度直接使用 BuildRunner 的 tracker'''
+    def __init__(self, name, period=3600, db_path="railway.db", data_dir="./public"):
+        super().__init__(name, period, "railway_build", max_retry=1)
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.runner = BuildRunner(db_path, data_dir)
+        self.tracker = self.runner.tracker
+        self.tracker.on_change = self.notify_changed
+
+    def input_fingerprint(self):
+        # delta.json 由构建本身标记为已应用, 不计入; 输出库缺失时也需重新构建
+        return "|".join([
+            files_fingerprint([os.path.join(self.data_dir, "company_data.json")]),
+            files_fingerprint([os.path.join(self.data_dir, "geojson")], exts='.geojson'),
+            files_fingerprint([os.path.join(self.data_dir, "ekidata")], exts='.csv'),
+            str(os.path.exists(self.db_path)),
+        ])
+
+    def trigger(self):
+        if not self.runner.start():
+            raise Exception("Build already running")
+        self.runner.wait()
+
+        if self.runner.statcode == 499:
+            raise RunCancelled()
+        if self.runner.statcode != 200:
+            raise Exception(self.runner.last_result)
+
+        result = self.runner.last_result
+        return f"Built v{self.runner.version}: {result['companies']} companies, {result['groups']} groups"
+
+    def request_cancel(self):
+        super().request_cancel()
+        self.runner.cancel()
+
+    def get_dashboard_view(self):
+        view = super().get_dashboard_view()
+        view["build"] = self.runner.get_view()
+        return view
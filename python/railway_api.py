@@ -0,0 +1,293 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, current_app, request
+
+from station_search import search as search_stations
+from routing import RouteGraph, METRICS
+
+# 只读数据接口: 挂载于 /api, 数据来自 save_to_db 生成的 railway.db
+router = Blueprint('railway_api', __name__)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# 各资源可选择的字段 (对外名称 -> SQL 表达式), 缺省返回全部
+COMPANY_FIELDS = {
+    "id": "id", "region": "region", "type": "type", "cd": "cd", "rr": "rr",
+}
+LINE_FIELDS = {
+    "company_id": "company_id", "name": "name", "type": "type", "line_cd": "line_cd",
+    "is_mock": "is_mock", "stroke": "stroke", "stroke_width": "stroke_width",
+}
+STATION_FIELDS = {
+    "company_id": "company_id", "line_name": "line_name", "line_cd": "line_cd", "name": "name",
+    "station_cd": "station_cd", "station_g_cd": "station_g_cd", "is_mock": "is_mock",
+    "lon": "location_x", "lat": "location_y", "transfers": "transfers",
+    "reading": "reading", "romaji": "romaji",
+}
+GROUP_FIELDS = {
+    "station_g_cd": "station_g_cd", "name": "MIN(name)", "lon": "AVG(location_x)", "lat": "AVG(location_y)",
+    "stations": "COUNT(*)", "companies": "GROUP_CONCAT(DISTINCT company_id)",
+}
+JSON_FIELDS = ('transfers',) # 库中以 JSON 文本保存
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def db_version(path):
+    '''构建版本: save_to_db 以原子替换写库, 文件标识/修改时间/大小任一变化即为新版本'''
+    st = os.stat(path)
+    return f"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_size:x}"
+
+class ReadOnlyPool:
+    '''
+    railway.db 的只读连接.
+    连接只在单个请求内使用, 结束即关闭, 不保留空闲连接: Windows 上库文件有打开的句柄时,
+    构建进程的 os.replace 会失败. 打开只读 SQLite 连接只需百微秒级, 不值得为此阻塞构建.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.open_count = 0 # 当前打开的连接数
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        '''检查库文件版本, 返回当前版本 (文件不存在时为 None)'''
+        try:
+            version = db_version(self.path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.version = version
+        return version
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        with self._lock:
+            self.open_count += 1
+        try:
+            yield conn
+        finally:
+            conn.close()
+            with self._lock:
+                self.open_count -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+_graphs = {} # db 路径 -> (版本, RouteGraph)
+MAX_MATRIX = 100 # 批量查询的起点/终点数上限
+
+def get_pool(path):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ReadOnlyPool(path)
+        return pool
+
+def get_route_graph(pool):
+    '''当前版本的路线图, 库文件替换后重新加载'''
+    version = pool.version
+    cached = _graphs.get(pool.path)
+    if cached and cached[0] == version:
+        return cached[1]
+    with pool.connection() as conn:
+        graph = RouteGraph.load(conn)
+    _graphs[pool.path] = (version, graph)
+    return graph
+
+def _parse_fields(allowed):
+    spec = request.args.get('fields')
+    if not spec:
+        return list(allowed)
+    fields = [f.strip() for f in spec.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ApiError(f"unknown fields: {', '.join(unknown)}; available: {', '.join(allowed)}")
+    return fields
+
+def _parse_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer")
+    return max(1, min(limit, MAX_LIMIT))
+
+def _parse_cursor():
+    '''keyset 游标: 上一页最后一行的键 (rowid 或 station_g_cd)'''
+    after = request.args.get('after')
+    if after is None:
+        return None
+    try:
+        return int(after)
+    except ValueError:
+        raise ApiError("after must be a cursor returned as 'next'")
+
+def _row_dict(row, fields):
+    item = {}
+    for f in fields:
+        value = row[f]
+        if f in JSON_FIELDS and value is not None:
+            value = json.loads(value)
+        item[f] = value
+    return item
+
+def _page(conn, allowed, table, where, params, key="rowid", group_by=None):
+    '''
+    按 key 升序的 keyset 分页: WHERE key > after ORDER BY key LIMIT n.
+    多取一行判断是否还有下一页, 翻页代价与页码无关.
+    '''
+    fields = _parse_fields(allowed)
+    limit = _parse_limit()
+    after = _parse_cursor()
+
+    clauses = list(where)
+    params = list(params)
+    if after is not None:
+        clauses.append(f"{key} > ?")
+        params.append(after)
+    columns = ", ".join(f'{allowed[f]} AS "{f}"' for f in fields)
+    sql = f"SELECT {key} AS _key, {columns} FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if group_by:
+        sql += f" GROUP BY {group_by}"
+    sql += f" ORDER BY {key} LIMIT ?"
+    rows = conn.execute(sql, params + [limit + 1]).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_row_dict(r, fields) for r in rows],
+        "next": rows[-1]["_key"] if has_more else None,
+    }
+
+def _db_path():
+    return current_app.config.get('RAILWAY_DB', 'railway.db')
+
+def _respond(query):
+    '''
+    ETag 由构建版本与请求参数决定, 与上次相同时直接 304, 不查询数据库.
+    query(conn) 返回响应对象 (dict).
+    '''
+    pool = get_pool(_db_path())
+    version = pool.refresh()
+    if version is None:
+        return Response(json.dumps({"error": "railway.db not built yet"}), status=503, mimetype='application/json')
+
+    etag = hashlib.sha1(f"{version}|{request.full_path}".encode('utf-8')).hexdigest()[:20]
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    try:
+        with pool.connection() as conn:
+            payload = query(conn)
+    except ApiError as e:
+        return Response(json.dumps({"error": str(e)}, ensure_ascii=False), status=e.status, mimetype='application/json')
+    except sqlite3.OperationalError as e:
+        return Response(json.dumps({"error": str(e)}, ensure_ascii=False), status=503, mimetype='application/json')
+    return Response(json.dumps(payload, ensure_ascii=False), mimetype='application/json', headers=headers)
+
+def _exists(conn, sql, params, message):
+    if conn.execute(sql, params).fetchone() is None:
+        raise ApiError(message, status=404)
+
+@router.route('/companies')
+def companies():
+    return _respond(lambda conn: _page(conn, COMPANY_FIELDS, "companies", [], []))
+
+@router.route('/companies/<company_id>/lines')
+def company_lines(company_id):
+    def query(conn):
+        _exists(conn, "SELECT 1 FROM companies WHERE id = ?", (company_id,), f"company not found: {company_id}")
+        return _page(conn, LINE_FIELDS, "lines", ["company_id = ?"], [company_id])
+    return _respond(query)
+
+@router.route('/companies/<company_id>/lines/<path:line_name>/stations')
+def line_stations(company_id, line_name):
+    def query(conn):
+        _exists(conn, "SELECT 1 FROM lines WHERE company_id = ? AND name = ?", (company_id, line_name),
+                f"line not found: {company_id} / {line_name}")
+        return _page(conn, STATION_FIELDS, "stations", ["company_id = ?", "line_name = ?"], [company_id, line_name])
+    return _respond(query)
+
+@router.route('/station-groups')
+def station_groups():
+    return _respond(lambda conn: _page(conn, GROUP_FIELDS, "stations", ["station_g_cd IS NOT NULL"], [],
+                                       key="station_g_cd", group_by="station_g_cd"))
+
+@router.route('/station-groups/<int:group_cd>')
+def station_group(group_cd):
+    def query(conn):
+        fields = _parse_fields(STATION_FIELDS)
+        columns = ", ".join(f'{STATION_FIELDS[f]} AS "{f}"' for f in fields)
+        rows = conn.execute(f"SELECT {columns} FROM stations WHERE station_g_cd = ? ORDER BY rowid", (group_cd,)).fetchall()
+        if not rows:
+            raise ApiError(f"station group not found: {group_cd}", status=404)
+        return {"station_g_cd": group_cd, "stations": [_row_dict(r, fields) for r in rows]}
+    return _respond(query)
+
+@router.route('/stations/search')
+def station_search():
+    """?q=&limit= 车站名 / 读音 / 罗马字的前缀与子串检索"""
+    def query(conn):
+        q = request.args.get('q', '')
+        return {"query": q, "items": search_stations(conn, q, min(_parse_limit(), 50))}
+    return _respond(query)
+
+def _parse_stations(name):
+    values = [v for v in request.args.get(name, '').split(',') if v]
+    if not values:
+        raise ApiError(f"{name} is required")
+    try:
+        return [int(v) for v in values]
+    except ValueError:
+        raise ApiError(f"{name} must be station_g_cd / station_cd values")
+
+def _parse_route_options():
+    metric = request.args.get('metric', 'distance')
+    if metric not in METRICS:
+        raise ApiError(f"metric must be one of: {', '.join(METRICS)}")
+    penalty = request.args.get('penalty', type=float)
+    return metric, penalty
+
+@router.route('/route')
+def route():
+    """?from=&to=&metric=distance|hops&penalty= 两站间最短路"""
+    def query(conn):
+        origin, destination = _parse_stations('from')[0], _parse_stations('to')[0]
+        metric, penalty = _parse_route_options()
+        graph = get_route_graph(get_pool(_db_path()))
+        try:
+            result = graph.shortest_path(origin, destination, metric, penalty)
+        except KeyError as e:
+            raise ApiError(str(e.args[0]), status=404)
+        if result is None:
+            raise ApiError("no route", status=404)
+        return result
+    return _respond(query)
+
+@router.route('/route/matrix')
+def route_matrix():
+    """?from=a,b&to=c,d 多对多最短路费用"""
+    def query(conn):
+        origins, destinations = _parse_stations('from'), _parse_stations('to')
+        if len(origins) > MAX_MATRIX or len(destinations) > MAX_MATRIX:
+            raise ApiError(f"at most {MAX_MATRIX} origins and destinations")
+        metric, penalty = _parse_route_options()
+        graph = get_route_graph(get_pool(_db_path()))
+        try:
+            costs = graph.many_to_many(origins, destinations, metric, penalty)
+        except KeyError as e:
+            raise ApiError(str(e.args[0]), status=404)
+        return {"from": origins, "to": destinations, "metric": metric, "costs": costs}
+    return _respond(query)
@@ -2,16 +2,27 @@ import logging
 import json
 import hashlib
 import pandas as pd
+import jaconv
 import sqlite3
 import shapely
 import os
 import re
 import math
+import time
 from difflib import SequenceMatcher
 from shapely.geometry import Point, Polygon, LineString, MultiLineString, shape
+from ekidata_delta import EkidataDelta, latest_csv, DELTA_NAME
+from tracing import Tracer, span, traced, write_build_run, BUILD_RUNS_SCHEMA
+from vector_tiles import CompanyFeatures, TileCache, tiles_path_for
+from line_pyramid import build_pyramid, write_pyramid
+from station_search import build_entries, write_index
+from station_parent_model import normalizer
+from routing import compile_graph, load_joins
 
 logger = logging.getLogger()
 
+REPLACE_TIMEOUT = 10.0 # 替换库文件时等待读取方释放句柄的上限 (秒)
+
 # 辅助函数
 def normalize_name(name: str) -> str:
     """Normalizes string for basic comparison (strip whitespace)."""
@@ -46,6 +57,21 @@ def get_lcs_length(s1: str, s2: str) -> int:
     match = SequenceMatcher(None, s1, s2).find_longest_match(0, len(s1), 0, len(s2))
     return match.size
 
+def replace_file(src, dst, timeout=REPLACE_TIMEOUT):
+    '''
+    os.replace. Windows 上目标文件仍被打开 (只读接口正在处理的请求) 时抛出 PermissionError,
+    请求结束即释放, 短暂重试即可.
+    '''
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
 def calculate_distance(coord1, coord2) -> float:
     """Calculates Haversine distance between two points (lon, lat) in km."""
     if not coord1 or not coord2:
@@ -106,6 +132,7 @@ class ekidata_company:
         self._id_to_name_map = {}
         self.ekidata_lines = {}
         self.ekidata_stations = {}
+        self.station_readings = {} # station_cd -> station_name_k (免费版 CSV 为空)
 
         for row in self.df_merged.itertuples():
             c_name = clean_name(getattr(row, 'company_name_h', ''))
@@ -151,6 +178,9 @@ class ekidata_company:
                 s_cd = getattr(row, 'station_cd', None)
                 s_g_cd = getattr(row, 'station_g_cd', None)
                 s_name = getattr(row, 'station_name', '')
+                s_name_k = getattr(row, 'station_name_k', None)
+                if s_cd and isinstance(s_name_k, str) and s_name_k:
+                    self.station_readings[s_cd] = s_name_k
 
                 if s_line_cd and s_cd:
                     if s_line_cd not in self.ekidata_stations:
@@ -360,8 +390,10 @@ class line:
 
         # Match with Ekidata
         if self.company.service and self.company.service.company_ekidata:
-             self.match_ekidata(self.company.service.company_ekidata)
+             if not self.company.service.restore_line_match(self):
+                 self.match_ekidata(self.company.service.company_ekidata)
     
+    @traced('match_line')
     def match_ekidata(self, ekidata: ekidata_company):
         """Matches this line to an Ekidata line_cd."""
         company_cd = self.company.cd
@@ -413,7 +445,8 @@ class line:
             i.line = self     
             # Attempt to match station to Ekidata now that Line is known
             if self.company.service and self.company.service.company_ekidata:
-                 i.match_ekidata(self.company.service.company_ekidata)
+                 if not self.company.service.restore_station_match(i):
+                     i.match_ekidata(self.company.service.company_ekidata)
            
     
     def load_geometry(self):
@@ -445,7 +478,10 @@ class station:
         self.id = None # station_cd
         self.gid = None # station_g_cd
         self.is_mock = False
+        self.reading = None # 平假名读音, readings 阶段填充
+        self.romaji = None
 
+    @traced('match_station')
     def match_ekidata(self, ekidata: ekidata_company):
         """Matches this station to an Ekidata station_cd, or mocks it."""
         if not self.line:
@@ -617,40 +653,165 @@ class RailwayDataService:
         self.data_dir = data_dir
         self.geojson_dir = os.path.join(data_dir, "geojson")
         self.ekidata_dir = os.path.join(data_dir, "ekidata")
+        self.tiles_path = tiles_path_for(db_path) # 矢量瓦片缓存 (MBTiles)
 
         self.companyList = []
         self.stationGroupList = []
         self.company_ekidata = None
+        self.line_pyramid = []
+        self.station_index = []
+        self.route_graph = None
+
+        # 增量匹配: 上次构建的匹配结果 + 本次 ekidata 差分
+        self.delta_path = os.path.join(self.ekidata_dir, DELTA_NAME)
+        self.ekidata_delta = None
+        self.match_cache = None
+        self._affected_company_cds = set()
+        self._affected_line_cds = set()
+        self.match_stats = {'reused': 0, 'matched': 0}
+        self.reading_stats = {'hits': 0, 'misses': 0}
+        self.tracer = None # 构建期间的 Tracer, save_to_db 用其写入耗时记录
+        self.kana_readings = {} # 站名 -> pykakasi 的 (平假名, 罗马字), 存入 kana_readings 表供下次构建复用
+
+        # 构建进度回调 on_event(kind, **data), 由 BuildRunner 跨进程转发
+        self.on_event = None
+
+    def _emit(self, kind, **data):
+        if self.on_event:
+            try:
+                self.on_event(kind, **data)
+            except Exception as e:
+                logger.warning(f"Build event callback failed: {e}")
+
+    def _prepare_incremental(self):
+        '''存在未应用的差分且有上次结果时, 仅重新匹配受影响的线路与车站'''
+        self.match_stats = {'reused': 0, 'matched': 0}
+        self.match_cache = None
+        self.ekidata_delta = EkidataDelta.load(self.delta_path)
+        if not self.ekidata_delta or self.ekidata_delta.applied:
+            return
+
+        self.match_cache = self.load_match_cache()
+        if self.match_cache is None:
+            return
+        self._affected_company_cds = self.ekidata_delta.affected_company_cds()
+        self._affected_line_cds = self.ekidata_delta.affected_line_cds()
+        logger.info(f"Incremental match: delta {self.ekidata_delta.summary()}, "
+                    f"{len(self._affected_company_cds)} companies / {len(self._affected_line_cds)} lines affected.")
+
+    def load_match_cache(self):
+        '''从上次构建的 db 读取匹配结果, 旧表结构或无 db 时返回 None'''
+        if not os.path.exists(self.db_path):
+            return None
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            lines = {}
+            for company_id, name, line_cd, is_mock, company_cd in cursor.execute(
+                    "SELECT l.company_id, l.name, l.line_cd, l.is_mock, c.cd FROM lines l JOIN companies c ON c.id = l.company_id"):
+                lines[(company_id, name)] = (line_cd, bool(is_mock), company_cd)
+
+            stations = {}
+            for company_id, line_name, name, station_cd, g_cd, is_mock, line_cd in cursor.execute(
+                    "SELECT company_id, line_name, name, station_cd, station_g_cd, is_mock, line_cd FROM stations"):
+                stations[(company_id, line_name, name)] = (station_cd, g_cd, bool(is_mock), line_cd)
+            return {'lines': lines, 'stations': stations}
+        except sqlite3.Error as e:
+            logger.info(f"No reusable match cache ({e}), running full match.")
+            return None
+        finally:
+            conn.close()
+
+    def restore_line_match(self, l):
+        '''公司线路候选未变时复用上次的 line_cd'''
+        if self.match_cache is None:
+            self.match_stats['matched'] += 1
+            return False
+        cached = self.match_cache['lines'].get((l.company.id, l.name))
+        if not cached or cached[2] != l.company.cd or l.company.cd in self._affected_company_cds:
+            self.match_stats['matched'] += 1
+            return False
+
+        line_cd, is_mock, _ = cached
+        if is_mock:
+            l.assign_mock_id(self.company_ekidata)
+        else:
+            l.id = line_cd
+            l.is_mock = False
+        self.match_stats['reused'] += 1
+        return True
+
+    def restore_station_match(self, s):
+        '''所属线路未变且线路的车站候选未变时复用上次的 station_cd'''
+        if self.match_cache is None or not s.line:
+            self.match_stats['matched'] += 1
+            return False
+        cached = self.match_cache['stations'].get((s.company.id, s.line.name, s.name))
+        if not cached or cached[3] != s.line.id or s.line.id in self._affected_line_cds:
+            self.match_stats['matched'] += 1
+            return False
+
+        station_cd, g_cd, is_mock, _ = cached
+        if is_mock:
+            s.assign_mock_id()
+        else:
+            s.id = station_cd
+            s.gid = g_cd
+            s.is_mock = False
+        self.match_stats['reused'] += 1
+        return True
 
     def build(self):
         """Builds the in-memory object graph and persists to SQLite."""
         logger.info("Starting RailwayDataService build...")
+        with Tracer() as tracer:
+            self.tracer = tracer
+            try:
+                if not self._build():
+                    return
+            finally:
+                self.tracer = None
+
+        # 库中的记录在替换前写入 (见 save_to_db), 这里的报告另含提交与替换的耗时
+        report = tracer.report()
+        slowest = ", ".join(f"{s['item']} {s['seconds']}s" for s in report['slow_items'][:3])
+        logger.info(f"Build timing: {report['duration']}s, stages: {[(s['name'], s['seconds']) for s in report['stages']]}, slowest: {slowest}")
+
+        self._emit('done', companies=len(self.companyList), groups=len(self.stationGroupList),
+                   match_stats=self.match_stats, reading_stats=self.reading_stats, report=report)
+
+    def _build(self):
+        self._emit('stage', name='load_base')
 
         company_json_path = os.path.join(self.data_dir, "company_data.json")
 
-        # NOTE: For now hardcoding the names relative to ekidata_dir as they were in the original script
-        ekidata_company_path = os.path.join(self.ekidata_dir, "company20251015.csv")
+        # 使用 ekidata_dir 中日期最新的版本, 缺省为原脚本中的文件名
+        ekidata_company_path = latest_csv(self.ekidata_dir, 'company', os.path.join(self.ekidata_dir, "company20251015.csv"))
         ekidata_company_patch_path = os.path.join(self.ekidata_dir, "companypatch.csv")
-        ekidata_line_path = os.path.join(self.ekidata_dir, "line20250604free.csv")
-        ekidata_station_path = os.path.join(self.ekidata_dir, "station20251211free.csv")
+        ekidata_line_path = latest_csv(self.ekidata_dir, 'line', os.path.join(self.ekidata_dir, "line20250604free.csv"))
+        ekidata_station_path = latest_csv(self.ekidata_dir, 'station', os.path.join(self.ekidata_dir, "station20251211free.csv"))
 
-        try:
-            company_data = load_json(company_json_path)
-            # Only load ekidata if files exist (allows for partial mocks)
-            if os.path.exists(ekidata_company_path):
-                 self.company_ekidata = ekidata_company(
-                     ekidata_company_path,
-                     ekidata_line_path,
-                     ekidata_company_patch_path,
-                     ekidata_station_path
-                 )
-            else:
-                 logger.warning(f"Ekidata files not found at {ekidata_company_path}, skipping ekidata linkage.")
-                 self.company_ekidata = None
+        with span('load_base'):
+            try:
+                company_data = load_json(company_json_path)
+                # Only load ekidata if files exist (allows for partial mocks)
+                if os.path.exists(ekidata_company_path):
+                     self.company_ekidata = ekidata_company(
+                         ekidata_company_path,
+                         ekidata_line_path,
+                         ekidata_company_patch_path,
+                         ekidata_station_path
+                     )
+                else:
+                     logger.warning(f"Ekidata files not found at {ekidata_company_path}, skipping ekidata linkage.")
+                     self.company_ekidata = None
 
-        except Exception as e:
-            logger.error(f"Failed to load base data: {e}")
-            return
+            except Exception as e:
+                logger.error(f"Failed to load base data: {e}")
+                return False
+
+            if self.company_ekidata:
+                self._prepare_incremental()
 
         temp_company_list = [] # Use local list for thread safety
 
@@ -659,35 +820,128 @@ class RailwayDataService:
             c = company(company_data[i], service_instance=self)
             temp_company_list.append(c)
 
-        for i in temp_company_list:
-            i.load_feature()
-            i.load_meta()
+        self._emit('stage', name='load_companies', total=len(temp_company_list))
+        with span('load_companies'):
+            for n, i in enumerate(temp_company_list, 1):
+                with span('company', item=i.id):
+                    with span('load_feature'):
+                        i.load_feature()
+                    with span('load_meta'):
+                        i.load_meta()
+                self._emit('progress', current=n, total=len(temp_company_list), item=i.id)
 
         self.stationGroupList = []
         self.stationGroupNameMap = {}
 
-        for c in temp_company_list:
-            for line in c.lineList:
-                for st in line.stations:
-                     st.find_group(self.stationGroupList, self.stationGroupNameMap)
+        self._emit('stage', name='find_group')
+        with span('find_group'):
+            for c in temp_company_list:
+                for line in c.lineList:
+                    for st in line.stations:
+                         st.find_group(self.stationGroupList, self.stationGroupNameMap)
 
         # Atomic swap
         self.companyList = temp_company_list
         logger.info(f"Built {len(self.companyList)} companies.")
         logger.info(f"Built {len(self.stationGroupList)} station groups.")
+        logger.info(f"Ekidata match: {self.match_stats['reused']} reused, {self.match_stats['matched']} matched.")
+
+        self._emit('stage', name='simplify')
+        with span('simplify'):
+            self.line_pyramid = build_pyramid(self.companyList)
+
+        self._emit('stage', name='readings')
+        with span('readings'):
+            self.assign_readings()
+
+        self._emit('stage', name='search_index')
+        with span('search_index'):
+            self.station_index = build_entries(self.companyList)
+
+        self._emit('stage', name='routing')
+        with span('routing'):
+            self.compile_routes()
+
+        # 瓦片不依赖 railway.db, 先于保存生成, 使库中的耗时记录包含该阶段
+        self._emit('stage', name='tiles')
+        with span('tiles'):
+            self.update_tiles()
+
+        self._emit('stage', name='save_to_db')
+        with span('save_to_db'):
+            self.save_to_db()
+
+        # 差分已应用, 下次构建不再复用
+        if self.ekidata_delta and not self.ekidata_delta.applied:
+            self.ekidata_delta.applied = True
+            self.ekidata_delta.save(self.delta_path)
+        return True
+
+    def load_reading_cache(self):
+        '''
+        上次构建保存的 pykakasi 转换结果 站名 -> (读音, 罗马字), 旧表结构或无 db 时为空.
+        不取 stations.reading: 其中混有 ekidata 的读音, 用作同名车站的回退值会使结果随构建次数变化
+        '''
+        if not os.path.exists(self.db_path):
+            return {}
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return {name: (reading, romaji) for name, reading, romaji in conn.execute(
+                "SELECT name, reading, romaji FROM kana_readings")}
+        except sqlite3.Error:
+            return {}
+        finally:
+            conn.close()
+
+    def assign_readings(self):
+        '''为全部车站填充读音: ekidata 的 station_name_k 优先, 其余按不同站名批量转换一次'''
+        normalizer.seed(self.load_reading_cache())
+        before = normalizer.stats()
+
+        stations = [s for c in self.companyList for l in c.lineList for s in l.stations]
+        converted = normalizer.readings_many(s.name for s in stations)
+        self.kana_readings = converted
+        kana = self.company_ekidata.station_readings if self.company_ekidata else {}
+        for s in stations:
+            hira, roma = converted[s.name]
+            s.reading = jaconv.kata2hira(kana[s.id]) if s.id in kana else hira
+            s.romaji = roma
+
+        after = normalizer.stats()
+        self.reading_stats = {'hits': after['hits'] - before['hits'], 'misses': after['misses'] - before['misses']}
+        logger.info(f"Readings: {len(stations)} stations, {len(converted)} distinct names, "
+                    f"{self.reading_stats['misses']} converted by pykakasi.")
+
+    def compile_routes(self):
+        """编译路线图. 路线图是派生数据, 失败时不写入 route_graph, 不影响构建结果"""
+        try:
+            # ekidata 的 join CSV (免费版不含) 存在时按其连接相邻站
+            joins = load_joins(latest_csv(self.ekidata_dir, 'join'))
+            self.route_graph = compile_graph(self.companyList, joins)
+            logger.info(f"Route graph: {self.route_graph.node_count} nodes, {self.route_graph.edge_count} edges.")
+        except Exception as e:
+            self.route_graph = None
+            logger.exception(f"路线图生成失败: {e}")
 
-        self.save_to_db()
+    def update_tiles(self):
+        """重新生成指纹有变化的公司覆盖的矢量瓦片. 瓦片是派生缓存, 失败不影响构建结果"""
+        try:
+            features = {c.id: CompanyFeatures.from_company(c, self.geojson_dir) for c in self.companyList}
+            stats = TileCache(self.tiles_path).update(features)
+            logger.info(f"矢量瓦片: {stats['changed']} 个公司变化, 重写 {stats['tiles']} 个瓦片.")
+        except Exception as e:
+            logger.exception(f"矢量瓦片生成失败: {e}")
 
     def save_to_db(self):
-        """SQLite db存储"""
+        """SQLite db存储. 先写入临时文件再原子替换, 读取方不会看到写了一半的库"""
         logger.info(f"保存到db: {self.db_path}")
-        conn = sqlite3.connect(self.db_path)
+        started = time.perf_counter()
+        tmp_path = f"{self.db_path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path) # 上次被中断的残留
+        conn = sqlite3.connect(tmp_path)
         cursor = conn.cursor()
 
-        cursor.execute("DROP TABLE IF EXISTS stations")
-        cursor.execute("DROP TABLE IF EXISTS lines")
-        cursor.execute("DROP TABLE IF EXISTS companies")
-
         cursor.execute('''
             CREATE TABLE companies (
                 id TEXT PRIMARY KEY,
@@ -704,6 +958,7 @@ class RailwayDataService:
                 name TEXT,
                 type TEXT,
                 line_cd INTEGER,
+                is_mock INTEGER,
                 stroke TEXT,
                 stroke_width REAL,
                 FOREIGN KEY(company_id) REFERENCES companies(id)
@@ -714,32 +969,71 @@ class RailwayDataService:
             CREATE TABLE stations (
                 company_id TEXT,
                 line_name TEXT,
+                line_cd INTEGER,
                 name TEXT,
                 station_cd INTEGER,
                 station_g_cd INTEGER,
+                is_mock INTEGER,
                 location_x REAL,
                 location_y REAL,
                 transfers TEXT,
+                reading TEXT,
+                romaji TEXT,
                 FOREIGN KEY(company_id) REFERENCES companies(id)
             )
         ''')
 
+        # 历次构建记录随库迁移, 本次记录在替换前追加
+        cursor.execute(BUILD_RUNS_SCHEMA)
+        if os.path.exists(self.db_path):
+            cursor.execute("ATTACH DATABASE ? AS old", (self.db_path,))
+            if cursor.execute("SELECT 1 FROM old.sqlite_master WHERE type='table' AND name='build_runs'").fetchone():
+                cursor.execute("INSERT INTO build_runs SELECT * FROM old.build_runs")
+            conn.commit()
+            cursor.execute("DETACH DATABASE old")
+
         for c in self.companyList:
             cursor.execute("INSERT INTO companies (id, region, type, cd, rr) VALUES (?, ?, ?, ?, ?)",
                            (c.id, c.region, c.type, c.cd, c.rr))
 
             for l in c.lineList:
-                cursor.execute("INSERT INTO lines (company_id, name, type, line_cd, stroke, stroke_width) VALUES (?, ?, ?, ?, ?, ?)",
-                               (c.id, l.name, l.type, l.id, l.stroke, l.stroke_width))
+                cursor.execute("INSERT INTO lines (company_id, name, type, line_cd, is_mock, stroke, stroke_width) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (c.id, l.name, l.type, l.id, int(l.is_mock), l.stroke, l.stroke_width))
 
                 for s in l.stations:
                      # Serialize transfers list to JSON string
                      transfers_json = json.dumps(s.transferLst, ensure_ascii=False)
-                     cursor.execute("INSERT INTO stations (company_id, line_name, name, station_cd, station_g_cd, location_x, location_y, transfers) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                               (c.id, l.name, s.name, s.id, s.gid, s.location.x, s.location.y, transfers_json))
+                     cursor.execute("INSERT INTO stations (company_id, line_name, line_cd, name, station_cd, station_g_cd, is_mock, location_x, location_y, transfers, reading, romaji) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (c.id, l.name, l.id, s.name, s.id, s.gid, int(s.is_mock), s.location.x, s.location.y, transfers_json, s.reading, s.romaji))
+
+        # 站名的 pykakasi 转换结果, 下次构建的 readings 阶段直接复用
+        cursor.execute("CREATE TABLE kana_readings (name TEXT PRIMARY KEY, reading TEXT, romaji TEXT)")
+        cursor.executemany("INSERT INTO kana_readings VALUES (?, ?, ?)",
+                           ((name, hira, roma) for name, (hira, roma) in self.kana_readings.items()))
+
+        # 只读接口 (railway_api) 按公司/线路/车站组查询
+        cursor.execute("CREATE INDEX idx_lines_company ON lines (company_id)")
+        cursor.execute("CREATE INDEX idx_stations_line ON stations (company_id, line_name)")
+        cursor.execute("CREATE INDEX idx_stations_group ON stations (station_g_cd)")
+
+        # 多分辨率线路几何 (simplify 阶段生成)
+        write_pyramid(cursor, self.line_pyramid)
+        # 车站名检索索引 (search_index 阶段生成)
+        write_index(cursor, self.station_index)
+        # 路线图 (routing 阶段生成)
+        if self.route_graph is not None:
+            self.route_graph.write(cursor)
+
+        # 本次构建的耗时记录. 在替换前写入临时库, 不再修改已发布的库 (库文件版本每次构建只变一次)
+        if self.tracer is not None:
+            report = self.tracer.report()
+            report['stages'].append({"name": "save_to_db", "seconds": round(time.perf_counter() - started, 3)})
+            write_build_run(conn, report, len(self.companyList), len(self.stationGroupList))
 
         conn.commit()
         conn.close()
+        replace_file(tmp_path, self.db_path)
+        self._emit('timing', name='sqlite_write', seconds=time.perf_counter() - started)
         logger.info("db存储完成.")
 
 if __name__ == "__main__":
@@ -0,0 +1,355 @@
+import io
+import json
+import math
+import heapq
+import logging
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from geometry import line_geometry
+
+logger = logging.getLogger(__name__)
+
+# 路线图: 节点为每条线路上的车站, 边为 乘车 (同线相邻两站) 与 换乘 (同一车站组内的车站).
+# 构建时编译为 CSR 邻接数组 (indptr / indices / 边长 / 边类型) 存入 railway.db,
+# 查询时按度量 (距离 km / 站数) 与换乘惩罚计算边权, 用 A* (距离) 或 Dijkstra (站数) 求最短路.
+RIDE, TRANSFER = 0, 1
+METRICS = ('distance', 'hops')
+TRANSFER_PENALTY = {'distance': 3.0, 'hops': 2.0} # 换乘一次相当于多乘 3km / 2 站
+JUMP_KM = 8.0 # 相邻两站直线距离超过 max(JUMP_KM, 4 倍该线中位站距) 视为支线跳转, 不连边
+MAX_TRANSFER_KM = 1.0 # 组内相距更远的车站 (匹配错误导致的分组) 不作为换乘
+EARTH_RADIUS_KM = 6371.0
+
+ROUTE_GRAPH_SCHEMA = '''
+    CREATE TABLE route_graph (
+        key TEXT PRIMARY KEY,
+        data BLOB
+    )
+'''
+NO_CODE = -1 # 未匹配 ekidata (无 ekidata 构建) 的车站编号, 不参与按编号查询与组内换乘
+ARRAYS = ('indptr', 'indices', 'length', 'kind', 'station_cd', 'station_g_cd', 'lon', 'lat')
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def load_joins(path):
+    '''ekidata join CSV (line_cd, station_cd1, station_cd2) -> {line_cd: [(cd1, cd2)]}; 无文件时为空'''
+    if not path:
+        return {}
+    try:
+        df = pd.read_csv(path, encoding='utf-8')
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read join CSV {path}: {e}")
+        return {}
+    joins = {}
+    for line_cd, cd1, cd2 in df[['line_cd', 'station_cd1', 'station_cd2']].itertuples(index=False):
+        joins.setdefault(line_cd, []).append((cd1, cd2))
+    return joins
+
+class _AlongLine:
+    '''沿线距离: 车站投影到合并后的线路上, 以累计 km 插值'''
+    def __init__(self, geom):
+        merged = shapely.line_merge(geom) if geom.geom_type == 'MultiLineString' else geom
+        self.parts = list(merged.geoms) if hasattr(merged, 'geoms') else [merged]
+        self.cum_deg = []
+        self.cum_km = []
+        for part in self.parts:
+            coords = shapely.get_coordinates(part)
+            seg_deg = np.hypot(*np.diff(coords, axis=0).T)
+            seg_km = haversine_km(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+            self.cum_deg.append(np.concatenate([[0.0], np.cumsum(seg_deg)]))
+            self.cum_km.append(np.concatenate([[0.0], np.cumsum(seg_km)]))
+
+    def locate(self, points):
+        '''[(part, km)] for each shapely Point'''
+        parts = np.array(self.parts, dtype=object)
+        located = []
+        for p in points:
+            i = int(np.argmin(shapely.distance(parts, p)))
+            located.append((i, float(np.interp(self.parts[i].project(p), self.cum_deg[i], self.cum_km[i]))))
+        return located
+
+class RouteGraph:
+    '''CSR 邻接图 + 节点属性. 节点 i 的出边为 indices[indptr[i]:indptr[i+1]]'''
+    def __init__(self, arrays, nodes):
+        for key in ARRAYS:
+            setattr(self, key, arrays[key])
+        self.nodes = nodes # [{"name", "company", "line"}], 与数组下标对应
+        self._by_group = {}
+        self._by_cd = {}
+        for i, (cd, g_cd) in enumerate(zip(self.station_cd.tolist(), self.station_g_cd.tolist())):
+            if g_cd != NO_CODE:
+                self._by_group.setdefault(g_cd, []).append(i)
+            if cd != NO_CODE:
+                self._by_cd.setdefault(cd, []).append(i)
+        # 查询走纯 Python 循环, 预先转成 list 比逐个取 numpy 元素快一个数量级
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._lon = np.radians(self.lon).tolist()
+        self._lat = np.radians(self.lat).tolist()
+        self._weights = {}
+
+    @property
+    def node_count(self):
+        return len(self.station_cd)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    # --- 存储 ---
+
+    def write(self, cursor):
+        cursor.execute(ROUTE_GRAPH_SCHEMA)
+        for key in ARRAYS:
+            buf = io.BytesIO()
+            np.save(buf, getattr(self, key), allow_pickle=False)
+            cursor.execute("INSERT INTO route_graph VALUES (?, ?)", (key, buf.getvalue()))
+        cursor.execute("INSERT INTO route_graph VALUES (?, ?)",
+                       ('nodes', json.dumps(self.nodes, ensure_ascii=False).encode('utf-8')))
+
+    @classmethod
+    def load(cls, conn):
+        blobs = dict(conn.execute("SELECT key, data FROM route_graph").fetchall())
+        arrays = {key: np.load(io.BytesIO(blobs[key]), allow_pickle=False) for key in ARRAYS}
+        return cls(arrays, json.loads(blobs['nodes'].decode('utf-8')))
+
+    # --- 查询 ---
+
+    def resolve(self, station):
+        '''车站组编号 (station_g_cd) 或车站编号 (station_cd) -> 节点列表'''
+        nodes = self._by_group.get(station) or self._by_cd.get(station)
+        if not nodes:
+            raise KeyError(f"unknown station: {station}")
+        return nodes
+
+    def weights(self, metric='distance', transfer_penalty=None):
+        '''按度量生成边权 (list), 同一参数只计算一次'''
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {METRICS}")
+        penalty = TRANSFER_PENALTY[metric] if transfer_penalty is None else float(transfer_penalty)
+        key = (metric, penalty)
+        cached = self._weights.get(key)
+        if cached is None:
+            transfer = self.kind == TRANSFER
+            base = self.length if metric == 'distance' else np.where(transfer, 0.0, 1.0)
+            cached = self._weights[key] = (base + penalty * transfer).tolist()
+        return cached
+
+    def _search(self, sources, targets, weights, heuristic, first_only=False):
+        '''多源多汇最短路; targets 全部确定 (first_only 时任一确定) 后提前结束. 返回 (dist, prev, 最先确定的目标)'''
+        indptr, indices = self._indptr, self._indices
+        dist = {}
+        prev = {}
+        heap = []
+        for s in sources:
+            dist[s] = 0.0
+            prev[s] = -1
+            heap.append((heuristic(s), 0.0, s))
+        heapq.heapify(heap)
+        remaining = set(targets)
+        done = set()
+        first = None
+        while heap and remaining:
+            _, d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            if u in remaining:
+                remaining.discard(u)
+                if first is None:
+                    first = u
+                if first_only:
+                    break
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd + heuristic(v), nd, v))
+        return dist, prev, first
+
+    def _heuristic(self, targets, metric):
+        '''距离度量下用到最近目标的直线距离 (不高于实际乘车 + 换乘距离), 站数度量退化为 Dijkstra'''
+        if metric != 'distance':
+            return lambda n: 0.0
+        lon, lat = self._lon, self._lat
+        goals = [(lon[t], math.cos(lat[t]), lat[t]) for t in targets]
+        def h(n):
+            best = math.inf
+            lon1, lat1 = lon[n], lat[n]
+            cos1 = math.cos(lat1)
+            for lon2, cos2, lat2 in goals:
+                a = math.sin((lat2 - lat1) / 2) ** 2 + cos1 * cos2 * math.sin((lon2 - lon1) / 2) ** 2
+                best = min(best, 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a))))
+            return best
+        return h
+
+    def shortest_path(self, origin, destination, metric='distance', transfer_penalty=None):
+        '''
+        origin / destination: station_g_cd 或 station_cd. 起点组内任一车站出发不计换乘.
+        返回 {"cost", "distance_km", "hops", "transfers", "path": [...], "legs": [...]}, 不可达时为 None.
+        '''
+        sources = self.resolve(origin)
+        targets = self.resolve(destination)
+        weights = self.weights(metric, transfer_penalty)
+        dist, prev, end = self._search(sources, targets, weights, self._heuristic(targets, metric), first_only=True)
+        if end is None:
+            return None
+
+        path = []
+        node = end
+        while node != -1:
+            path.append(node)
+            node = prev[node]
+        path.reverse()
+        return self._describe(path, dist[end])
+
+    def _edge(self, u, v):
+        for e in range(self._indptr[u], self._indptr[u + 1]):
+            if self._indices[e] == v:
+                return e
+        raise KeyError((u, v))
+
+    def _describe(self, path, cost):
+        distance = 0.0
+        hops = 0
+        transfers = 0 # 起点组内出发不算换乘 (多源), 到达终点组即停止, 只有中途换乘
+        legs = []
+        for u, v in zip(path, path[1:]):
+            e = self._edge(u, v)
+            distance += float(self.length[e])
+            if self.kind[e] == TRANSFER:
+                transfers += 1
+                continue
+            hops += 1
+            info = self.nodes[u]
+            if not legs or legs[-1]["line"] != info["line"] or legs[-1]["company"] != info["company"] or legs[-1]["to"] != u:
+                legs.append({"company": info["company"], "line": info["line"], "from": u, "to": v, "stations": 1})
+            else:
+                legs[-1]["to"] = v
+                legs[-1]["stations"] += 1
+
+        def station(n):
+            return {"station_cd": int(self.station_cd[n]), "station_g_cd": int(self.station_g_cd[n]), **self.nodes[n]}
+        return {
+            "cost": round(cost, 3),
+            "distance_km": round(distance, 3),
+            "hops": hops,
+            "transfers": transfers,
+            "path": [station(n) for n in path],
+            "legs": [{**leg, "from": station(leg["from"]), "to": station(leg["to"])} for leg in legs],
+        }
+
+    def many_to_many(self, origins, destinations, metric='distance', transfer_penalty=None):
+        '''
+        批量查询: 每个起点一次单源搜索 (不使用启发式), 全部终点确定后停止.
+        返回 costs[i][j] (不可达为 None).
+        '''
+        weights = self.weights(metric, transfer_penalty)
+        target_nodes = [self.resolve(d) for d in destinations]
+        all_targets = {t for nodes in target_nodes for t in nodes}
+        zero = lambda n: 0.0
+        costs = []
+        for origin in origins:
+            dist, _, _ = self._search(self.resolve(origin), all_targets, weights, zero)
+            row = []
+            for nodes in target_nodes:
+                best = min((dist[t] for t in nodes if t in dist), default=None)
+                row.append(None if best is None else round(best, 3))
+            costs.append(row)
+        return costs
+
+def compile_graph(companies, joins=None):
+    '''
+    由构建结果编译路线图.
+    乘车边: 有 ekidata join 的线路按 join 连接, 其余按 geojson 中的车站顺序连接相邻两站, 长度为沿线距离.
+    换乘边: 同一车站组内的车站两两相连, 长度为步行直线距离.
+    '''
+    joins = joins or {}
+    nodes = []
+    station_cd, group_cd, lon, lat = [], [], [], []
+    edges = [] # (u, v, km, kind)
+    skipped = 0
+    groups = {}
+
+    for c in companies:
+        for l in c.lineList:
+            if not l.stations:
+                continue
+            first = len(nodes)
+            for s in l.stations:
+                gid = s.group.id if s.group else s.gid
+                nodes.append({"name": s.name, "company": c.id, "line": l.name})
+                station_cd.append(NO_CODE if s.id is None else s.id)
+                group_cd.append(NO_CODE if gid is None else gid)
+                lon.append(s.location.x)
+                lat.append(s.location.y)
+                if gid is not None:
+                    groups.setdefault(gid, []).append(len(nodes) - 1)
+            ids = list(range(first, len(nodes)))
+
+            if l.id in joins and not l.is_mock:
+                index = {s.id: n for s, n in zip(l.stations, ids)}
+                pairs = [(index[a], index[b]) for a, b in joins[l.id] if a in index and b in index]
+            else:
+                pairs = list(zip(ids, ids[1:]))
+            if not pairs:
+                continue
+
+            u, v = np.array(pairs).T - first
+            xs = np.array([s.location.x for s in l.stations])
+            ys = np.array([s.location.y for s in l.stations])
+            straight = haversine_km(xs[u], ys[u], xs[v], ys[v])
+            along = straight.copy()
+            geom = line_geometry(l.rawGeometry)
+            if geom is not None:
+                located = _AlongLine(geom).locate([s.location for s in l.stations])
+                for k, (a, b) in enumerate(pairs):
+                    (pa, ka), (pb, kb) = located[a - first], located[b - first]
+                    if pa == pb:
+                        along[k] = max(abs(kb - ka), straight[k]) # 不低于直线距离, 保证 A* 启发式可采纳
+
+            limit = max(JUMP_KM, 4 * float(np.median(straight)))
+            for (a, b), d, km in zip(pairs, straight, along):
+                if d > limit and l.id not in joins:
+                    skipped += 1
+                    continue
+                edges.append((a, b, km, RIDE))
+                edges.append((b, a, km, RIDE))
+
+    xs, ys = np.array(lon), np.array(lat)
+    far = 0
+    for members in groups.values():
+        for a in members:
+            for b in members:
+                if a == b:
+                    continue
+                km = float(haversine_km(xs[a], ys[a], xs[b], ys[b]))
+                if km > MAX_TRANSFER_KM:
+                    far += 1
+                    continue
+                edges.append((a, b, km, TRANSFER))
+
+    n = len(nodes)
+    edges.sort(key=lambda e: (e[0], e[1]))
+    src = np.array([e[0] for e in edges], dtype=np.int32)
+    arrays = {
+        'indptr': np.concatenate([[0], np.cumsum(np.bincount(src, minlength=n))]).astype(np.int32),
+        'indices': np.array([e[1] for e in edges], dtype=np.int32),
+        'length': np.array([e[2] for e in edges], dtype=np.float64),
+        'kind': np.array([e[3] for e in edges], dtype=np.uint8),
+        'station_cd': np.array(station_cd, dtype=np.int64),
+        'station_g_cd': np.array(group_cd, dtype=np.int64),
+        'lon': xs.astype(np.float64),
+        'lat': ys.astype(np.float64),
+    }
+    if skipped or far:
+        logger.info(f"Route graph: skipped {skipped} station pairs that jump between branches, "
+                    f"{far // 2} transfers farther than {MAX_TRANSFER_KM} km.")
+    return RouteGraph(arrays, nodes)
@@ -0,0 +1,103 @@
+import os
+import re
+import sys
+import gzip
+import shutil
+import mimetypes
+
+from flask import Response, request, send_file, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli # 可选: 未安装时只生成 .gz
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.html', '.js', '.css', '.json', '.geojson', '.svg', '.map', '.txt', '.csv')
+MIN_SIZE = 1024 # 过小的文件压缩收益不抵额外请求头
+ENCODINGS = (('br', '.br'), ('gzip', '.gz')) # 按优先级
+
+# Vite 构建产物 assets/index-<hash>.js 等文件名带内容哈希, 可永久缓存
+HASHED_NAME = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache' # 未带哈希的文件每次以 ETag 验证
+
+def _stale(src, dst):
+    return not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src)
+
+def precompress(root, exts=COMPRESSIBLE, min_size=MIN_SIZE):
+    '''为 root 下的可压缩文件生成 .gz / .br (已存在且不旧于源文件时跳过), 返回生成的文件数'''
+    created = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(exts):
+                continue
+            src = os.path.join(dirpath, name)
+            if os.path.getsize(src) < min_size:
+                continue
+
+            gz_path = src + '.gz'
+            if _stale(src, gz_path):
+                with open(src, 'rb') as f_in, gzip.open(gz_path + '.tmp', 'wb', compresslevel=9) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+                os.replace(gz_path + '.tmp', gz_path)
+                created += 1
+
+            br_path = src + '.br'
+            if brotli and _stale(src, br_path):
+                with open(src, 'rb') as f_in:
+                    data = brotli.compress(f_in.read(), quality=11)
+                with open(br_path + '.tmp', 'wb') as f_out:
+                    f_out.write(data)
+                os.replace(br_path + '.tmp', br_path)
+                created += 1
+    return created
+
+def _etag(st, encoding):
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}{"-" + encoding if encoding else ""}"'
+
+def serve_static(root, filename):
+    '''
+    发送 root 下的静态文件: 客户端接受时优先发送预压缩变体,
+    带强 ETag (按变体区分), 哈希文件名永久缓存, 其余每次验证.
+    '''
+    path = safe_join(root, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    encoding = None
+    send_path = path
+    accepted = request.accept_encodings
+    for name, suffix in ENCODINGS:
+        if name in accepted and os.path.isfile(path + suffix) and not _stale(path, path + suffix):
+            encoding, send_path = name, path + suffix
+            break
+
+    st = os.stat(send_path)
+    etag = _etag(st, encoding)
+    cache_control = IMMUTABLE if HASHED_NAME.search(filename.replace(os.sep, '/')) else REVALIDATE
+
+    if request.if_none_match.contains_weak(etag.strip('"')):
+        response = Response(status=304)
+    else:
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if filename.endswith('.geojson'):
+            mimetype = 'application/geo+json'
+        # 预压缩变体不支持 Range, 只对原文件启用
+        response = send_file(send_path, mimetype=mimetype, conditional=encoding is None, etag=False)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def register_static(app, root):
+    '''用 serve_static 接管 Flask 的 static 端点 (应用需以 static_folder=None 创建)'''
+    app.add_url_rule('/<path:filename>', endpoint='static', view_func=lambda filename: serve_static(root, filename))
+
+if __name__ == '__main__':
+    # 构建后预压缩: python static_assets.py ../dist
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dist')
+    print(f"生成压缩文件 {precompress(target)} 个 ({'gzip + brotli' if brotli else 'gzip'})")
@@ -1,10 +1,74 @@
+import threading
+from collections import OrderedDict
+
 import jaconv
 import pykakasi
 
 kks=pykakasi.kakasi()
 
+class KanaNormalizer:
+    '''
+    站名 -> (平假名, 罗马字).
+    pykakasi 很慢而站名在线路/公司间大量重复, 按名称缓存, 每个不同的名称只转换一次.
+    缓存可用上次构建保存的读音预先填充 (seed), 未变化的站名不再调用 pykakasi.
+    超过 maxsize 时淘汰最久未使用的名称.
+    '''
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize # 站名约 1 万个, 上限只防止异常输入无限增长
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _convert(name):
+        items = kks.convert(name)
+        return ''.join(item['hira'] for item in items), ''.join(item['hepburn'] for item in items)
+
+    def seed(self, mapping):
+        '''name -> (平假名, 罗马字), 例如上次构建写入 kana_readings 表的读音'''
+        with self._lock:
+            for name, value in mapping.items():
+                if len(self._cache) >= self.maxsize:
+                    break
+                self._cache.setdefault(name, tuple(value))
+
+    def readings(self, name):
+        return self.readings_many([name])[name]
+
+    def readings_many(self, names):
+        '''批量转换: 去重后只转换缓存中没有的名称, 返回 {name: (平假名, 罗马字)}'''
+        unique = dict.fromkeys(names)
+        with self._lock:
+            found = {n: self._cache[n] for n in unique if n in self._cache}
+            for n in found:
+                self._cache.move_to_end(n)
+        missing = [n for n in unique if n not in found]
+        converted = {n: self._convert(n) for n in missing}
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+            for n, value in converted.items():
+                self._cache[n] = value
+                self._cache.move_to_end(n)
+                if len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False) # 淘汰最久未使用的
+        found.update(converted)
+        return found
+
+    def normalize(self, name):
+        return self.readings(name)[0]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+normalizer = KanaNormalizer()
+
 def normalize(name):
-    res=''
-    for item in kks.convert(name):
-        res+=item['hira']
-    return res
+    return normalizer.normalize(name)
+
+def readings(name):
+    '''(平假名, 罗马字)'''
+    return normalizer.readings(name)
@@ -0,0 +1,151 @@
+import re
+import json
+import unicodedata
+
+import jaconv
+
+# 车站名检索: 每个车站组 (station_g_cd) 的每个站名一行, 读音由构建的 readings 阶段填充
+# (ekidata station_name_k 优先, 缺失时由 pykakasi 生成). 前缀匹配走普通索引, 3 字以上的子串匹配走 FTS5 trigram.
+SEARCH_SCHEMA = (
+    '''
+    CREATE TABLE station_search (
+        id INTEGER PRIMARY KEY,
+        name TEXT,
+        name_key TEXT,
+        reading TEXT,
+        romaji TEXT,
+        station_g_cd INTEGER,
+        station_cds TEXT,
+        lines TEXT,
+        lon REAL,
+        lat REAL,
+        weight INTEGER
+    )
+    ''',
+    "CREATE INDEX idx_station_search_name ON station_search (name_key)",
+    "CREATE INDEX idx_station_search_reading ON station_search (reading)",
+    "CREATE INDEX idx_station_search_romaji ON station_search (romaji)",
+    '''
+    CREATE VIRTUAL TABLE station_fts USING fts5(
+        name_key, reading, romaji,
+        content='station_search', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+)
+
+TRIGRAM_MIN = 3 # trigram 分词器无法匹配更短的子串
+CANDIDATES = 200 # 每种匹配方式取出的候选上限, 再统一排序
+
+# 匹配类型, 越小越靠前
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+def fold(text):
+    '''检索用的规范形式: NFKC (全角英数 -> 半角), 小写, 片假名 -> 平假名, 去掉空白'''
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    return re.sub(r'\s+', '', jaconv.kata2hira(text))
+
+def fold_romaji(text):
+    '''罗马字只保留字母数字, 长音统一 (toukyou / tōkyō / tokyo 视为相同)'''
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    text = re.sub(r'[^a-z0-9]', '', text)
+    return text.replace('ou', 'o').replace('oo', 'o').replace('uu', 'u')
+
+def build_entries(companies):
+    '''由构建结果生成 station_search 的行, 同名车站按车站组合并. 读音取 readings 阶段的结果'''
+    entries = {}
+    for c in companies:
+        for l in c.lineList:
+            for s in l.stations:
+                gid = s.group.id if s.group else s.gid
+                key = (gid, s.name)
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = {
+                        "name": s.name, "g_cd": gid, "cds": [], "lines": [],
+                        "reading": s.reading, "romaji": s.romaji, "xs": [], "ys": []
+                    }
+                if s.id not in entry["cds"]:
+                    entry["cds"].append(s.id)
+                entry["lines"].append([c.id, l.name])
+                entry["xs"].append(s.location.x)
+                entry["ys"].append(s.location.y)
+
+    rows = []
+    for n, entry in enumerate(entries.values(), 1):
+        rows.append((
+            n, entry["name"], fold(entry["name"]), fold(entry["reading"]), fold_romaji(entry["romaji"]), entry["g_cd"],
+            json.dumps(entry["cds"]), json.dumps(entry["lines"], ensure_ascii=False),
+            sum(entry["xs"]) / len(entry["xs"]), sum(entry["ys"]) / len(entry["ys"]),
+            len(entry["lines"])
+        ))
+    return rows
+
+def write_index(cursor, rows):
+    for sql in SEARCH_SCHEMA:
+        cursor.execute(sql)
+    cursor.executemany("INSERT INTO station_search VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    cursor.execute("INSERT INTO station_fts(station_fts) VALUES ('rebuild')")
+
+def _upper_bound(prefix):
+    '''前缀的字典序上界: 最后一个字符加一'''
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def search(conn, query, limit=10):
+    '''
+    conn: railway.db 的连接. 返回按 (完全匹配 > 前缀 > 子串, 站名 > 读音 > 罗马字, 线路数多) 排序的车站组.
+    同一车站组只返回排名最高的一条.
+    '''
+    text = fold(query)
+    roma = fold_romaji(query)
+    if not text:
+        return []
+
+    # (列, 该列上的检索词); 罗马字列用罗马字形式
+    columns = [("name_key", text), ("reading", text)]
+    if roma:
+        columns.append(("romaji", roma))
+
+    candidates = {} # id -> (match, column_rank)
+    for rank, (column, term) in enumerate(columns):
+        for (rowid, value) in conn.execute(
+                f"SELECT id, {column} FROM station_search WHERE {column} >= ? AND {column} < ? LIMIT ?",
+                (term, _upper_bound(term), CANDIDATES)):
+            match = EXACT if value == term else PREFIX
+            if (match, rank) < candidates.get(rowid, (SUBSTRING + 1, 0)):
+                candidates[rowid] = (match, rank)
+
+        if len(term) >= TRIGRAM_MIN:
+            phrase = '"' + term.replace('"', '""') + '"'
+            rows = conn.execute(f"SELECT rowid FROM station_fts WHERE {column} MATCH ? LIMIT ?", (phrase, CANDIDATES))
+        else:
+            # 短于 3 字时 trigram 无法使用, 直接扫描 (约 1 万行, 毫秒级)
+            rows = conn.execute(f"SELECT id FROM station_search WHERE instr({column}, ?) > 0 LIMIT ?", (term, CANDIDATES))
+        for (rowid,) in rows:
+            if (SUBSTRING, rank) < candidates.get(rowid, (SUBSTRING + 1, 0)):
+                candidates[rowid] = (SUBSTRING, rank)
+
+    if not candidates:
+        return []
+    ids = list(candidates)
+    placeholders = ",".join("?" * len(ids))
+    rows = conn.execute(
+        f"SELECT id, name, reading, romaji, station_g_cd, station_cds, lines, lon, lat, weight FROM station_search WHERE id IN ({placeholders})",
+        ids
+    ).fetchall()
+
+    rows.sort(key=lambda r: (*candidates[r[0]], -r[9], len(r[1]), r[0]))
+    results = []
+    seen = set()
+    for rowid, name, reading, romaji, g_cd, cds, lines, lon, lat, weight in rows:
+        if g_cd in seen:
+            continue
+        seen.add(g_cd)
+        results.append({
+            "name": name, "reading": reading, "romaji": romaji,
+            "station_g_cd": g_cd, "station_cds": json.loads(cds), "lines": json.loads(lines),
+            "lon": lon, "lat": lat,
+            "match": ("exact", "prefix", "substring")[candidates[rowid][0]],
+        })
+        if len(results) >= limit:
+            break
+    return results
@@ -6,26 +6,111 @@ import webview
 import time
 import socket
 import threading
-from flask import Flask, render_template, request
+import queue
+from collections import deque
+from flask import Flask, Response, render_template, request
 
-#from railway_processer import router as api_router # 引入api路由蓝图
-from api import Api
+from railway_api import router as api_router, get_pool # 只读数据接口蓝图
+from api import Api, feed
 from worker_manager import manager, WorkerRegistry
+from metrics import registry as metrics_registry
+import log_setup
+from static_assets import register_static, precompress
+from vector_tiles import read_tile, tiles_path_for
+from line_pyramid import query_lines, level_for_zoom
 
 index=r".\..\dist\index.html"
 base_dir = os.path.dirname(os.path.abspath(__file__))
 dist_dir = os.path.join(base_dir, '..', 'dist')
 
-app = Flask(__name__, static_folder=dist_dir, template_folder=dist_dir, static_url_path='')
-#app.register_blueprint(api_router, url_prefix='/api')
+# 静态文件由 register_static 发送: 预压缩变体 / 强 ETag / 哈希文件永久缓存
+app = Flask(__name__, static_folder=None, template_folder=dist_dir)
+register_static(app, dist_dir)
+app.register_blueprint(api_router, url_prefix='/api')
+
+# 请求日志按比例采样, 错误响应总是记录
+REQUEST_LOG_SAMPLE = int(os.environ.get('RAILROUND_REQUEST_LOG_SAMPLE', '20'))
+http_logger = logging.getLogger("Http")
+_request_count = 0
+_request_count_lock = threading.Lock() # threaded=True, 请求在多个线程中处理
 
 # ./路由
-@app.before_request
-def log_request_info():
-    # Flask debug
-    if not request.path.endswith('.js') and not request.path.endswith('.css'):
-        print(f"[Dev] 网络请求: {request.method} {request.path}")
+@app.after_request
+def log_request_info(response):
+    global _request_count
+    with _request_count_lock:
+        _request_count += 1
+        count = _request_count
+    if response.status_code >= 400 or count % REQUEST_LOG_SAMPLE == 1:
+        http_logger.info(f"[Dev] 网络请求 #{count}: {request.method} {request.path} -> {response.status_code}")
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.pbf')
+def tile(z, x, y):
+    """由构建生成的 MBTiles 读取矢量瓦片 (gzip 压缩的 pbf), 无数据时返回 204"""
+    builds = manager.get_workers_by_type("build")
+    data = read_tile(tiles_path_for(builds[0].db_path), z, x, y) if builds else None
+    if data is None:
+        return Response(status=204)
+    response = Response(data, mimetype='application/vnd.mapbox-vector-tile')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/lines.geojson')
+def lines():
+    """?zoom=&company=&bbox=min_lon,min_lat,max_lon,max_lat, 低缩放级别返回化简后的几何"""
+    builds = manager.get_workers_by_type("build")
+    pool = get_pool(builds[0].db_path) if builds else None
+    if pool is None or pool.refresh() is None:
+        return Response(status=204)
+    try:
+        zoom = request.args.get('zoom', type=float)
+        bbox = request.args.get('bbox')
+        bbox = tuple(float(v) for v in bbox.split(',')) if bbox else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError(bbox)
+    except ValueError:
+        return Response("invalid bbox", status=400)
+    with pool.connection() as conn:
+        body = query_lines(conn, level_for_zoom(zoom), request.args.get('company'), bbox)
+    response = Response(body, mimetype='application/geo+json')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/events/workers')
+def worker_events():
+    """SSE: 先发送完整快照, 之后只推送差分"""
+    updates = queue.Queue(maxsize=64)
+
+    def on_change(payload):
+        try:
+            updates.put_nowait(payload)
+        except queue.Full:
+            pass # 客户端落后, 由 version 跳号触发重新同步
 
+    def stream():
+        feed.subscribe(on_change) # 先订阅再取快照, 避免遗漏
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(feed.snapshot(), ensure_ascii=False, default=str)}\n\n"
+            while True:
+                try:
+                    payload = updates.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {payload['version']}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+        finally:
+            feed.unsubscribe(on_change)
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/')
 
@@ -45,31 +130,33 @@ def wait_for_server(port=5000, timeout=5):
     return False
 
 class WebviewHandler(logging.Handler):
-    
-    def __init__(self):
+    """
+    将日志推送到前端控制台.
+    emit 只把格式化后的记录放入定长 deque (满时丢弃最旧的), 从不等待 webview;
+    单独的分发线程按固定帧率把积压记录打包成一次 evaluate_js.
+    积压超过单批上限时保留全部 WARNING 以上记录和最新的普通记录, 其余合并为一条省略提示.
+    """
+    def __init__(self, capacity=2000, max_batch=200, frame_interval=0.1):
         super().__init__()
         self._window = None
-        self.queue = []      # 日志缓冲区, 解决 Flask 加载完成前的死锁问题
+        self.queue = deque(maxlen=capacity) # 日志缓冲区, 前端加载完成前同样在此积压
+        self.max_batch = max_batch
+        self.frame_interval = frame_interval # 推送间隔 (秒), 即最高 10 批/秒
+        self.dropped = 0 # 缓冲区满被丢弃的记录数
         self.is_ready = False # 前端加载
+        self._wake = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="WebviewLogDispatcher", daemon=True)
+        self._dispatcher.start()
 
     def set_window(self, window):
         self._window = window
         self._window.events.loaded += self.on_loaded
         self._window.events.closed += self.on_closed
-        
-    def flush_queue(self):
-        """将缓冲区推送到前端"""
-        if not self._window or not self.is_ready: return
-        
-        # 批量处理以提高性能
-        while self.queue:
-            record = self.queue.pop(0)
-            self._send_to_js(record)
 
     def on_loaded(self):
         self.is_ready = True
         print(f"[System] 前端已加载. 处理 {len(self.queue)} 条log...")
-        self.flush_queue()
+        self._wake.set()
         
     def on_closed(self):
         """
@@ -78,26 +165,65 @@ class WebviewHandler(logging.Handler):
         print("[System] 安全终止线程中.")
         self._window = None
         self.is_ready = False
-    
-    def _send_to_js(self, record):
-        if self._window:
-            # 获取日志文本
-            msg = self.format(record)
-            js_msg = json.dumps(msg)
-            msg_type = record.levelname
-            js_code = f"addLog('{msg_type}', '{js_msg}');"
+
+    def _take_batch(self):
+        """取出当前积压; 超过单批上限时摘要"""
+        records = []
+        while self.queue:
+            try:
+                records.append(self.queue.popleft())
+            except IndexError:
+                break
+        dropped, self.dropped = self.dropped, 0
+
+        if len(records) > self.max_batch:
+            important = [r for r in records if r[2] >= logging.WARNING][-self.max_batch // 2:]
+            normal = [r for r in records if r[2] < logging.WARNING][-(self.max_batch - len(important)):]
+            kept = sorted(important + normal, key=lambda r: r[3])
+            dropped += len(records) - len(kept)
+            records = kept
+
+        batch = [[levelname, msg] for levelname, msg, _, _ in records]
+        if dropped:
+            batch.insert(0, ["WARNING", f"[日志] 输出过快, 已省略 {dropped} 条"])
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._window or not self.is_ready:
+                continue # 前端就绪后由 on_loaded 唤醒
+
+            batch = self._take_batch()
+            if batch:
+                self._send_to_js(batch)
+            # 限制帧率, 间隔内的新日志合并到下一批
+            time.sleep(self.frame_interval)
+            if self.queue:
+                self._wake.set()
+
+    def _send_to_js(self, batch):
+        window = self._window
+        if window:
+            js_batch = json.dumps(batch, ensure_ascii=False)
             try:
-                self._window.evaluate_js(js_code)
+                window.evaluate_js(f"window.addLogBatch && window.addLogBatch({js_batch});")
             except Exception:
                 pass
             
     def emit(self, record):
         if record.name.startswith('pywebview') or record.name == 'werkzeug': 
             return
-        if not self.is_ready:
-            self.queue.append(record)
-        else:
-            self._send_to_js(record)
+        try:
+            msg = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((record.levelname, msg, record.levelno, record.created))
+        self._wake.set()
 
 #配置
 logger = logging.getLogger()
@@ -116,6 +242,19 @@ webview_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 logger.addHandler(webview_handler)
 frontend_logger.addHandler(python_handler)
 
+def create_workers(m):
+    '''创建爬取 Worker 与流水线阶段, 只读接口使用构建 Worker 的数据库'''
+    if not m.get_worker('GeojsonWorker'):
+        m.create_worker('geojson', 'GeojsonWorker', period=3600)
+
+    if not m.get_worker('EkidataWorker'):
+        m.create_worker('ekidata', 'EkidataWorker', period=3600)
+
+    # 流水线阶段, 由上游完成触发
+    m.create_worker('ekidata_delta', 'EkidataDeltaWorker')
+    build = m.create_worker('build', 'RailwayBuildWorker')
+    app.config['RAILWAY_DB'] = build.db_path
+    return build
 
 #模拟
 def run(window):
@@ -123,19 +262,19 @@ def run(window):
 
 #程序启动
 if __name__ == '__main__':
+    # Worker / 构建日志经队列由后台线程写入 logs/ (轮转), 级别可用 RAILROUND_LOG_LEVELS 覆盖
+    log_setup.configure()
 
-    # Initialize workers
-    if not manager.get_worker('geojson'):
-        manager.create_worker('geojson', 'GeojsonWorker', period=3600)
-
-    if not manager.get_worker('ekidata'):
-        manager.create_worker('ekidata', 'EkidataWorker', period=3600)
+    create_workers(manager)
 
     # Start manager loop
     t_manager = threading.Thread(target=manager.loop)
     t_manager.daemon = True
     t_manager.start()
 
+    # 预压缩前端构建产物 (已是最新时跳过), 不阻塞启动
+    threading.Thread(target=precompress, args=(dist_dir,), daemon=True).start()
+
     api_instance = Api()
     t = threading.Thread(target=start)
     t.daemon = True # 守护线程, 自动销毁
@@ -0,0 +1,61 @@
+import importlib.util
+import json
+import sqlite3
+import os
+
+from event_scheduler import VirtualClock
+from worker_manager import WorkerManager
+
+def _load_app():
+    '''以独立模块名加载 test.py (与标准库 test 包同名)'''
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.py")
+    spec = importlib.util.spec_from_file_location("railway_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def test_app_wiring_boots(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path) # Worker 在当前目录下创建输出目录
+    app_module = _load_app()
+    m = WorkerManager(clock=VirtualClock(start=1000.0))
+    build = app_module.create_workers(m)
+
+    assert build is m.get_worker('RailwayBuildWorker')
+    assert {w.name for w in m.get_all_workers()} == {'GeojsonWorker', 'EkidataWorker', 'EkidataDeltaWorker', 'RailwayBuildWorker'}
+    assert app_module.app.config['RAILWAY_DB'] == build.db_path
+
+    client = app_module.app.test_client()
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/api/companies').status_code == 503 # 尚未构建
+
+def test_lines_on_db_without_pyramid(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app_module = _load_app()
+    m = WorkerManager(clock=VirtualClock(start=1000.0))
+    build = app_module.create_workers(m)
+    monkeypatch.setattr(app_module, "manager", m)
+
+    # line_geometry 表出现之前构建的库
+    conn = sqlite3.connect(build.db_path)
+    conn.execute("CREATE TABLE lines (company_id TEXT, name TEXT, type TEXT, line_cd INTEGER, stroke TEXT, stroke_width REAL)")
+    conn.commit()
+    conn.close()
+
+    response = app_module.app.test_client().get('/lines.geojson?zoom=5')
+    assert response.status_code == 200
+    assert json.loads(response.data)["features"] == []
+
+def test_tile_without_tiles_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app_module = _load_app()
+    m = WorkerManager(clock=VirtualClock(start=1000.0))
+    build = app_module.create_workers(m)
+    monkeypatch.setattr(app_module, "manager", m)
+
+    # 瓦片功能之前的构建: 瓦片库中没有 tiles 表
+    conn = sqlite3.connect(app_module.tiles_path_for(build.db_path))
+    conn.execute("CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT)")
+    conn.commit()
+    conn.close()
+
+    assert app_module.app.test_client().get('/tiles/10/909/403.pbf').status_code == 204
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from event_scheduler import VirtualClock
+from worker_manager import WorkerManager
+from dashboard_feed import DashboardFeed
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def _progress(push, name):
+    return push['changes'].get(name, {}).get('progress', {}).get('current')
+
+@pytest.fixture
+def feed(registry):
+    '''推送间隔 0.1s, 由 VirtualClock 驱动; 返回 (manager, feed, clock, pushed)'''
+    m = WorkerManager(clock=VirtualClock(start=1000.0))
+    clock = VirtualClock(start=1000.0)
+    feed = DashboardFeed(m, min_interval=0.1, clock=clock)
+    pushed = []
+    feed.subscribe(pushed.append)
+    return m, feed, clock, pushed
+
+def test_dashboard_feed_pushes_coalesced_diffs(feed):
+    m, feed, clock, pushed = feed
+    worker = m.create_worker("counting", "feed_counter", period=3600)
+    assert _wait_for(lambda: pushed)
+    assert pushed[0]['changes']['feed_counter']['status_code'] == 0 # 首次推送完整视图
+
+    worker.tracker.start(100)
+    for _ in range(100):
+        worker.tracker.increment()
+    # 间隔未到时不推送
+    time.sleep(0.05)
+    assert len(pushed) == 1
+
+    # 100 次变化合并为一次推送, 且只包含变化的字段
+    clock.advance(0.1)
+    assert _wait_for(lambda: len(pushed) == 2)
+    assert _progress(pushed[-1], 'feed_counter') == 100
+    assert set(pushed[-1]['changes']['feed_counter']) <= {'progress', 'last_update_ts'}
+    assert [p['version'] for p in pushed] == [1, 2]
+
+    # 无变化时不推送
+    clock.advance(1.0)
+    time.sleep(0.05)
+    assert len(pushed) == 2
+
+def test_dashboard_feed_rate_limits_continuous_changes(feed):
+    m, feed, clock, pushed = feed
+    worker = m.create_worker("counting", "busy_counter", period=3600)
+    assert _wait_for(lambda: pushed)
+
+    # 持续变化时每个间隔最多推送一次
+    worker.tracker.start(500)
+    for i in range(5):
+        for _ in range(100):
+            worker.tracker.increment()
+        clock.advance(0.1)
+        assert _wait_for(lambda: _progress(pushed[-1], 'busy_counter') == (i + 1) * 100)
+        assert len(pushed) == i + 2
@@ -0,0 +1,83 @@
+import threading
+import http.server
+from urllib.parse import parse_qs
+
+from ekidata_crawler import EkidataWorker
+from ekidata_auth import FormAuthProvider
+
+LOGIN_PAGE = '''<form method="post" action="/dl/">
+<input type="hidden" name="m" value="login">
+<input name="ac"><input type="password" name="ps"><input type="submit" value="login">
+</form>'''
+LIST_PAGE = '<a href="f.php?t=5&d=20251211">station</a>'
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    '''模拟 ekidata 登录: POST 正确账号后下发 sid Cookie'''
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.valid_sids = set()
+        self.logins = 0
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def _reply(self, body, cookie=None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if cookie:
+            self.send_header('Set-Cookie', cookie)
+        self.end_headers()
+        self.wfile.write(body.encode('utf-8'))
+
+    def do_GET(self):
+        cookie = self.headers.get('Cookie', '')
+        authed = any(f"sid={sid}" in cookie for sid in self.server.valid_sids)
+        self._reply(LIST_PAGE if authed else LOGIN_PAGE)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        if form.get('ac') == [EkidataWorker.USERNAME] and form.get('m') == ['login']:
+            self.server.logins += 1
+            sid = f"sid-{self.server.logins}"
+            self.server.valid_sids.add(sid)
+            self._reply(LIST_PAGE, cookie=f'sid={sid}; Path=/; Max-Age=3600')
+        else:
+            self._reply(LOGIN_PAGE)
+
+    def log_message(self, *args):
+        pass
+
+def _make_worker(server, name):
+    w = EkidataWorker(name, 3600, auth_provider=FormAuthProvider())
+    w.LOGIN_URL = f"{server.base}/dl/"
+    w.TARGET_URL = f"{server.base}/dl/?p=1"
+    return w
+
+def test_session_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(EkidataWorker, 'DOWNLOAD_DIR', str(tmp_path / 'downloads'))
+
+    server = StandInServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        # 1. 无缓存: 表单登录并写入缓存
+        resp = _make_worker(server, 'auth1')._open_target()
+        assert 'f.php' in resp.text
+        assert server.logins == 1
+
+        # 2. 新实例复用磁盘缓存, 不再登录
+        resp = _make_worker(server, 'auth2')._open_target()
+        assert 'f.php' in resp.text
+        assert server.logins == 1
+
+        # 3. 服务端使会话失效后, 重新登录
+        server.valid_sids.clear()
+        resp = _make_worker(server, 'auth3')._open_target()
+        assert 'f.php' in resp.text
+        assert server.logins == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,36 @@
+from ekidata_delta import diff_csv, ingest, latest_csv, EkidataDelta
+
+HEADER = "station_cd,station_g_cd,station_name,line_cd\n"
+
+def _write(path, rows):
+    path.write_text(HEADER + "".join(f"{r}\n" for r in rows), encoding='utf-8')
+    return str(path)
+
+def test_diff_csv(tmp_path):
+    old = _write(tmp_path / "station20250101free.csv", ["1,1,函館,11101", "2,2,五稜郭,11101", "3,3,桔梗,11101"])
+    new = _write(tmp_path / "station20250201free.csv", ["1,1,函館,11101", "2,2,五稜郭駅,11101", "4,4,大中山,11102"])
+
+    d = diff_csv(old, new, 'station_cd')
+    assert [r['station_cd'] for r in d['added']] == ['4']
+    assert [r['station_cd'] for r in d['removed']] == ['3']
+    assert [c['after']['station_name'] for c in d['changed']] == ['五稜郭駅']
+
+def test_ingest(tmp_path):
+    download_dir = tmp_path / "downloads"
+    ekidata_dir = tmp_path / "ekidata"
+    download_dir.mkdir()
+    ekidata_dir.mkdir()
+    _write(ekidata_dir / "station20250101free.csv", ["1,1,函館,11101", "2,2,五稜郭,11101"])
+    _write(download_dir / "station20250201free.csv", ["1,1,函館,11101", "3,3,桔梗,11103"])
+
+    delta = ingest(str(download_dir), str(ekidata_dir))
+    assert latest_csv(str(ekidata_dir), 'station').endswith("station20250201free.csv")
+    assert delta.affected_line_cds() == {11101, 11103}
+
+    # 已是最新版本时生成空差分, 且保留未应用的上一个差分
+    delta = ingest(str(download_dir), str(ekidata_dir))
+    assert delta.affected_line_cds() == {11101, 11103}
+    delta.applied = True
+    delta.save(str(ekidata_dir / "delta.json"))
+    assert ingest(str(download_dir), str(ekidata_dir)).is_empty()
+    assert not EkidataDelta.load(str(ekidata_dir / "delta.json")).applied
@@ -0,0 +1,56 @@
+import time
+import threading
+
+from event_scheduler import EventScheduler, VirtualClock
+from worker_manager import WorkerManager
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_event_scheduler_order():
+    clock = VirtualClock()
+    s = EventScheduler(clock)
+    s.schedule('a', 30)
+    s.schedule('b', 10)
+    s.schedule('a', 20) # 覆盖旧截止时间
+    assert s.next_deadline() == 10
+    clock.advance(25)
+    assert s.pop_due() == ['b', 'a']
+    assert s.next_deadline() is None
+
+def test_manager_virtual_clock(registry):
+    clock = VirtualClock(start=1000.0)
+    m = WorkerManager(clock=clock)
+    worker = m.create_worker("counting", "sched_counter", period=3600)
+
+    t = threading.Thread(target=m.loop, daemon=True)
+    t.start()
+    try:
+        # 创建即到期
+        assert _wait_for(lambda: worker.runs == 1 and worker.status['statcode'] == 200)
+        assert worker.status['nextrun'] == 1000.0 + 3600
+
+        # 未到期不运行, 到期后立即运行
+        clock.advance(3599)
+        time.sleep(0.05)
+        assert worker.runs == 1
+        clock.advance(1)
+        assert _wait_for(lambda: worker.runs == 2 and worker.status['statcode'] == 200)
+        assert worker.status['nextrun'] == clock.time() + 3600
+
+        # 手动启动立即唤醒
+        assert m.start_worker("sched_counter")
+        assert _wait_for(lambda: worker.runs == 3 and worker.status['statcode'] == 200)
+        assert worker.status['nextrun'] == clock.time() + 3600
+
+        # 修改周期后按新周期重新排程
+        m.set_worker_period("sched_counter", 7200)
+        assert worker.status['nextrun'] == clock.time() + 7200
+    finally:
+        m.stop()
+        t.join(timeout=2)
@@ -0,0 +1,48 @@
+import json
+import sqlite3
+from types import SimpleNamespace
+
+from line_pyramid import LEVELS, build_pyramid, level_for_zoom, query_lines, write_pyramid
+
+def _company(cid, name, coords):
+    line = SimpleNamespace(name=name, rawGeometry=coords)
+    return SimpleNamespace(id=cid, lineList=[line])
+
+def _zigzag_segments(x0, y0, n=400):
+    '''首尾相接的细碎分段 (与爬取数据相同的形式), 带微小抖动'''
+    pts = [(x0 + i * 0.001, y0 + (0.00001 if i % 2 else 0)) for i in range(n)]
+    return [[pts[i], pts[i + 1]] for i in range(n - 1)]
+
+def test_pyramid_levels_and_queries(tmp_path):
+    db = str(tmp_path / "railway.db")
+    companies = [_company("東京", "山手線", _zigzag_segments(139.5, 35.6)),
+                 _company("大阪", "環状線", _zigzag_segments(135.3, 34.6))]
+    rows = build_pyramid(companies)
+    assert len(rows) == 2 * len(LEVELS)
+
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE lines (company_id TEXT, name TEXT, type TEXT, line_cd INTEGER, stroke TEXT, stroke_width REAL)")
+    conn.execute("INSERT INTO lines VALUES ('東京', '山手線', 'line', 11302, '#80c241', 2)")
+    write_pyramid(conn.cursor(), rows)
+    conn.commit()
+
+    full = json.loads(query_lines(conn, 0, company_id="東京"))
+    coarse = json.loads(query_lines(conn, level_for_zoom(5), company_id="東京"))
+    n_full = sum(len(p) for p in full["features"][0]["geometry"]["coordinates"])
+    coarse_geom = coarse["features"][0]["geometry"]
+    # 分段被合并, 抖动被化简, 端点保留
+    assert coarse_geom["type"] == "LineString"
+    assert len(coarse_geom["coordinates"]) < n_full / 10
+    assert coarse_geom["coordinates"][0] == [139.5, 35.6]
+    assert coarse["features"][0]["properties"]["line_cd"] == 11302
+
+    hits = json.loads(query_lines(conn, 2, bbox=(135.0, 34.0, 136.0, 35.0)))
+    assert [f["properties"]["company"] for f in hits["features"]] == ["大阪"]
+    conn.close()
+    assert level_for_zoom(None) == 0 and level_for_zoom(14) == 0 and level_for_zoom(3) == LEVELS[-1][0]
+
+def test_query_lines_without_pyramid():
+    '''line_geometry 表出现之前构建的库'''
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE lines (company_id TEXT, name TEXT, type TEXT, line_cd INTEGER, stroke TEXT, stroke_width REAL)")
+    assert json.loads(query_lines(conn, 0))["features"] == []
@@ -0,0 +1,46 @@
+import json
+import queue
+import logging
+
+from log_setup import RotatingFileRouter, JsonLinesFormatter, ExcQueueHandler, get_logger
+
+def _record(name, msg):
+    return logging.LogRecord(name, logging.INFO, __file__, 1, msg, None, None)
+
+def test_router_rotates_per_logger(tmp_path):
+    router = RotatingFileRouter(str(tmp_path), max_bytes=300, backup_count=2)
+    router.setFormatter(JsonLinesFormatter())
+    for i in range(20):
+        router.handle(_record("Worker.geojson", f"line {i}"))
+    router.handle(_record("Build.railway_processer", "built"))
+    router.handle(_record("werkzeug", "GET /"))
+    router.close()
+
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names == ["app.log", "build.log", "geojson.log", "geojson.log.1", "geojson.log.2"]
+    last = json.loads((tmp_path / "geojson.log").read_text(encoding='utf-8').splitlines()[-1])
+    assert last["message"] == "line 19" and last["logger"] == "Worker.geojson"
+
+def test_exception_survives_queue():
+    q = queue.SimpleQueue()
+    logger = logging.getLogger("Worker.exc_test")
+    logger.propagate = False
+    handler = ExcQueueHandler(q)
+    logger.addHandler(handler)
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.exception("failed %s", "run")
+    finally:
+        logger.removeHandler(handler)
+
+    entry = json.loads(JsonLinesFormatter().format(q.get_nowait()))
+    assert entry["message"] == "failed run"
+    assert "ZeroDivisionError" in entry["exc"]
+
+def test_get_logger_does_not_configure():
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    get_logger("Worker.plain")
+    assert root.handlers == handlers
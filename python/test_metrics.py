@@ -0,0 +1,21 @@
+from metrics import MetricsRegistry
+
+def test_render_prometheus_text():
+    reg = MetricsRegistry()
+    runs = reg.histogram('test_run_seconds', 'run time', ('worker',), buckets=(0.1, 1.0))
+    hits = reg.counter('test_cache_total', 'cache', ('result',))
+    runs.observe(0.05, worker='a')
+    runs.observe(0.5, worker='a')
+    hits.inc(result='hit')
+    hits.inc(2, result='hit')
+
+    text = reg.render()
+    assert '# TYPE test_run_seconds histogram' in text
+    assert 'test_run_seconds_bucket{worker="a",le="0.1"} 1' in text
+    assert 'test_run_seconds_bucket{worker="a",le="+Inf"} 2' in text
+    assert 'test_run_seconds_count{worker="a"} 2' in text
+    assert 'test_cache_total{result="hit"} 3' in text
+
+    # 同名重复注册返回同一实例
+    assert reg.counter('test_cache_total', labels=('result',)) is hits
+    assert reg.snapshot()['test_cache_total']['values'] == {'hit': 3}
@@ -0,0 +1,93 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from event_scheduler import VirtualClock
+from worker_manager import WorkerManager
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def pipeline(registry):
+    '''两个源头 -> 一个阶段. 每个测试使用新定义的类, 类属性 (fail / inputs) 不在测试间共享'''
+    counting = registry.get_cls("counting")
+
+    class SourceA(counting):
+        pass
+
+    class SourceB(counting):
+        fail = False
+
+        def trigger(self):
+            time.sleep(0.05)
+            if SourceB.fail:
+                raise RuntimeError("upstream failed")
+            return super().trigger()
+
+    class Stage(counting):
+        inputs = "v1"
+
+        def input_fingerprint(self):
+            return Stage.inputs
+
+    registry.register("dag_src_a", SourceA)
+    registry.register("dag_src_b", SourceB)
+    registry.register("dag_stage", Stage, after=["dag_src_a", "dag_src_b"])
+    return SimpleNamespace(SourceB=SourceB, Stage=Stage)
+
+@pytest.fixture
+def manager():
+    m = WorkerManager(clock=VirtualClock(start=1000.0))
+    t = threading.Thread(target=m.loop, daemon=True)
+    yield m, t
+    m.stop()
+    t.join(timeout=2)
+
+def test_pipeline_dag(pipeline, manager):
+    m, t = manager
+    a = m.create_worker("dag_src_a", "dag_a", period=3600)
+    b = m.create_worker("dag_src_b", "dag_b", period=3600)
+    stage = m.create_worker("dag_stage", "dag_stage", period=3600)
+    t.start()
+
+    # 上游并行运行, 全部完成后阶段才运行一次
+    assert _wait_for(lambda: stage.runs == 1 and stage.status['statcode'] == 200)
+    assert stage.status['lastrun'] >= b.status['lastfinish']
+
+    # 输入未变: 新周期中阶段被跳过, 并报告关键路径
+    m.start_full_cycle()
+    assert _wait_for(lambda: not m.cycle_active)
+    assert stage.status['skipped'] and stage.runs == 1
+    path = [p['name'] for p in m.last_cycle_report['critical_path']]
+    assert path == ["dag_b", "dag_stage"]
+
+    # 输入变化后重新运行
+    pipeline.Stage.inputs = "v2"
+    m.start_full_cycle()
+    assert _wait_for(lambda: not m.cycle_active)
+    assert stage.runs == 2 and not stage.status['skipped']
+
+def test_failed_upstream_does_not_trigger_stage(pipeline, manager):
+    m, t = manager
+    m.create_worker("dag_src_a", "dag_a", period=3600)
+    b = m.create_worker("dag_src_b", "dag_b", period=3600)
+    stage = m.create_worker("dag_stage", "dag_stage", period=3600)
+    t.start()
+    assert _wait_for(lambda: stage.runs == 1 and not m.cycle_active)
+
+    # 上游重试用尽后失败: 阶段不以旧输入运行
+    pipeline.SourceB.fail = True
+    pipeline.Stage.inputs = "v2"
+    m.start_full_cycle()
+    assert _wait_for(lambda: b.status['statcode'] == 500 and b.status['retry'] >= b.max_retry
+                     and not m.cycle_active)
+    time.sleep(0.05)
+    assert stage.runs == 1 and stage.status['lastrun'] < b.status['lastfinish']
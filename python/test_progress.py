@@ -0,0 +1,42 @@
+import threading
+
+from worker_base import ProgressTracker
+
+def test_concurrent_increment_and_window():
+    tracker = ProgressTracker(window=64)
+    tracker.start(800, "run")
+
+    def fetch():
+        for _ in range(100):
+            tracker.increment(latency=0.01)
+
+    threads = [threading.Thread(target=fetch) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    view = tracker.get_view_model()
+    assert view['current'] == 800
+    assert len(tracker._events) == 64 # 环形缓冲有界
+    assert view['latency_p50'] == view['latency_p95'] == 0.01
+    assert view['eta_seconds'] == 0 and not view['is_active']
+
+def test_estimated_total_and_phases():
+    tracker = ProgressTracker()
+    tracker.start(0, "run", units=4)
+    tracker.phase("company-a")
+    tracker.add_to_total(10) # 4 个单元中第 1 个有 10 项
+    for _ in range(5):
+        tracker.increment()
+
+    view = tracker.get_view_model()
+    assert view['total'] == 40 and view['total_estimated']
+    assert view['percent'] == 12.5
+    assert view['phases'][0]['name'] == "company-a" and view['phases'][0]['count'] == 5
+    assert view['latency_p50'] == view['latency_p95'] == 0.0 # 未计时的增量不作为单项耗时
+
+    for _ in range(3):
+        tracker.add_to_total(10)
+    view = tracker.get_view_model()
+    assert view['total'] == 40 and not view['total_estimated']
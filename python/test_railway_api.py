@@ -0,0 +1,59 @@
+import os
+import json
+import sqlite3
+
+from flask import Flask
+
+from railway_api import router
+
+def _make_db(path, companies=5):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE companies (id TEXT PRIMARY KEY, region TEXT, type TEXT, cd INTEGER, rr INTEGER)")
+    conn.execute("CREATE TABLE lines (company_id TEXT, name TEXT, type TEXT, line_cd INTEGER, is_mock INTEGER, stroke TEXT, stroke_width REAL)")
+    conn.execute("CREATE TABLE stations (company_id TEXT, line_name TEXT, line_cd INTEGER, name TEXT, station_cd INTEGER, station_g_cd INTEGER, is_mock INTEGER, location_x REAL, location_y REAL, transfers TEXT, reading TEXT, romaji TEXT)")
+    for i in range(companies):
+        conn.execute("INSERT INTO companies VALUES (?, '関東', 'private', ?, 0)", (f"c{i}", i))
+    conn.execute("INSERT INTO lines VALUES ('c0', '本線', 'line', 100, 0, '#000', 2)")
+    conn.execute("INSERT INTO stations VALUES ('c0', '本線', 100, '東京', 1, 1, 0, 139.76, 35.68, '[\"JR\"]', 'とうきょう', 'toukyou')")
+    conn.execute("INSERT INTO stations VALUES ('c1', '支線', 200, '東京', 2, 1, 0, 139.77, 35.68, '[]', 'とうきょう', 'toukyou')")
+    conn.commit()
+    conn.close()
+
+def _client(tmp_path):
+    db = str(tmp_path / "railway.db")
+    _make_db(db)
+    app = Flask(__name__)
+    app.config['RAILWAY_DB'] = db
+    app.register_blueprint(router, url_prefix='/api')
+    return app.test_client(), db
+
+def test_keyset_pagination_and_fields(tmp_path):
+    client, _ = _client(tmp_path)
+    seen = []
+    url = "/api/companies?limit=2&fields=id,cd"
+    while url:
+        page = client.get(url).get_json()
+        assert all(set(item) == {"id", "cd"} for item in page["items"])
+        seen += [item["id"] for item in page["items"]]
+        url = f"/api/companies?limit=2&fields=id,cd&after={page['next']}" if page["next"] else None
+    assert seen == [f"c{i}" for i in range(5)]
+
+    assert client.get("/api/companies?fields=id,nope").status_code == 400
+    assert client.get("/api/companies/none/lines").status_code == 404
+
+    stations = client.get("/api/companies/c0/lines/本線/stations").get_json()["items"]
+    assert stations[0]["transfers"] == ["JR"] and stations[0]["lon"] == 139.76
+    group = client.get("/api/station-groups").get_json()["items"][0]
+    assert group["stations"] == 2 and group["companies"].split(",") == ["c0", "c1"]
+
+def test_etag_follows_build_version(tmp_path):
+    client, db = _client(tmp_path)
+    first = client.get("/api/companies")
+    etag = first.headers["ETag"]
+    assert client.get("/api/companies", headers={"If-None-Match": etag}).status_code == 304
+
+    # 构建以原子替换写库后, 旧 ETag 失效
+    _make_db(db + ".tmp", companies=6)
+    os.replace(db + ".tmp", db)
+    fresh = client.get("/api/companies", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and len(fresh.get_json()["items"]) == 6
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import railway_processer
+from railway_processer import RailwayDataService, station
+from ekidata_delta import ingest, EkidataDelta
+from station_parent_model import KanaNormalizer
+from railway_api import db_version, ReadOnlyPool
+from tracing import load_build_runs
+
+def _data_dir(tmp_path):
+    '''一个公司一条线路三个车站的最小数据, 不含 ekidata'''
+    (tmp_path / "ekidata").mkdir()
+    (tmp_path / "geojson").mkdir()
+    (tmp_path / "company_data.json").write_text(json.dumps(
+        {"テスト鉄道": {"region": "関東", "type": "私鉄", "logo": ""}}, ensure_ascii=False), encoding="utf-8")
+    stations = [("日本橋", 139.774, 35.682), ("茅場町", 139.780, 35.680), ("門前仲町", 139.796, 35.672)]
+    features = [{"type": "Feature", "properties": {"type": "line", "name": "本線"},
+                 "geometry": {"type": "LineString", "coordinates": [[x, y] for _, x, y in stations]}}]
+    features += [{"type": "Feature", "properties": {"type": "station", "name": n, "line": "本線"},
+                  "geometry": {"type": "Point", "coordinates": [x, y]}} for n, x, y in stations]
+    (tmp_path / "geojson" / "テスト鉄道.geojson").write_text(
+        json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False), encoding="utf-8")
+    return tmp_path
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_build_without_ekidata(tmp_path):
+    data_dir = _data_dir(tmp_path)
+    db_path = str(tmp_path / "railway.db")
+    service = RailwayDataService(db_path=db_path, data_dir=str(data_dir))
+    service.build()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM stations").fetchone()[0] == 3
+        assert conn.execute("SELECT COUNT(*) FROM route_graph").fetchone()[0] > 0
+    finally:
+        conn.close()
+    # 未匹配 ekidata 的车站没有编号, 仍按车站顺序连成线路
+    assert service.route_graph.node_count == 3 and service.route_graph.edge_count == 4
+
+def _readings(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT name, reading, romaji FROM stations ORDER BY rowid").fetchall()
+    finally:
+        conn.close()
+
+def test_rebuild_keeps_readings(tmp_path, monkeypatch):
+    data_dir = _data_dir(tmp_path)
+    db_path = str(tmp_path / "railway.db")
+    # 每次构建在新进程中运行, 缓存只来自上次的库
+    monkeypatch.setattr(railway_processer, "normalizer", KanaNormalizer())
+    RailwayDataService(db_path=db_path, data_dir=str(data_dir)).build()
+    first = _readings(db_path)
+
+    # 其他线路的同名车站带有 ekidata 读音时, stations.reading 与 pykakasi 的结果不同
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE stations SET reading = 'にっぽんばし' WHERE name = '日本橋'")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(railway_processer, "normalizer", KanaNormalizer())
+    service = RailwayDataService(db_path=db_path, data_dir=str(data_dir))
+    service.build()
+    assert _readings(db_path) == first
+    assert service.reading_stats['misses'] == 0
+
+def test_build_run_written_before_replace(tmp_path):
+    data_dir = _data_dir(tmp_path)
+    db_path = str(tmp_path / "railway.db")
+    service = RailwayDataService(db_path=db_path, data_dir=str(data_dir))
+    versions = []
+    save_to_db = service.save_to_db
+    def save_and_record():
+        save_to_db()
+        versions.append(db_version(db_path))
+    service.save_to_db = save_and_record
+
+    service.build()
+    service.build()
+
+    # 替换后不再写入已发布的库
+    assert versions[-1] == db_version(db_path)
+    runs = load_build_runs(db_path)
+    assert len(runs) == 2
+    assert [s['name'] for s in runs[0]['stages']][-2:] == ['tiles', 'save_to_db']
+
+def test_build_replaces_db_while_api_reads(tmp_path, monkeypatch):
+    data_dir = _data_dir(tmp_path)
+    db_path = str(tmp_path / "railway.db")
+    RailwayDataService(db_path=db_path, data_dir=str(data_dir)).build()
+
+    # 模拟 Windows: 库文件有打开的连接时不能替换
+    pool = ReadOnlyPool(db_path)
+    replace = os.replace
+    def windows_replace(src, dst):
+        if dst == db_path and pool.open_count:
+            raise PermissionError(dst)
+        replace(src, dst)
+    monkeypatch.setattr(railway_processer.os, "replace", windows_replace)
+
+    # 服务过请求后不保留空闲连接
+    pool.refresh()
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM stations").fetchone()[0] == 3
+    assert pool.open_count == 0
+
+    # 构建期间有请求持有连接: 释放后替换完成
+    release = threading.Event()
+    def hold():
+        with pool.connection():
+            release.wait(5)
+    holder = threading.Thread(target=hold)
+    holder.start()
+    assert _wait(lambda: pool.open_count == 1)
+    threading.Timer(0.3, release.set).start()
+    version = pool.refresh()
+    RailwayDataService(db_path=db_path, data_dir=str(data_dir)).build()
+    holder.join()
+    assert pool.refresh() != version
+
+# 两家公司各一条线路; 第二个版本中茅場町的编号由 112 改为 114
+EKIDATA_LINES = {"A鉄道": (1, 11, "本線"), "B鉄道": (2, 21, "支線")}
+EKIDATA_STATIONS = [(111, "日本橋", 11, 139.774, 35.682), (112, "茅場町", 11, 139.780, 35.680),
+                    (113, "門前仲町", 11, 139.796, 35.672), (211, "押上", 21, 139.813, 35.710),
+                    (212, "曳舟", 21, 139.816, 35.718)]
+
+def _station_csv(path, rows):
+    path.write_text("station_cd,station_g_cd,station_name,station_name_k,line_cd\n" + "".join(
+        f"{cd},{cd},{name},,{line_cd}\n" for cd, name, line_cd, _, _ in rows), encoding="utf-8")
+
+def _ekidata_data_dir(tmp_path):
+    ekidata_dir = tmp_path / "ekidata"
+    (tmp_path / "geojson").mkdir()
+    ekidata_dir.mkdir()
+    (tmp_path / "company_data.json").write_text(json.dumps(
+        {name: {"region": "関東", "type": "私鉄", "logo": ""} for name in EKIDATA_LINES}, ensure_ascii=False), encoding="utf-8")
+    (ekidata_dir / "company20250101.csv").write_text("company_cd,rr_cd,company_name,company_name_h\n" + "".join(
+        f"{cd},{cd},{name},{name}\n" for name, (cd, _, _) in EKIDATA_LINES.items()), encoding="utf-8")
+    (ekidata_dir / "line20250101free.csv").write_text("line_cd,company_cd,line_name,line_name_k,line_name_h\n" + "".join(
+        f"{line_cd},{cd},{line},,{line}\n" for cd, line_cd, line in EKIDATA_LINES.values()), encoding="utf-8")
+    _station_csv(ekidata_dir / "station20250101free.csv", EKIDATA_STATIONS)
+
+    for name, (_, line_cd, line) in EKIDATA_LINES.items():
+        rows = [r for r in EKIDATA_STATIONS if r[2] == line_cd]
+        features = [{"type": "Feature", "properties": {"type": "line", "name": line},
+                     "geometry": {"type": "LineString", "coordinates": [[x, y] for *_, x, y in rows]}}]
+        features += [{"type": "Feature", "properties": {"type": "station", "name": n, "line": line},
+                      "geometry": {"type": "Point", "coordinates": [x, y]}} for _, n, _, x, y in rows]
+        (tmp_path / "geojson" / f"{name}.geojson").write_text(
+            json.dumps({"type": "FeatureCollection", "features": features}, ensure_ascii=False), encoding="utf-8")
+    return tmp_path
+
+def _station_codes(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {name: (line_cd, station_cd, is_mock) for name, line_cd, station_cd, is_mock in conn.execute(
+            "SELECT name, line_cd, station_cd, is_mock FROM stations")}
+    finally:
+        conn.close()
+
+def test_ekidata_release_rematches_changed_lines(tmp_path, monkeypatch):
+    data_dir = _ekidata_data_dir(tmp_path)
+    db_path = str(tmp_path / "railway.db")
+    RailwayDataService(db_path=db_path, data_dir=str(data_dir)).build()
+    first = _station_codes(db_path)
+    assert first["茅場町"] == (11, 112, 0) and first["押上"] == (21, 211, 0)
+
+    # 第二个版本: 本線的车站编号变更, 支線不变
+    download_dir = tmp_path / "downloads"
+    download_dir.mkdir()
+    _station_csv(download_dir / "station20250201free.csv",
+                 [(114, *r[1:]) if r[0] == 112 else r for r in EKIDATA_STATIONS])
+    delta = ingest(str(download_dir), str(data_dir / "ekidata"))
+    assert delta.affected_line_cds() == {11}
+
+    matched = []
+    match_ekidata = station.match_ekidata
+    def record_match(self, ekidata):
+        matched.append(self.name)
+        return match_ekidata(self, ekidata)
+    monkeypatch.setattr(station, "match_ekidata", record_match)
+
+    service = RailwayDataService(db_path=db_path, data_dir=str(data_dir))
+    service.build()
+    second = _station_codes(db_path)
+
+    # 只重新匹配本線的车站, 支線沿用上次的结果
+    assert sorted(matched) == sorted(["日本橋", "茅場町", "門前仲町"])
+    assert service.match_stats == {'reused': 4, 'matched': 3}
+    assert {n: second[n] for n in ("押上", "曳舟")} == {n: first[n] for n in ("押上", "曳舟")}
+    # 删除的编号不再出现
+    assert second["茅場町"] == (11, 114, 0)
+    assert 112 not in {cd for _, cd, _ in second.values()}
+    assert EkidataDelta.load(str(data_dir / "ekidata" / "delta.json")).applied
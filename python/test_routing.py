@@ -0,0 +1,51 @@
+import sqlite3
+from types import SimpleNamespace
+
+from shapely.geometry import Point
+
+from routing import RouteGraph, compile_graph
+
+def _line(cid, name, line_cd, stations):
+    '''stations: [(name, station_cd, station_g_cd, lon, lat)], 几何沿车站顺序'''
+    objs = [SimpleNamespace(name=n, id=cd, gid=g, group=None, location=Point(x, y)) for n, cd, g, x, y in stations]
+    coords = [(x, y) for _, _, _, x, y in stations]
+    return SimpleNamespace(name=name, id=line_cd, is_mock=False, rawGeometry=coords, stations=objs)
+
+def _network():
+    # 东西向的 A 线 (5 站) 与南北向的 B 线 在 中央 (组 3) 相交; C 线 直达 西端 与 北端
+    a = _line("甲", "A线", 1, [("西", 11, 1, 139.00, 35.00), ("西二", 12, 2, 139.01, 35.00), ("中央", 13, 3, 139.02, 35.00),
+                              ("東二", 14, 4, 139.03, 35.00), ("東", 15, 5, 139.04, 35.00)])
+    b = _line("乙", "B线", 2, [("北", 21, 6, 139.02, 35.02), ("中央", 22, 3, 139.02, 35.00), ("南", 23, 7, 139.02, 34.98)])
+    c = _line("丙", "C线", 3, [("西", 31, 1, 139.00, 35.00), ("迂回", 32, 8, 138.98, 35.06), ("北", 33, 6, 139.02, 35.02)])
+    return [SimpleNamespace(id="甲", lineList=[a]), SimpleNamespace(id="乙", lineList=[b]), SimpleNamespace(id="丙", lineList=[c])]
+
+def test_shortest_path_metrics_and_storage():
+    graph = compile_graph(_network())
+    assert graph.node_count == 11
+
+    # 距离: A线 -> 中央换乘 B线 (约 4.4km) 比 C线 绕行 (约 11km) 短
+    route = graph.shortest_path(1, 6, metric='distance')
+    assert [leg["line"] for leg in route["legs"]] == ["A线", "B线"]
+    assert route["transfers"] == 1 and route["hops"] == 3
+    assert 4.0 < route["distance_km"] < 5.0
+
+    # 站数 + 换乘惩罚: C线 直达 2 站优于 3 站 + 换乘
+    route = graph.shortest_path(1, 6, metric='hops')
+    assert [leg["line"] for leg in route["legs"]] == ["C线"] and route["transfers"] == 0
+    # 去掉换乘惩罚后 2 站仍然更少
+    assert graph.shortest_path(1, 6, metric='hops', transfer_penalty=0)["hops"] == 2
+
+    # 写入 / 读取 后结果相同
+    conn = sqlite3.connect(":memory:")
+    graph.write(conn.cursor())
+    loaded = RouteGraph.load(conn)
+    assert loaded.shortest_path(1, 7)["path"] == graph.shortest_path(1, 7)["path"]
+
+def test_many_to_many_matches_point_queries():
+    graph = compile_graph(_network())
+    origins, destinations = [1, 5], [6, 7, 5]
+    costs = graph.many_to_many(origins, destinations)
+    for i, o in enumerate(origins):
+        for j, d in enumerate(destinations):
+            assert costs[i][j] == graph.shortest_path(o, d)["cost"]
+    assert costs[1][2] == 0.0
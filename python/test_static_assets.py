@@ -0,0 +1,29 @@
+import gzip
+
+from flask import Flask
+
+from static_assets import precompress, register_static, IMMUTABLE
+
+def test_precompressed_and_cached(tmp_path):
+    assets = tmp_path / "assets"
+    assets.mkdir()
+    (assets / "index-AbCd1234.js").write_text("console.log('railround');" * 100, encoding='utf-8')
+    (tmp_path / "company_data.json").write_text('{"a": 1}' * 200, encoding='utf-8')
+    assert precompress(str(tmp_path)) >= 2
+
+    app = Flask(__name__, static_folder=None)
+    register_static(app, str(tmp_path))
+    client = app.test_client()
+
+    resp = client.get("/assets/index-AbCd1234.js", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Cache-Control"] == IMMUTABLE
+    assert gzip.decompress(resp.data).startswith(b"console.log")
+
+    plain = client.get("/company_data.json")
+    assert "Content-Encoding" not in plain.headers and plain.headers["Cache-Control"] == "no-cache"
+    assert plain.headers["ETag"] != resp.headers["ETag"]
+
+    cached = client.get("/company_data.json", headers={"If-None-Match": plain.headers["ETag"]})
+    assert cached.status_code == 304
+    assert client.get("/../secret").status_code == 404
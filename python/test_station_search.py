@@ -0,0 +1,67 @@
+import sqlite3
+from types import SimpleNamespace
+
+from shapely.geometry import Point
+
+from railway_processer import RailwayDataService
+from station_parent_model import KanaNormalizer, readings
+from station_search import build_entries, fold_romaji, search, write_index
+
+def _station(name, cd, gid, x):
+    hira, roma = readings(name)
+    return SimpleNamespace(name=name, id=cd, gid=gid, group=None, location=Point(x, 35.0), reading=hira, romaji=roma)
+
+def _index(companies):
+    conn = sqlite3.connect(":memory:")
+    write_index(conn.cursor(), build_entries(companies))
+    return conn
+
+def test_search_ranks_exact_prefix_substring():
+    jr = SimpleNamespace(id="JR", lineList=[
+        SimpleNamespace(name="山手線", stations=[_station("新宿", 1, 10, 139.70), _station("渋谷", 2, 20, 139.70)]),
+        SimpleNamespace(name="中央線", stations=[_station("新宿", 3, 10, 139.70)]),
+    ])
+    private = SimpleNamespace(id="京王", lineList=[
+        SimpleNamespace(name="京王線", stations=[_station("新宿三丁目", 4, 30, 139.71), _station("西新宿五丁目", 5, 40, 139.69)]),
+    ])
+    conn = _index([jr, private])
+
+    results = search(conn, "新宿")
+    assert [(r["name"], r["match"]) for r in results] == [("新宿", "exact"), ("新宿三丁目", "prefix"), ("西新宿五丁目", "substring")]
+    # 同一车站组合并, 记录全部线路
+    assert results[0]["station_cds"] == [1, 3] and len(results[0]["lines"]) == 2
+
+    # 读音 (片假名输入) 与罗马字 (长音写法不同) 都能找到
+    assert search(conn, "シブヤ")[0]["name"] == "渋谷"
+    assert search(conn, "Shinjuku")[0]["name"] == "新宿"
+    assert fold_romaji("Tōkyō") == fold_romaji("toukyou") == "tokyo"
+    assert search(conn, "存在しない駅") == []
+
+def test_normalizer_converts_each_name_once():
+    n = KanaNormalizer()
+    result = n.readings_many(["新宿", "渋谷", "新宿", "新宿"])
+    assert result["新宿"] == ("しんじゅく", "shinjuku")
+    assert n.stats() == {"hits": 0, "misses": 2, "size": 2}
+    n.readings_many(["新宿", "渋谷"])
+    assert n.stats()["misses"] == 2 and n.stats()["hits"] == 2
+
+def test_normalizer_evicts_least_recently_used():
+    n = KanaNormalizer(maxsize=2)
+    n.readings_many(["新宿", "渋谷"])
+    n.readings("新宿") # 命中后变为最近使用
+    n.readings("池袋")
+    n.readings_many(["新宿", "池袋"])
+    assert n.stats() == {"hits": 3, "misses": 3, "size": 2}
+    n.readings("渋谷") # 已被淘汰
+    assert n.stats()["misses"] == 4
+
+def test_assign_readings_prefers_ekidata(tmp_path):
+    stations = [_station("日本橋", 7, 7, 139.0), _station("日本橋", 8, 8, 135.5)]
+    for s in stations:
+        s.reading = s.romaji = None
+    service = RailwayDataService(db_path=str(tmp_path / "railway.db"))
+    service.companyList = [SimpleNamespace(id="X", lineList=[SimpleNamespace(name="線", stations=stations)])]
+    service.company_ekidata = SimpleNamespace(station_readings={8: "ニッポンバシ"})
+    service.assign_readings()
+    assert [s.reading for s in stations] == ["にほんばし", "にっぽんばし"]
+    assert service.reading_stats["hits"] + service.reading_stats["misses"] == 1 # 同名只查一次
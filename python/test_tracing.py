@@ -0,0 +1,31 @@
+from tracing import Tracer, span, traced, save_build_run, load_build_runs
+
+@traced('match')
+def _match():
+    return 1
+
+def test_spans_and_build_runs(tmp_path):
+    assert _match() == 1 # 未激活 Tracer 时为空操作
+
+    with Tracer() as tracer:
+        with span('load'):
+            for company in ('a', 'b'):
+                with span('company', item=company):
+                    _match()
+                    _match()
+        with span('save'):
+            pass
+
+    report = tracer.report()
+    assert [s['name'] for s in report['stages']] == ['load', 'save']
+    assert report['spans']['match']['count'] == 4
+    assert {s['item'] for s in report['slow_items']} == {'a', 'b'}
+
+    db_path = str(tmp_path / "railway.db")
+    save_build_run(db_path, report, companies=2, groups=0)
+    slower = dict(report, spans=dict(report['spans'], load={'count': 1, 'seconds': 10.0, 'max': 10.0}))
+    save_build_run(db_path, slower, companies=2, groups=0)
+
+    runs = load_build_runs(db_path)
+    assert len(runs) == 2 and runs[0]['companies'] == 2
+    assert [r['span'] for r in runs[0]['regressions']] == ['load']
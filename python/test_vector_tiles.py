@@ -0,0 +1,64 @@
+import gzip
+from types import SimpleNamespace
+
+from shapely.geometry import Point
+
+from vector_tiles import CompanyFeatures, TileCache, encode_geometry, read_tile
+
+def _company(cid, coords, mtime_hint=""):
+    st = SimpleNamespace(name=f"{cid}駅", id=1, gid=1, location=Point(coords[0]))
+    line = SimpleNamespace(name=f"{cid}線{mtime_hint}", id=11101, type="line", stroke="#ff0000",
+                           rawGeometry=coords, stations=[st])
+    return SimpleNamespace(id=cid, lineList=[line])
+
+def _read_fields(buf):
+    '''最小 protobuf 解码: 返回 [(field, value)], 长度字段返回 bytes'''
+    out, i = [], 0
+    def varint():
+        nonlocal i
+        shift = result = 0
+        while True:
+            b = buf[i]; i += 1
+            result |= (b & 0x7F) << shift
+            if not b & 0x80:
+                return result
+            shift += 7
+    while i < len(buf):
+        key = varint()
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            out.append((field, varint()))
+        elif wire == 2:
+            n = varint()
+            out.append((field, buf[i:i + n])); i += n
+        elif wire == 1:
+            out.append((field, buf[i:i + 8])); i += 8
+    return out
+
+def test_encode_geometry_spec_examples():
+    # 矢量瓦片规范 4.3.5 的示例
+    assert encode_geometry(1, [[(25, 17)]]) == [9, 50, 34]
+    assert encode_geometry(2, [[(2, 2), (2, 10), (10, 10)]]) == [9, 4, 4, 18, 0, 16, 16, 0]
+
+def test_tile_cache_incremental(tmp_path):
+    path = str(tmp_path / "railway.mbtiles")
+    cache = TileCache(path, min_zoom=9, max_zoom=10)
+    tokyo = _company("東京", [(139.70, 35.68), (139.77, 35.68)])
+    osaka = _company("大阪", [(135.49, 34.70), (135.52, 34.70)])
+    features = {c.id: CompanyFeatures.from_company(c, str(tmp_path)) for c in (tokyo, osaka)}
+
+    first = cache.update(features)
+    assert first["changed"] == 2 and first["tiles"] > 0
+    assert cache.update(features) == {"changed": 0, "tiles": 0}
+
+    # 只有变化的公司覆盖的瓦片被重写
+    features["大阪"] = CompanyFeatures.from_company(_company("大阪", [(135.49, 34.70), (135.52, 34.70)], "v2"), str(tmp_path))
+    second = cache.update(features)
+    assert second["changed"] == 1 and second["tiles"] < first["tiles"]
+
+    # z10 下东京 (139.7, 35.68) 位于瓦片 (909, 403)
+    tile = _read_fields(gzip.decompress(read_tile(path, 10, 909, 403)))
+    layers = {dict(_read_fields(layer))[1].decode(): layer for field, layer in tile if field == 3}
+    assert set(layers) == {"lines", "stations"}
+    assert "東京線".encode() in layers["lines"]
+    assert read_tile(path, 10, 0, 0) is None
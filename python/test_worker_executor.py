@@ -0,0 +1,44 @@
+import time
+import threading
+
+from worker_base import WorkerProcess
+from worker_executor import WorkerExecutor, PRIORITY_MANUAL, PRIORITY_SCHEDULED
+
+class CountingWorker(WorkerProcess):
+    def __init__(self, name, period):
+        super().__init__(name, period, "counting")
+
+    def trigger(self):
+        return "ok"
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_executor_type_limit_and_cancel():
+    executor = WorkerExecutor(max_workers=3, type_limits={"counting": 1})
+    gate = threading.Event()
+    order = []
+
+    a = CountingWorker("exec_a", 3600)
+    b = CountingWorker("exec_b", 3600)
+    c = CountingWorker("exec_c", 3600)
+
+    h_a = executor.submit(a, fn=lambda: (gate.wait(2), order.append('a')))
+    assert _wait_for(lambda: h_a.state == 'running')
+    # 同类型上限为 1: 后续提交排队, 按优先级出队
+    h_b = executor.submit(b, fn=lambda: order.append('b'), priority=PRIORITY_SCHEDULED)
+    h_c = executor.submit(c, fn=lambda: order.append('c'), priority=PRIORITY_MANUAL)
+    assert executor.submit(a) is h_a # 同一 Worker 不重叠
+    assert executor.stats()['queue_depth'] == 2
+
+    assert h_b.cancel()
+    gate.set()
+    assert h_c.wait(2)
+    assert order == ['a', 'c']
+    assert h_b.state == 'cancelled'
+    assert not executor.busy()
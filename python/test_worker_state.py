@@ -0,0 +1,71 @@
+import time
+import threading
+
+from event_scheduler import VirtualClock
+from worker_manager import WorkerManager
+from worker_state import WorkerStateStore
+
+def _wait_for(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_state_restored_across_restart(registry, tmp_path):
+    clock = VirtualClock(start=1000.0)
+    store = WorkerStateStore(str(tmp_path / "workers.db"))
+    m = WorkerManager(clock=clock, state_store=store)
+    worker = m.create_worker("counting", "state_counter", period=7200)
+
+    t = threading.Thread(target=m.loop, daemon=True)
+    t.start()
+    try:
+        assert _wait_for(lambda: worker.runs == 1 and len(m.get_history("state_counter")) == 1)
+    finally:
+        m.stop()
+        t.join(timeout=2)
+
+    # 重启: 按保存的下次运行时间排程, 而不是立即运行
+    restarted = WorkerManager(clock=clock, state_store=WorkerStateStore(str(tmp_path / "workers.db")))
+    restored = restarted.create_worker("counting", "state_counter", period=3600)
+    assert restored.status['statcode'] == 200
+    assert restored.period == 7200
+    assert restarted.scheduler.next_deadline() == 1000.0 + 7200
+
+    history = restarted.get_history("state_counter")
+    assert history[0]['status_code'] == 200 and history[0]['result'] == "ok"
+
+def test_interrupted_stage_reruns_after_restart(registry, tmp_path):
+    counting = registry.get_cls("counting")
+    class Stage(counting):
+        pass
+    registry.register("state_stage", Stage, after=["counting"])
+
+    clock = VirtualClock(start=1000.0)
+    store = WorkerStateStore(str(tmp_path / "workers.db"))
+    m = WorkerManager(clock=clock, state_store=store)
+    source = m.create_worker("counting", "state_source", period=3600)
+    stage = m.create_worker("state_stage", "state_stage", period=3600)
+    # 上游已完成, 阶段运行中进程被终止
+    source.status['statcode'] = 200
+    source.status['lastfinish'] = 900.0
+    source.status['nextrun'] = 1000.0 + 3600 # 重启后上游不会再运行
+    stage.status['lastrun'] = 950.0
+    stage.status['statcode'] = 1
+    store.save(source)
+    store.save(stage)
+
+    restarted = WorkerManager(clock=clock, state_store=WorkerStateStore(str(tmp_path / "workers.db")))
+    restarted.create_worker("counting", "state_source", period=3600)
+    restored = restarted.create_worker("state_stage", "state_stage", period=3600)
+    assert restored.status['statcode'] == 0
+
+    t = threading.Thread(target=restarted.loop, daemon=True)
+    t.start()
+    try:
+        assert _wait_for(lambda: restored.runs == 1 and restored.status['statcode'] == 200)
+    finally:
+        restarted.stop()
+        t.join(timeout=2)
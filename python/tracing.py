@@ -0,0 +1,167 @@
+import time
+import json
+import sqlite3
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+
+BUILD_RUNS_RETENTION = 200 # build_runs 表保留的构建次数
+
+BUILD_RUNS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS build_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        started_at REAL,
+        duration REAL,
+        companies INTEGER,
+        groups INTEGER,
+        stages TEXT,
+        spans TEXT,
+        slow_items TEXT
+    )
+'''
+
+_active = None # 当前构建的 Tracer, 未激活时 span() 为空操作
+
+class Tracer:
+    '''
+    轻量级耗时追踪. span 只按 名称 / (名称, item) 聚合 次数/总耗时/最大值,
+    不保存单个 span, 即使包在逐线路/逐车站的匹配上开销也可忽略.
+    顶层 span 按出现顺序作为构建阶段.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.stages = [] # [(name, seconds)]
+        self.spans = {} # name -> [count, seconds, max]
+        self.items = {} # (name, item) -> seconds
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        _active = self._previous
+        return False
+
+    @contextmanager
+    def span(self, name, item=None):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                agg = self.spans.get(name)
+                if agg is None:
+                    agg = self.spans[name] = [0, 0.0, 0.0]
+                agg[0] += 1
+                agg[1] += seconds
+                agg[2] = max(agg[2], seconds)
+                if item is not None:
+                    self.items[(name, item)] = self.items.get((name, item), 0.0) + seconds
+                if not stack:
+                    self.stages.append((name, seconds))
+
+    def report(self, slow_limit=10):
+        '''聚合为单次构建的耗时报告'''
+        with self._lock:
+            slow = sorted(self.items.items(), key=lambda kv: kv[1], reverse=True)[:slow_limit]
+            return {
+                "started_at": self.started_at,
+                "duration": round(time.perf_counter() - self._started, 3),
+                "stages": [{"name": n, "seconds": round(s, 3)} for n, s in self.stages],
+                "spans": {
+                    n: {"count": c, "seconds": round(s, 3), "max": round(m, 4)}
+                    for n, (c, s, m) in sorted(self.spans.items(), key=lambda kv: kv[1][1], reverse=True)
+                },
+                "slow_items": [{"span": n, "item": i, "seconds": round(s, 3)} for (n, i), s in slow]
+            }
+
+def span(name, item=None):
+    '''在当前激活的 Tracer 上记录一个 span; 未激活时为空操作'''
+    tracer = _active
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, item)
+
+def traced(name):
+    '''装饰器形式的 span'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _active
+            if tracer is None:
+                return func(*args, **kwargs)
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def write_build_run(conn, report, companies=0, groups=0):
+    '''在 conn 上追加一条构建记录并按保留数清理旧记录, 由调用方提交'''
+    conn.execute(BUILD_RUNS_SCHEMA)
+    conn.execute(
+        "INSERT INTO build_runs (started_at, duration, companies, groups, stages, spans, slow_items) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (report['started_at'], report['duration'], companies, groups,
+         json.dumps(report['stages'], ensure_ascii=False),
+         json.dumps(report['spans'], ensure_ascii=False),
+         json.dumps(report['slow_items'], ensure_ascii=False))
+    )
+    conn.execute(
+        "DELETE FROM build_runs WHERE id NOT IN (SELECT id FROM build_runs ORDER BY id DESC LIMIT ?)",
+        (BUILD_RUNS_RETENTION,)
+    )
+
+def save_build_run(db_path, report, companies=0, groups=0):
+    '''追加一条构建记录到 db_path'''
+    conn = sqlite3.connect(db_path)
+    try:
+        write_build_run(conn, report, companies, groups)
+        conn.commit()
+    finally:
+        conn.close()
+
+def load_build_runs(db_path, limit=20):
+    '''读取最近的构建记录 (新在前), 并标注相对上一次构建变慢的阶段'''
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        return []
+    try:
+        rows = conn.execute(
+            "SELECT id, started_at, duration, companies, groups, stages, spans, slow_items FROM build_runs ORDER BY id DESC LIMIT ?",
+            (limit + 1,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return [] # 旧库无 build_runs 表
+    finally:
+        conn.close()
+
+    runs = [{
+        "id": r[0], "started_at": r[1], "duration": r[2], "companies": r[3], "groups": r[4],
+        "stages": json.loads(r[5]), "spans": json.loads(r[6]), "slow_items": json.loads(r[7])
+    } for r in rows]
+    for run, previous in zip(runs, runs[1:] + [None]):
+        run["regressions"] = compare_runs(run, previous) if previous else []
+    return runs[:limit]
+
+def compare_runs(run, previous, threshold=0.2, min_seconds=0.05):
+    '''与上一次构建相比耗时增加超过 threshold 的 span'''
+    regressions = []
+    for name, cur in run["spans"].items():
+        prev = previous["spans"].get(name)
+        if not prev or cur["seconds"] < min_seconds:
+            continue
+        if cur["seconds"] > prev["seconds"] * (1 + threshold):
+            regressions.append({"span": name, "seconds": cur["seconds"], "previous": prev["seconds"]})
+    return regressions
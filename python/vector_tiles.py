@@ -0,0 +1,363 @@
+import os
+import gzip
+import json
+import math
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+import shapely
+
+from geometry import line_geometry
+
+MIN_ZOOM = 5
+MAX_ZOOM = 12
+EXTENT = 4096 # 瓦片内坐标范围
+BUFFER = 64 # 裁剪缓冲 (瓦片坐标单位), 避免线宽在瓦片边缘被截断
+STATION_MIN_ZOOM = 9 # 更小级别只绘制线路
+
+LINE_LAYER = 'lines'
+STATION_LAYER = 'stations'
+
+def tiles_path_for(db_path):
+    '''与 railway.db 同目录的 railway.mbtiles'''
+    return os.path.splitext(db_path)[0] + ".mbtiles"
+
+# --- 投影 ---
+
+def _to_world(coords):
+    '''经纬度 (N x 2) -> Web Mercator 单位坐标 [0, 1)'''
+    lon = coords[:, 0]
+    lat = np.clip(coords[:, 1], -85.0511, 85.0511)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return np.column_stack([x, y])
+
+# --- MVT (protobuf) 编码, 只实现矢量瓦片规范 v2 用到的部分 ---
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+def _bytes_field(number, data):
+    return _field(number, 2) + _varint(len(data)) + data
+
+def _packed(number, values):
+    return _bytes_field(number, b''.join(_varint(v) for v in values))
+
+def _command(cmd, count):
+    return (cmd & 0x7) | (count << 3)
+
+def encode_geometry(geom_type, parts):
+    '''
+    geom_type: 1 点 / 2 线. parts: [[(x, y), ...], ...] (瓦片坐标, 整数).
+    点: 所有点放在一个 MoveTo; 线: 每段 MoveTo + LineTo, 游标跨段延续.
+    '''
+    commands = []
+    cx = cy = 0
+    if geom_type == 1:
+        points = [p for part in parts for p in part]
+        commands.append(_command(1, len(points)))
+        for x, y in points:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+        return commands
+
+    for part in parts:
+        if len(part) < 2:
+            continue
+        x, y = part[0]
+        commands += [_command(1, 1), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append(_command(2, len(part) - 1))
+        for x, y in part[1:]:
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return commands
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _field(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _field(3, 1) + np.float64(value).tobytes()
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+def encode_layer(name, features):
+    '''features: [(geom_type, parts, properties)]'''
+    keys, values = {}, {}
+    body = b''
+    for fid, (geom_type, parts, props) in enumerate(features, 1):
+        geometry = encode_geometry(geom_type, parts)
+        if len(geometry) <= 1:
+            continue
+        tags = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            tags.append(keys.setdefault(k, len(keys)))
+            tags.append(values.setdefault((type(v).__name__, v), len(values)))
+        feature = _field(1, 0) + _varint(fid) + _packed(2, tags) + _field(3, 0) + _varint(geom_type) + _packed(4, geometry)
+        body += _bytes_field(2, feature)
+    if not body:
+        return b''
+
+    layer = _field(15, 0) + _varint(2) + _bytes_field(1, name.encode('utf-8')) + body
+    for k in keys:
+        layer += _bytes_field(3, k.encode('utf-8'))
+    for (_, v) in values:
+        layer += _bytes_field(4, _encode_value(v))
+    layer += _field(5, 0) + _varint(EXTENT)
+    return _bytes_field(3, layer)
+
+# --- 由构建结果提取要素 ---
+
+class CompanyFeatures:
+    '''单个公司的线路/车站 (Web Mercator 单位坐标) 与用于增量判断的指纹'''
+    def __init__(self, company_id, lines, stations, fingerprint):
+        self.id = company_id
+        self.lines = lines # [(geometry, props)]
+        self.stations = stations # [(x, y, props)]
+        self.fingerprint = fingerprint
+        self._zoomed = {}
+
+    @classmethod
+    def from_company(cls, c, geojson_dir):
+        '''由 railway_processer.company 生成; 指纹 = geojson 文件状态 + 线路/车站属性'''
+        h = hashlib.sha1()
+        try:
+            st = os.stat(os.path.join(geojson_dir, f"{c.id}.geojson"))
+            h.update(f"{st.st_size}|{st.st_mtime_ns}".encode('utf-8'))
+        except FileNotFoundError:
+            pass
+
+        lines = []
+        stations = []
+        for l in c.lineList:
+            geom = line_geometry(l.rawGeometry)
+            props = {"company": c.id, "name": l.name, "line_cd": l.id, "type": l.type, "stroke": l.stroke}
+            h.update(json.dumps(props, ensure_ascii=False, default=str).encode('utf-8'))
+            if geom is not None:
+                lines.append((shapely.transform(geom, _to_world), props))
+            for s in l.stations:
+                props = {"company": c.id, "line": l.name, "name": s.name, "station_cd": s.id, "station_g_cd": s.gid}
+                h.update(json.dumps(props, ensure_ascii=False, default=str).encode('utf-8'))
+                x, y = _to_world(np.array([[s.location.x, s.location.y]]))[0]
+                stations.append((float(x), float(y), props))
+        return cls(c.id, lines, stations, h.hexdigest())
+
+    def at_zoom(self, z):
+        '''按缩放级别放大到瓦片坐标并化简 (容差约为 1 个瓦片像素)'''
+        cached = self._zoomed.get(z)
+        if cached is None:
+            scale = 2 ** z
+            tolerance = 1.0 / EXTENT
+            cached = [
+                (shapely.simplify(shapely.transform(g, lambda c: c * scale), tolerance), p)
+                for g, p in self.lines
+            ]
+            self._zoomed[z] = cached
+        return cached
+
+    def cut(self, z, only=None):
+        '''切分到瓦片: 返回 {(x, y): {"lines": [...], "stations": [...]}}; only 限定瓦片集合'''
+        tiles = {}
+        n = 2 ** z
+        b = BUFFER / EXTENT
+
+        for geom, props in self.at_zoom(z):
+            minx, miny, maxx, maxy = geom.bounds
+            xs = range(max(int(minx - b), 0), min(int(maxx + b), n - 1) + 1)
+            ys = range(max(int(miny - b), 0), min(int(maxy + b), n - 1) + 1)
+            candidates = [(x, y) for x in xs for y in ys if only is None or (x, y) in only]
+            if not candidates:
+                continue
+            boxes = shapely.box(*np.array([[x - b, y - b, x + 1 + b, y + 1 + b] for x, y in candidates]).T)
+            hit = shapely.intersects(boxes, geom)
+            for (x, y), box, is_hit in zip(candidates, boxes, hit):
+                if not is_hit:
+                    continue
+                clipped = shapely.clip_by_rect(geom, *box.bounds)
+                parts = _tile_parts(clipped, x, y)
+                if parts:
+                    tiles.setdefault((x, y), {"lines": [], "stations": []})["lines"].append((2, parts, props))
+
+        if z < STATION_MIN_ZOOM:
+            return tiles
+        for wx, wy, props in self.stations:
+            x, y = wx * n, wy * n
+            key = (min(int(x), n - 1), min(int(y), n - 1))
+            if only is not None and key not in only:
+                continue
+            point = (int(round((x - key[0]) * EXTENT)), int(round((y - key[1]) * EXTENT)))
+            tiles.setdefault(key, {"lines": [], "stations": []})["stations"].append((1, [[point]], props))
+        return tiles
+
+def _tile_parts(geom, tx, ty):
+    '''裁剪后的几何 -> 瓦片内整数坐标的线段列表, 去掉重复点'''
+    if geom.is_empty:
+        return []
+    lines = geom.geoms if hasattr(geom, 'geoms') else [geom]
+    parts = []
+    for g in lines:
+        if g.geom_type != 'LineString':
+            continue
+        coords = np.rint((np.asarray(g.coords)[:, :2] - (tx, ty)) * EXTENT).astype(np.int64)
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        coords = coords[keep]
+        if len(coords) >= 2:
+            parts.append([tuple(p) for p in coords.tolist()])
+    return parts
+
+# --- MBTiles 缓存 ---
+
+class TileCache:
+    '''
+    MBTiles 格式的瓦片库 (tiles 表按 TMS 行号, 数据为 gzip 压缩的 pbf).
+    额外的 tile_index 记录每个公司覆盖的瓦片, company_state 记录公司指纹;
+    构建后只重新生成指纹变化的公司覆盖的 (新旧) 瓦片.
+    '''
+    def __init__(self, path, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        self.path = path
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL") # 读取方 (瓦片路由) 不被写入阻塞
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+            CREATE TABLE IF NOT EXISTS tile_index (
+                company TEXT, zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_tile_index_company ON tile_index (company);
+            CREATE INDEX IF NOT EXISTS idx_tile_index_tile ON tile_index (zoom_level, tile_column, tile_row);
+            CREATE TABLE IF NOT EXISTS company_state (company TEXT PRIMARY KEY, fingerprint TEXT);
+        ''')
+        return conn
+
+    def update(self, companies):
+        '''
+        companies: {company_id: CompanyFeatures}, 应包含全部公司 (缺少的视为已删除).
+        返回 {"changed": 公司数, "tiles": 重写的瓦片数}
+        '''
+        conn = self._connect()
+        try:
+            stored = dict(conn.execute("SELECT company, fingerprint FROM company_state"))
+            changed = {cid for cid, f in companies.items() if stored.get(cid) != f.fingerprint}
+            changed |= set(stored) - set(companies)
+            if not changed:
+                return {"changed": 0, "tiles": 0}
+
+            old_tiles = {}
+            for cid in changed:
+                for z, x, y in conn.execute(
+                    "SELECT zoom_level, tile_column, tile_row FROM tile_index WHERE company = ?", (cid,)
+                ):
+                    old_tiles.setdefault(z, set()).add((x, y))
+                conn.execute("DELETE FROM tile_index WHERE company = ?", (cid,))
+                conn.execute("DELETE FROM company_state WHERE company = ?", (cid,))
+            for cid in changed & set(companies):
+                conn.execute("INSERT INTO company_state VALUES (?, ?)", (cid, companies[cid].fingerprint))
+
+            # 逐级处理, 同一时间只保留一个级别的切分结果
+            written = 0
+            for z in range(self.min_zoom, self.max_zoom + 1):
+                # 1. 变化公司的新覆盖范围, 与旧范围合并为脏瓦片
+                cuts = {}
+                dirty = set(old_tiles.get(z, ()))
+                for cid in changed & set(companies):
+                    cuts[cid] = companies[cid].cut(z)
+                    conn.executemany("INSERT INTO tile_index VALUES (?, ?, ?, ?)", [(cid, z, x, y) for x, y in cuts[cid]])
+                    dirty.update(cuts[cid])
+
+                # 2. 与脏瓦片共享的未变化公司, 只切分这些瓦片
+                owners = {}
+                for x, y in dirty:
+                    for (cid,) in conn.execute(
+                        "SELECT company FROM tile_index WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, y)
+                    ):
+                        owners.setdefault(cid, set()).add((x, y))
+                for cid, only in owners.items():
+                    if cid not in cuts and cid in companies:
+                        cuts[cid] = companies[cid].cut(z, only)
+
+                # 3. 合并并写入 (无要素的瓦片删除)
+                for x, y in dirty:
+                    lines, stations = [], []
+                    for cid in owners:
+                        feats = cuts.get(cid, {}).get((x, y))
+                        if feats:
+                            lines += feats["lines"]
+                            stations += feats["stations"]
+                    tms_row = (2 ** z) - 1 - y
+                    data = encode_layer(LINE_LAYER, lines) + encode_layer(STATION_LAYER, stations)
+                    if data:
+                        conn.execute("INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, tms_row, gzip.compress(data, 6)))
+                    else:
+                        conn.execute("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", (z, x, tms_row))
+                    written += 1
+
+            self._write_metadata(conn)
+            conn.commit()
+            return {"changed": len(changed), "tiles": written}
+        finally:
+            conn.close()
+
+    def _write_metadata(self, conn):
+        meta = {
+            "name": "railround",
+            "format": "pbf",
+            "type": "overlay",
+            "minzoom": str(self.min_zoom),
+            "maxzoom": str(self.max_zoom),
+            "bounds": "122,20,154,46",
+            "json": json.dumps({"vector_layers": [
+                {"id": LINE_LAYER, "fields": {"company": "String", "name": "String", "line_cd": "Number", "type": "String", "stroke": "String"}},
+                {"id": STATION_LAYER, "fields": {"company": "String", "line": "String", "name": "String", "station_cd": "Number", "station_g_cd": "Number"}},
+            ]}),
+        }
+        conn.executemany("INSERT OR REPLACE INTO metadata VALUES (?, ?)", meta.items())
+
+# --- 读取 (瓦片路由) ---
+
+_readers = threading.local()
+
+def read_tile(path, z, x, y):
+    '''返回 gzip 压缩的 pbf; 瓦片库不存在 (或为无 tiles 表的旧文件) 或无此瓦片时返回 None'''
+    conns = getattr(_readers, 'conns', None)
+    if conns is None:
+        conns = _readers.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        if not os.path.exists(path):
+            return None
+        conn = conns[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (2 ** z) - 1 - y)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None # 无 tiles 表
+    return row[0] if row else None
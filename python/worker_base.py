@@ -1,167 +1,276 @@
 import time
-import os
 import logging
 import uuid
 import threading
+from collections import deque
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 
+import log_setup
+from event_scheduler import SystemClock
+from metrics import WORKER_RUN_DURATION, WORKER_ITEMS, WORKER_ITEMS_PER_SECOND, CACHE_REQUESTS
+
+class RunCancelled(Exception):
+    '''运行被请求取消 (由 Worker 在安全点抛出)'''
+    pass
+
+class ObservedStatus(dict):
+    '''状态字典, 写入时调用 on_change (Worker 状态散落在 Worker 与 Manager 多处修改)'''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_change = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.on_change:
+            self.on_change()
+
 class WorkerAdapter(logging.LoggerAdapter):
     def process(self, msg, kwargs):
         return '[RunID:%s] %s' % (self.extra['worker'].run_id or 'None', msg), kwargs # type: ignore
 
 class ProgressTracker:
-    def __init__(self):
+    '''
+    进度跟踪. 最近的增量以 (时间戳, 数量, 单项耗时或 None) 存入定长环形缓冲,
+    速度/ETA 按滑动窗口 (不足时退回 EWMA) 计算, 不受开头慢启动或中途限速的影响.
+    increment() 只做 O(1) 的追加与 EWMA 更新, 统计在读取视图时计算.
+    '''
+    def __init__(self, window: int = 512, rate_window: float = 60.0, alpha: float = 0.2):
         self._lock = threading.Lock()
+        self.window = window # 环形缓冲长度
+        self.rate_window = rate_window # 速度统计窗口 (秒)
+        self.alpha = alpha # EWMA 平滑系数
         self.total = 0
         self.current = 0
         self.start_time = 0
         self.error = 0
         self._errors = []
         self.run_id = ''
-
-    def start(self, total: int, run_id: str = ''):
-        '''开始任务'''
+        self.on_change = None # 进度变化回调, 由 Worker 绑定到推送
+        self._reset()
+
+    def _reset(self):
+        self._events = deque(maxlen=self.window) # (timestamp, n, latency|None)
+        self._last_time = self.start_time
+        self._ewma_interval = 0.0 # 平均单项间隔 (秒)
+        self._phases = {} # name -> {count, start, end}
+        self._phase = None
+        self._units = 0 # 开放式任务的单元总数 (如公司数), 0 表示 total 已知
+        self._units_seen = 0
+
+    def start(self, total: int, run_id: str = '', units: int = 0):
+        '''
+        开始任务.
+        units > 0 表示 total 随运行增长 (每个单元调用一次 add_to_total),
+        此时按已发现单元的平均规模估算最终总数.
+        '''
         with self._lock:
             self.total = total
             self.current = 0
             self.start_time = time.time()
             self.run_id = run_id
+            self._reset()
+            self._units = units
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def phase(self, name: str):
+        '''切换阶段, 之后的增量计入该阶段'''
+        with self._lock:
+            now = time.time()
+            if self._phase:
+                self._phases[self._phase]['end'] = now
+            self._phase = name
+            self._phases.setdefault(name, {'count': 0, 'start': now, 'end': 0.0})
+            self._phases[name]['end'] = 0.0
+        self._changed()
+
+    def _record(self, n, now, latency=None):
+        interval = (now - self._last_time) / n
+        self._last_time = now
+        self._events.append((now, n, latency))
+        self._ewma_interval = interval if not self._ewma_interval else \
+            self.alpha * interval + (1 - self.alpha) * self._ewma_interval
+        if self._phase:
+            self._phases[self._phase]['count'] += n
 
     def update(self, current: int):
         '''更新进度'''
         with self._lock:
+            delta = current - self.current
             self.current = current
+            if delta > 0:
+                self._record(delta, time.time())
+        self._changed()
+
+    def increment(self, item=None, latency: Optional[float] = None):
+        '''
+        进度+1; latency 为调用方计时的该项实际耗时, 省略时不计入 p50/p95.
+        (并发时相邻完成的间隔不是单项耗时, 不能代替)
+        '''
+        with self._lock:
+            self.current += 1
+            if item is not None:
+                self._item = item
+            self._record(1, time.time(), latency)
+        self._changed()
+
+    def set_total(self, total: int):
+        '''运行中修正总数, 不清空已记录的进度'''
+        with self._lock:
+            self.total = total
+        self._changed()
+
+    def add_to_total(self, n: int):
+        '''增加总数'''
+        with self._lock:
+            self.total += n
+            self._units_seen += 1
+        self._changed()
+
+    @property
+    def error_count(self):
+        return len(self._errors)
+
+    def recErr(self,err:str):
+        with self._lock:
+            self._errors.append(err)
+        self._changed()
+
+    @staticmethod
+    def _percentile(sorted_values, q):
+        if not sorted_values:
+            return 0.0
+        return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+    def _stats(self, now):
+        '''在锁内计算速度/ETA/分位数'''
+        elapsed = now - self.start_time
+
+        # 估算总数: 已发现单元的平均规模 x 剩余单元
+        total = self.total
+        estimated = self._units > self._units_seen
+        if estimated and self._units_seen:
+            total = int(round(self.total / self._units_seen * self._units))
+
+        # 窗口速度; 窗口内样本不足时使用 EWMA
+        cutoff = now - self.rate_window
+        recent = [e for e in self._events if e[0] >= cutoff]
+        speed = 0.0
+        if len(recent) >= 2:
+            span = max(now - recent[0][0], 1e-6)
+            speed = sum(e[1] for e in recent[1:]) / span
+        elif self._ewma_interval > 0:
+            speed = 1 / self._ewma_interval
+        elif self.current > 0 and elapsed > 0:
+            speed = self.current / elapsed
+
+        eta = int((total - self.current) / speed) if speed > 0 and total > self.current else 0
+
+        latencies = sorted(e[2] for e in self._events if e[2] is not None)
+        phases = [
+            {
+                "name": name,
+                "count": p['count'],
+                "seconds": round((p['end'] or now) - p['start'], 2),
+                "speed": round(p['count'] / max((p['end'] or now) - p['start'], 1e-6), 2)
+            }
+            for name, p in self._phases.items()
+        ]
+        return {
+            "elapsed": elapsed,
+            "total": total,
+            "estimated": estimated,
+            "speed": round(speed, 2),
+            "ewma_speed": round(1 / self._ewma_interval, 2) if self._ewma_interval > 0 else 0.0,
+            "eta": eta,
+            "p50": round(self._percentile(latencies, 0.5), 3),
+            "p95": round(self._percentile(latencies, 0.95), 3),
+            "phases": phases,
+        }
 
     def get_snapshot(self):
         '''获取展示数据'''
         with self._lock:
-            # 1. 耗时计算
-            elapsed = time.time() - self.start_time
-
-            # 2. 进度计算
-            if self.total == 0:
-                percent = 0
-            else:
-                percent = int((self.current / self.total) * 100)
-
-            # 3. ETA 计算 (核心)
-            eta_seconds = 0
-            speed = 0
-            if self.current > 0:
-                # 平均处理速度 (秒/个)
-                avg_time_per_item = elapsed / self.current
-                remaining_items = self.total - self.current
-                eta_seconds = int(avg_time_per_item * remaining_items)
-                speed = round(self.current / elapsed, 2) # 个/秒
-
-            # 4. 格式化输出 (给人类看的)
+            stats = self._stats(time.time())
+            total = stats['total']
+            percent = int((self.current / total) * 100) if total else 0
+
+            # 格式化输出 (给人类看的)
             return {
-                "progress": f"{self.current}/{self.total}",
+                "progress": f"{self.current}/{'~' if stats['estimated'] else ''}{total}",
                 "percent": f"{percent}%",
-                "elapsed": f"{int(elapsed)}s",
-                "eta": f"{eta_seconds}s",  # 剩余秒数
-                "speed": f"{speed}/s"      # 速度
+                "elapsed": f"{int(stats['elapsed'])}s",
+                "eta": f"{stats['eta']}s",  # 剩余秒数
+                "speed": f"{stats['speed']}/s",  # 窗口速度
+                "latency": f"p50 {stats['p50']}s / p95 {stats['p95']}s"
             }
 
     def get_view_model(self):
         '''为前端生成数据字典'''
         with self._lock:
-            elapsed = time.time() - self.start_time
+            stats = self._stats(time.time())
+            total = stats['total']
 
-            # 基础计算
             percent = 0
-            if self.total > 0:
-                percent = round((self.current / self.total) * 100, 1)
-
-            # ETA 计算
-            eta = 0
-            speed = 0.0
-            if self.current > 0 and self.total > 0:
-                avg_time = elapsed / self.current
-                eta = int(avg_time * (self.total - self.current))
-                speed = round(self.current / elapsed, 2)
+            if total > 0:
+                percent = round((self.current / total) * 100, 1)
 
             return {
                 "current": self.current,
-                "total": self.total,
+                "total": total,
+                "total_estimated": stats['estimated'],
                 "percent": percent,
-                "eta_seconds": eta,
-                "speed": speed,
+                "eta_seconds": stats['eta'],
+                "speed": stats['speed'],
+                "ewma_speed": stats['ewma_speed'],
+                "latency_p50": stats['p50'],
+                "latency_p95": stats['p95'],
+                "phases": stats['phases'],
                 "error": self.error,
                 "run_id": self.run_id,
                 # 如果 current < total 且 total > 0，认为 active
-                "is_active": (self.current < self.total) and (self.total > 0)
+                "is_active": (self.current < total) and (total > 0)
             }
 
-    def increment(self, item= None):
-        '''进度+1'''
-        with self._lock:
-            self.current += 1
-            if item is not None:
-                self._item = item
-
-    def add_to_total(self, n: int):
-        '''增加总数'''
-        with self._lock:
-            self.total += n
-
-    def recErr(self,err:str):
-        with self._lock:
-            self._errors.append(err)
-
 class WorkerProcess(ABC):
     def __init__(self, name: str, period: int, type_str: str, max_retry=3):
         self.name = name
         self.period = period if period>=3600 else 3600 # 部分任务耗时, 周期太短干扰调度
         self.type = type_str
-        self.log_dir = 'logs'
+        self.log_dir = log_setup.LOG_DIR
         self.max_retry = max_retry
         self.run_id = ''
 
         self.logger = self._setup_logger()
         self.tracker = ProgressTracker()
+        self.tracker.on_change = self.notify_changed
+        self.run_handle = None # 由 WorkerExecutor 设置
+        self._cancel = threading.Event()
+        self.on_change = None # on_change(worker), 由 WorkerManager 设置
+        self.clock = SystemClock() # 排程时钟, 由 WorkerManager 设置为其 clock
 
         # 初始化状态字典
-        self.status = {
+        self.status = ObservedStatus({
             'starttime': time.time(),
             'nextrun': time.time(),
             'uptime': 0,
             'lastrun': 0,
+            'lastfinish': 0,
             'lastreturn': None,
             'statcode': 0,  # 0: Idle, 1: Running, 200: Success, 500: Error
-            'retry':0
-        }
+            'retry':0,
+            'fingerprint': None, # 上次成功运行时的输入指纹
+            'skipped': False
+        })
+        self.status.on_change = self.notify_changed
 
     def _setup_logger(self):
-        '''配置独立 Logger'''
-        # 1. 创建 Logger
-        logger = logging.getLogger(f"Worker.{self.name}")
-        logger.setLevel(logging.INFO)
-
-        # 2. 防止重复添加 Handler
-        if not logger.hasHandlers():
-            if not os.path.exists(self.log_dir):
-                os.makedirs(self.log_dir)
-
-            formatter = logging.Formatter(
-                '[%(asctime)s] [%(levelname)s] [%(name)s] %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-
-            # 3. 文件输出
-            file_handler = logging.FileHandler(
-                os.path.join(self.log_dir, f"{self.name}.log"),
-                encoding='utf-8'
-            )
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
-
-            # 4. 控制台输出
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
-
+        '''独立 Logger; 输出经根 logger 的队列交给后台线程写入 logs/<name>.log (按大小轮转)'''
+        logger = log_setup.get_logger(f"Worker.{self.name}", logging.INFO)
         return WorkerAdapter(logger, {'worker': self})
 
     def _pre_run(self):
@@ -169,12 +278,14 @@ class WorkerProcess(ABC):
         self.status['lastrun'] = time.time()
         self.status['statcode'] = 1
         self.run_id = str(uuid.uuid4())[:8]
+        self._cancel.clear()
         self.logger.info(f"Starting Run {self.run_id}")
 
     def _post_run(self, result, error=None):
         '''运行后更新状态'''
         current_time = time.time()
         self.status['uptime'] = current_time - self.status['starttime']
+        self.status['lastfinish'] = current_time
 
         summary = f"Run {self.run_id} Finished. Total Processed: {self.tracker.current}, Time Taken: {round(self.status['uptime'], 2)}s"
 
@@ -184,9 +295,10 @@ class WorkerProcess(ABC):
             self.status['retry'] += 1
             self.logger.error(f"{summary} (with errors)")
         else:
-            self.status['statcode'] = 200
+            # 下次运行时间按排程时钟计算, 先于 statcode 写入, 看到 200 时 nextrun 已是最终值
+            self.status['nextrun'] = self.clock.time() + self.period
             self.status['lastreturn'] = result
-            self.status['nextrun'] = current_time + self.period
+            self.status['statcode'] = 200
             self.logger.info(summary)
 
     def get_dashboard_view(self):
@@ -204,9 +316,23 @@ class WorkerProcess(ABC):
             "progress": prog_data,
             "last_update_ts": time.time(),
 
-            "log_preview": str(self.status.get('lastreturn') or "Ready")[:50]
+            "log_preview": str(self.status.get('lastreturn') or "Ready")[:50],
+            "queue": self._get_queue_view()
         }
 
+    def _get_queue_view(self):
+        """执行器中的排队信息"""
+        handle = self.run_handle
+        if not handle:
+            return None
+        view = handle.executor.stats()
+        view.update({
+            "state": handle.state,
+            "priority": handle.priority,
+            "wait_seconds": handle.wait_seconds
+        })
+        return view
+
     def _get_status_text(self, code):
         mapping = {0: "待机", 1: "运行中", 200: "完成", 500: "错误"}
         return mapping.get(code, "Unknown")
@@ -214,12 +340,44 @@ class WorkerProcess(ABC):
     def run(self):
         # 抽象统一流程
         self._pre_run()
+        started = time.perf_counter()
+        try:
+            self._run()
+        finally:
+            self._record_metrics(time.perf_counter() - started)
+
+    def _record_metrics(self, duration):
+        WORKER_RUN_DURATION.observe(duration, worker=self.name, type=self.type, status=self.status['statcode'])
+        if not self.status['skipped']:
+            WORKER_ITEMS.inc(self.tracker.current, worker=self.name)
+            if duration > 0:
+                WORKER_ITEMS_PER_SECOND.set(round(self.tracker.current / duration, 3), worker=self.name)
+
+    def _run(self):
 
         # 子类一定要调用tracker.start()!!!!!
 
         try:
+            # 输入未变化时跳过
+            fingerprint = self.input_fingerprint()
+            if fingerprint is not None:
+                hit = fingerprint == self.status['fingerprint']
+                CACHE_REQUESTS.inc(cache='stage_fingerprint', result='hit' if hit else 'miss')
+            if fingerprint is not None and fingerprint == self.status['fingerprint']:
+                self.status['skipped'] = True
+                self._post_run("Skipped: inputs unchanged")
+                return
+
+            self.status['skipped'] = False
             result_msg = self.trigger()
             self._post_run(result_msg)
+            self.status['fingerprint'] = fingerprint
+
+        except RunCancelled:
+            self.logger.warning(f"Run {self.run_id} cancelled")
+            self.status['statcode'] = 0
+            self.status['lastfinish'] = time.time()
+            self.status['lastreturn'] = "Cancelled"
 
         except Exception as e:
             # 统一的错误处理
@@ -227,6 +385,27 @@ class WorkerProcess(ABC):
             self.tracker.recErr(str(e))
             self._post_run(None, error=e)
 
+    def input_fingerprint(self):
+        """
+        输入指纹, 与上次成功运行相同时跳过本次运行.
+        返回 None 表示总是运行 (默认).
+        """
+        return None
+
+    def notify_changed(self):
+        '''状态/进度/排队变化, 通知仪表盘推送'''
+        if self.on_change:
+            self.on_change(self)
+
+    def request_cancel(self):
+        """请求取消当前运行"""
+        self._cancel.set()
+
+    def check_cancelled(self):
+        """在安全点调用: 已请求取消时中止运行"""
+        if self._cancel.is_set():
+            raise RunCancelled()
+
     def mark_failed(self):
         """标记为失败, 并计数"""
         self.status['retry'] += 1
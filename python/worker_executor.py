@@ -0,0 +1,171 @@
+import time
+import heapq
+import itertools
+import threading
+from typing import Dict, Optional
+
+# 优先级: 数值越小越先运行
+PRIORITY_MANUAL = 0
+PRIORITY_SCHEDULED = 10
+PRIORITY_RETRY = 20
+
+class RunHandle:
+    '''一次提交的运行: queued -> running -> done, 或 cancelled'''
+    def __init__(self, executor, worker, fn, priority, callback=None):
+        self.executor = executor
+        self.worker = worker
+        self.fn = fn
+        self.callback = callback
+        self.priority = priority
+        self.state = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.error = None
+        self._done = threading.Event()
+
+    @property
+    def wait_seconds(self):
+        '''排队等待时长 (仍在排队时为当前已等待时长)'''
+        end = self.started_at or (self.finished_at if self.state == 'cancelled' else time.time())
+        return round(end - self.submitted_at, 2)
+
+    def cancel(self):
+        '''排队中直接移除; 运行中则请求 Worker 协作取消'''
+        return self.executor.cancel(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+class WorkerExecutor:
+    '''
+    管理 Worker 运行的有界线程池.
+    全局并发上限 + 按 worker.type 的并发上限, 同一 Worker 不会重叠运行, 队列按优先级出队.
+    '''
+    def __init__(self, max_workers=4, type_limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max_workers
+        self.type_limits = type_limits or {}
+
+        self._cond = threading.Condition()
+        self._queue = [] # (priority, seq, handle)
+        self._seq = itertools.count()
+        self._active: Dict[str, RunHandle] = {} # worker.name -> 排队/运行中的 handle
+        self._running_by_type: Dict[str, int] = {}
+        self._running = 0
+        self._last_wait = 0.0
+
+        self._threads = []
+        for i in range(max_workers):
+            t = threading.Thread(target=self._work, name=f"WorkerExecutor-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, worker, fn=None, priority=PRIORITY_SCHEDULED, callback=None) -> RunHandle:
+        '''
+        提交运行; 该 Worker 已在排队或运行时返回已有 handle.
+        callback(handle) 在运行结束且 handle 移出队列后调用, 此时可再次提交同一 Worker.
+        '''
+        with self._cond:
+            existing = self._active.get(worker.name)
+            if existing:
+                # 排队中的提交可被更高优先级提升
+                if existing.state == 'queued' and priority < existing.priority:
+                    existing.priority = priority
+                    heapq.heappush(self._queue, (priority, next(self._seq), existing))
+                return existing
+
+            handle = RunHandle(self, worker, fn or worker.run, priority, callback)
+            self._active[worker.name] = handle
+            worker.run_handle = handle
+            heapq.heappush(self._queue, (priority, next(self._seq), handle))
+            self._cond.notify_all()
+        worker.notify_changed()
+        return handle
+
+    def cancel(self, handle: RunHandle):
+        with self._cond:
+            if handle.state == 'queued':
+                handle.state = 'cancelled'
+                handle.finished_at = time.time()
+                self._active.pop(handle.worker.name, None)
+                handle._done.set()
+            elif handle.state == 'running':
+                handle.worker.request_cancel()
+                return True
+            else:
+                return False
+        handle.worker.notify_changed()
+        return True
+
+    def busy(self):
+        '''是否仍有排队或运行中的任务'''
+        with self._cond:
+            return bool(self._active)
+
+    def stats(self):
+        '''队列深度与等待时间, 供仪表盘展示'''
+        with self._cond:
+            queued = [h for h in self._active.values() if h.state == 'queued']
+            return {
+                "queue_depth": len(queued),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "oldest_wait": max((h.wait_seconds for h in queued), default=0),
+                "last_wait": self._last_wait
+            }
+
+    def _limit(self, type_str):
+        return self.type_limits.get(type_str, self.max_workers)
+
+    def _next_runnable(self):
+        '''按优先级取第一个满足类型并发上限的 handle, 跳过已作废的堆项'''
+        skipped = []
+        found = None
+        while self._queue:
+            priority, seq, handle = heapq.heappop(self._queue)
+            if handle.state != 'queued' or priority != handle.priority:
+                continue # 已取消 / 已被提升优先级的旧项
+            if self._running_by_type.get(handle.worker.type, 0) >= self._limit(handle.worker.type):
+                skipped.append((priority, seq, handle))
+                continue
+            found = handle
+            break
+        for item in skipped:
+            heapq.heappush(self._queue, item)
+        return found
+
+    def _work(self):
+        while True:
+            with self._cond:
+                handle = self._next_runnable()
+                while handle is None:
+                    self._cond.wait()
+                    handle = self._next_runnable()
+
+                handle.state = 'running'
+                handle.started_at = time.time()
+                self._last_wait = handle.wait_seconds
+                self._running += 1
+                type_str = handle.worker.type
+                self._running_by_type[type_str] = self._running_by_type.get(type_str, 0) + 1
+            handle.worker.notify_changed()
+
+            try:
+                handle.fn()
+            except Exception as e:
+                handle.error = e
+            finally:
+                with self._cond:
+                    handle.state = 'done'
+                    handle.finished_at = time.time()
+                    self._running -= 1
+                    self._running_by_type[type_str] -= 1
+                    if self._active.get(handle.worker.name) is handle:
+                        del self._active[handle.worker.name]
+                    self._cond.notify_all()
+                handle._done.set()
+                if handle.callback:
+                    handle.callback(handle)
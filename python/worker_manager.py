@@ -1,22 +1,34 @@
 import time
 import threading
-from typing import Dict, Any, Type, Optional
+from typing import Dict, Any, List, Type, Optional
 
 from worker_base import WorkerProcess, ProgressTracker, WorkerAdapter
 
 # 自定义worker类
 from geojson_crawler import GeoJsonWorker
 from ekidata_crawler import EkidataWorker
-from railway_processer import RailwayDataService
+from pipeline_stages import EkidataDeltaWorker, BuildWorker
 from line_segmenter import LineSegmenter
+from event_scheduler import EventScheduler
+from worker_executor import WorkerExecutor, PRIORITY_MANUAL, PRIORITY_SCHEDULED, PRIORITY_RETRY
+from worker_state import WorkerStateStore
 
 class WorkerRegistry:
     _name_to_cls: Dict[str, Type[WorkerProcess]] = {}
     _cls_to_name: Dict[Type[WorkerProcess], str] = {}
+    _dependencies: Dict[str, List[str]] = {} # 流水线 DAG: 类型 -> 上游类型
     
     @classmethod
-    def register(cls, name: str, worker_cls: Type[WorkerProcess]):
-        """绑定Worker类和唯一名称的双向字典"""
+    def register(cls, name: str, worker_cls: Type[WorkerProcess], after: Optional[List[str]] = None):
+        """
+        绑定Worker类和唯一名称的双向字典.
+        after: 上游类型列表, 非空时该类型为流水线阶段, 由上游完成触发而非按周期运行.
+        上游必须先注册, 因此依赖关系天然无环.
+        """
+        for dep in after or []:
+            if dep not in cls._name_to_cls:
+                raise ValueError(f"上游 Worker 类型 '{dep}' 未注册.")
+
         if name in cls._name_to_cls:
             if cls._name_to_cls[name] != worker_cls:
                 raise ValueError(f"Worker 实例 '{name}' 已注册为 {cls._name_to_cls[name]} 类.")
@@ -27,6 +39,7 @@ class WorkerRegistry:
         
         cls._name_to_cls[name] = worker_cls
         cls._cls_to_name[worker_cls] = name
+        cls._dependencies[name] = list(after or [])
         
     @classmethod
     def get_cls(cls, name: str) -> Optional[Type[WorkerProcess]]:
@@ -36,22 +49,46 @@ class WorkerRegistry:
     def get_name(cls, worker_cls: Type[WorkerProcess]) -> Optional[str]:
         return cls._cls_to_name.get(worker_cls)
     
+    @classmethod
+    def get_dependencies(cls, name: str) -> List[str]:
+        return cls._dependencies.get(name, [])
+
     @classmethod
     def get_all_registered(cls):
         return cls._name_to_cls.copy()
 
+# 流水线: geojson/ekidata 爬取 -> ekidata 差分 -> 构建
 WorkerRegistry.register("geojson", GeoJsonWorker)
 WorkerRegistry.register("ekidata", EkidataWorker)
+WorkerRegistry.register("ekidata_delta", EkidataDeltaWorker, after=["ekidata"])
+WorkerRegistry.register("build", BuildWorker, after=["geojson", "ekidata_delta"])
 #WorkerRegistry.register("Line Segmentation", LineSegmenter)
 
 class WorkerManager:
-    def __init__(self):
+    # 每类 Worker 的并发上限, 未列出的类型只受全局上限约束
+    TYPE_LIMITS = {
+        "ekidata_crawler": 1,
+        "geojson_process": 1,
+    }
+
+    def __init__(self, clock=None, max_concurrent=4, state_store: Optional[WorkerStateStore] = None):
         self._workers: Dict[str, WorkerProcess] = {}
+        self.state_store = state_store # 为 None 时不持久化 (测试)
         self._lock = threading.Lock()
 
-        self.processor = RailwayDataService()
-
         self.cycle_active = False
+        self.cycle_started = 0.0
+        self.last_cycle_report = None
+
+        # 事件驱动调度: 截止时间堆 + 条件变量, clock 可替换为 VirtualClock 测试
+        self.scheduler = EventScheduler(clock)
+        self.clock = self.scheduler.clock
+        self._stopped = False
+
+        # 有界执行器: 全局/按类型并发上限 + 优先级队列
+        self.executor = WorkerExecutor(max_concurrent, self.TYPE_LIMITS)
+        self._manual = set() # 手动启动的 Worker 以高优先级排队
+        self._change_listeners = [] # listener(worker_name), Worker 状态/进度变化时调用
     
     def create_worker(self, type_name: str, instance_name: str, **kwargs) -> WorkerProcess:
         
@@ -64,8 +101,59 @@ class WorkerManager:
                 raise ValueError(f"未知 Worker 类型: '{type_name}'")
             
             worker = worker_cls(name=instance_name, **kwargs)
+            worker.clock = self.clock
+            worker.status['nextrun'] = self.clock.time()
+            interrupted = self._restore_state(worker)
+            worker.on_change = self._on_worker_change
             self._workers[instance_name] = worker
-            return worker
+            # 流水线阶段由上游触发, 不按周期排程; 上次运行中被中断的阶段立即重新运行
+            if not WorkerRegistry.get_dependencies(type_name) or interrupted:
+                self.scheduler.schedule(instance_name, worker.status['nextrun'])
+        self._on_worker_change(worker)
+        return worker
+
+    def add_change_listener(self, listener):
+        self._change_listeners.append(listener)
+
+    def _on_worker_change(self, worker: WorkerProcess):
+        for listener in self._change_listeners:
+            listener(worker.name)
+
+    def _restore_state(self, worker: WorkerProcess) -> bool:
+        """
+        从状态库恢复上次的排程, 重启后按原计划继续而不是立即全部运行.
+        返回上次退出时是否仍在运行 (需要立即重新运行).
+        """
+        if not self.state_store:
+            return False
+        saved = self.state_store.load(worker.name)
+        if not saved:
+            return False
+        worker.period = saved['period'] or worker.period
+        for key, value in saved['status'].items():
+            if key in worker.status:
+                worker.status[key] = value
+        interrupted = worker.status['statcode'] == 1
+        if interrupted:
+            # 上次退出时仍在运行: 视为中断, 立即重新运行 (流水线阶段也由 create_worker 直接排程)
+            worker.status['statcode'] = 0
+            worker.status['nextrun'] = self.clock.time()
+        print(f"[State] 恢复 {worker.name}: 下次运行 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(worker.status['nextrun']))}")
+        return interrupted
+
+    def _save_state(self, worker: WorkerProcess, record_run=False):
+        if not self.state_store:
+            return
+        try:
+            if record_run:
+                self.state_store.record_run(worker)
+            self.state_store.save(worker)
+        except Exception as e:
+            print(f"[State] 保存 {worker.name} 状态失败: {e}")
+
+    def get_history(self, instance_name: str, limit=50):
+        """运行历史 (新在前)"""
+        return self.state_store.history(instance_name, limit) if self.state_store else []
 
     def get_worker(self, instance_name: str) -> Optional[WorkerProcess]:
         with self._lock:
@@ -75,59 +163,202 @@ class WorkerManager:
         with self._lock:
             return list(self._workers.values())
 
+    def get_workers_by_type(self, type_name: str) -> List[WorkerProcess]:
+        return [w for w in self.get_all_workers() if WorkerRegistry.get_name(type(w)) == type_name]
+
+    def _upstream(self, worker: WorkerProcess) -> List[WorkerProcess]:
+        """上游类型的所有实例"""
+        deps = WorkerRegistry.get_dependencies(WorkerRegistry.get_name(type(worker)))
+        return [w for w in self.get_all_workers() if WorkerRegistry.get_name(type(w)) in deps]
+
+    def _is_stage(self, worker: WorkerProcess) -> bool:
+        return bool(WorkerRegistry.get_dependencies(WorkerRegistry.get_name(type(worker))))
+
+    def _is_active(self, worker: WorkerProcess) -> bool:
+        handle = worker.run_handle
+        return worker.status['statcode'] == 1 or (handle is not None and handle.state in ('queued', 'running'))
+
+    def _is_settled(self, worker: WorkerProcess) -> bool:
+        """未在运行/排队, 且不会再重试"""
+        if self._is_active(worker):
+            return False
+        return not (worker.status['statcode'] == 500 and worker.status['retry'] < worker.max_retry)
+
+    def _succeeded(self, worker: WorkerProcess) -> bool:
+        """未在运行/排队, 且上次运行成功 (含输入未变而跳过)"""
+        return not self._is_active(worker) and worker.status['statcode'] == 200
+
+    def _trigger_stages(self):
+        """
+        上游全部成功且有上游在本阶段上次运行后完成时, 立即启动该阶段.
+        任一上游失败 (重试用尽) 时不触发, 避免用旧的输入构建.
+        """
+        for worker in self.get_all_workers():
+            if not self._is_stage(worker) or not self._is_settled(worker):
+                continue
+            upstream = self._upstream(worker)
+            if not upstream or not all(self._succeeded(u) for u in upstream):
+                continue
+            if max(u.status['lastfinish'] for u in upstream) > worker.status['lastrun']:
+                if worker.status['statcode'] == 500:
+                    # 上游有新结果, 重试次数已用尽的阶段重新开始计数
+                    worker.status['retry'] = 0
+                    worker.status['statcode'] = 0
+                self.scheduler.schedule(worker.name, 0)
+
+    def _critical_path(self, since: float):
+        """本周期内运行过的阶段中, 沿最晚完成的上游回溯得到关键路径"""
+        ran = {w.name: w for w in self.get_all_workers() if w.status['lastrun'] >= since}
+        if not ran:
+            return None
+
+        tail = max(ran.values(), key=lambda w: w.status['lastfinish'])
+        path = []
+        w = tail
+        while w:
+            path.append({
+                "name": w.name,
+                "duration": round(w.status['lastfinish'] - w.status['lastrun'], 2),
+                "skipped": w.status['skipped'],
+                "status_code": w.status['statcode']
+            })
+            upstream = [u for u in self._upstream(w) if u.name in ran]
+            w = max(upstream, key=lambda u: u.status['lastfinish']) if upstream else None
+        path.reverse()
+
+        return {
+            "started": since,
+            "duration": round(tail.status['lastfinish'] - since, 2),
+            "critical_path": path,
+            "stages_run": len(ran),
+            "stages_skipped": sum(1 for w in ran.values() if w.status['skipped'])
+        }
+
+    def start_worker(self, instance_name: str) -> bool:
+        """立即运行单个 Worker (手动运行不因输入未变而跳过)"""
+        worker = self.get_worker(instance_name)
+        if not worker:
+            return False
+        if worker.status['statcode'] != 1:
+            worker.status['nextrun'] = 0
+            worker.status['statcode'] = 0
+            worker.status['fingerprint'] = None
+            self._manual.add(instance_name)
+            self.scheduler.schedule(instance_name, 0)
+        return True
+
+    def cancel_worker(self, instance_name: str) -> bool:
+        """取消排队中或运行中的 Worker"""
+        worker = self.get_worker(instance_name)
+        if not worker or not worker.run_handle:
+            return False
+        was_queued = worker.run_handle.state == 'queued'
+        if not worker.run_handle.cancel():
+            return False
+        if was_queued:
+            # 排队中被取消: 顺延到下一个周期
+            worker.status['nextrun'] = self.clock.time() + worker.period
+            self.scheduler.schedule(instance_name, worker.status['nextrun'])
+            self._save_state(worker)
+        return True
+
+    def set_worker_period(self, instance_name: str, period: int) -> bool:
+        """修改周期, 已完成的 Worker 按新周期重新计算下次运行时间"""
+        worker = self.get_worker(instance_name)
+        if not worker:
+            return False
+        old_period = worker.period
+        worker.period = period
+        worker.notify_changed()
+        if worker.status['statcode'] == 200:
+            worker.status['nextrun'] += period - old_period
+            self.scheduler.schedule(instance_name, worker.status['nextrun'])
+        self._save_state(worker)
+        return True
+
     def start_full_cycle(self):
         """从头开始运行"""
         with self._lock:
             print("[周期] 全周期运行...")
             self.cycle_active = True
+            self.cycle_started = time.time()
             for worker in self._workers.values():
                 worker.status['nextrun'] = 0
                 if worker.status['statcode'] == 500:
                      worker.status['retry'] = 0
                      worker.status['statcode'] = 0 # 重置为 idle/ready
-        
-    def loop(self):
-        while True:
-            now = time.time()
+                # 只启动源头, 下游阶段随上游完成依次触发
+                stage = WorkerRegistry.get_dependencies(WorkerRegistry.get_name(type(worker)))
+                if worker.status['statcode'] != 1 and not stage:
+                    self.scheduler.schedule(worker.name, 0)
+        self.scheduler.wake()
+
+    def stop(self):
+        """结束 loop (测试用)"""
+        self._stopped = True
+        self.scheduler.wake()
+
+    def _launch(self, worker: WorkerProcess, priority=PRIORITY_SCHEDULED):
+        self.executor.submit(worker, priority=priority, callback=self._on_worker_done)
+
+    def _on_worker_done(self, handle):
+        """运行结束后按结果重新排程并唤醒 loop"""
+        worker = handle.worker
+        code = worker.status['statcode']
+        if code in [0, 200] and self._is_stage(worker):
+            self.scheduler.wake() # 由 loop 判断是否触发下游
+        elif code in [0, 200]:
+            # 200: nextrun 已由 Worker 按本 manager 的时钟写入; 0: 运行被取消, 同样顺延到下一个周期
+            if code == 0:
+                worker.status['nextrun'] = self.clock.time() + worker.period
+            self.scheduler.schedule(worker.name, worker.status['nextrun'])
+        elif code == 500 and worker.status['retry'] < worker.max_retry:
+            self.scheduler.schedule(worker.name, 0)
+        else:
+            self.scheduler.wake()
+        self._save_state(worker, record_run=True)
+
+    def run_pending(self):
+        """启动所有到期的 Worker, 并检查周期是否完成"""
+        # 1. 规划 (含上游已完成的流水线阶段)
+        self._trigger_stages()
+        for name in self.scheduler.pop_due():
+            worker = self.get_worker(name)
+            if not worker:
+                continue
+
+            # 状态检测
+            if worker.status['statcode'] in [0, 200]:
+                print(f"[周期] 开始运行 {worker.name} ({worker.type})")
+                worker.status['retry'] = 0
+                manual = name in self._manual
+                self._manual.discard(name)
+                self._launch(worker, PRIORITY_MANUAL if manual else PRIORITY_SCHEDULED)
+
+            elif worker.status['statcode'] == 500:
+                current_retries = worker.status['retry']
+                if current_retries < worker.max_retry:
+                    print(f"[Retry] {worker.name} failed. Retrying ({current_retries + 1}/{worker.max_retry})...")
+                    worker.mark_failed()
+                    self._launch(worker, PRIORITY_RETRY)
+
+        # 2. 循环
+        if self.cycle_active:
             workers_list = self.get_all_workers()
-            
-            # 1. 规划
-            for worker in workers_list:
-                # 状态检测
-                if worker.status['statcode'] in [0, 200] and now > worker.status.get('nextrun', 0):
-                    print(f"[周期] 开始运行 {worker.name} ({worker.type})")
-                    worker.status['retry'] = 0
-                    t = threading.Thread(target=worker.run)
-                    t.start()
-
-                elif worker.status['statcode'] == 500:
-                    current_retries = worker.status['retry']
-                    if current_retries < worker.max_retry:
-                        print(f"[Retry] {worker.name} failed. Retrying ({current_retries + 1}/{worker.max_retry})...")
-                        worker.mark_failed()
-                        t = threading.Thread(target=worker.run)
-                        t.start()
-                    else:
-                        pass 
-
-            # 2. 循环
-            if self.cycle_active:
-                all_finished = True
-                for worker in workers_list:
-                    if worker.status['statcode'] == 1:
-                        all_finished = False
-                        break
-
-                if all_finished and workers_list: 
-                    print("[Cycle] 完整运行周期完成. 正在生成格式化数据...")
-                    try:
-                        self.processor.build()
-                        print("[Cycle] 完成数据生成.")
-                    except Exception as e:
-                        print(f"[Cycle] 数据生成错误: {e}")
-
-                    self.cycle_active = False
-
-            time.sleep(1)
-
-manager = WorkerManager()
\ No newline at end of file
+            # 排队/运行中或仍会重试的阶段均视为未完成
+            all_finished = not self.executor.busy() and all(self._is_settled(w) for w in workers_list)
+
+            if all_finished and workers_list: 
+                self.last_cycle_report = self._critical_path(self.cycle_started)
+                report = self.last_cycle_report or {}
+                path = " -> ".join(f"{p['name']}({p['duration']}s)" for p in report.get('critical_path', []))
+                print(f"[Cycle] 完整运行周期完成, 耗时 {report.get('duration', 0)}s. 关键路径: {path}")
+                self.cycle_active = False
+
+    def loop(self):
+        while not self._stopped:
+            self.run_pending()
+            # 睡眠直到下一个截止时间, 或被 start_worker / 运行结束 / 周期变化唤醒
+            self.scheduler.wait()
+
+manager = WorkerManager(state_store=WorkerStateStore("workers.db"))
\ No newline at end of file
@@ -0,0 +1,108 @@
+import json
+import time
+import sqlite3
+import threading
+
+# 需要跨重启保留的状态字段
+PERSISTED_KEYS = ('nextrun', 'lastrun', 'lastfinish', 'lastreturn', 'statcode', 'retry', 'fingerprint', 'skipped')
+
+class WorkerStateStore:
+    '''
+    Worker 状态与运行历史的 SQLite 存储.
+    worker_state 每个实例一行 (覆盖写), worker_runs 每次运行一行, 按实例保留最近 retention 条.
+    连接在首次使用时建立, 由锁串行化 (调度线程与执行器线程都会写入).
+    '''
+    def __init__(self, path="workers.db", retention=500):
+        self.path = path
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS worker_state (
+                    name TEXT PRIMARY KEY,
+                    type TEXT,
+                    period INTEGER,
+                    status TEXT,
+                    updated_at REAL
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS worker_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT,
+                    type TEXT,
+                    run_id TEXT,
+                    started_at REAL,
+                    finished_at REAL,
+                    duration REAL,
+                    status_code INTEGER,
+                    items INTEGER,
+                    errors INTEGER,
+                    skipped INTEGER,
+                    result TEXT
+                )
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_worker_runs_name ON worker_runs (name, id)")
+            self._conn.commit()
+        return self._conn
+
+    def load(self, name):
+        '''返回 {'period', 'status'}; 无记录时返回 None'''
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT period, status FROM worker_state WHERE name = ?", (name,)
+            ).fetchone()
+        if not row:
+            return None
+        return {'period': row[0], 'status': json.loads(row[1])}
+
+    def save(self, worker):
+        status = {k: worker.status.get(k) for k in PERSISTED_KEYS}
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO worker_state (name, type, period, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (worker.name, worker.type, worker.period, json.dumps(status, ensure_ascii=False, default=str), time.time())
+            )
+            conn.commit()
+
+    def record_run(self, worker):
+        '''追加一次运行记录, 并清理超出保留数的旧记录'''
+        s = worker.status
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO worker_runs (name, type, run_id, started_at, finished_at, duration, status_code, items, errors, skipped, result) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (worker.name, worker.type, worker.run_id, s['lastrun'], s['lastfinish'],
+                 round(max(s['lastfinish'] - s['lastrun'], 0), 3), s['statcode'],
+                 worker.tracker.current, worker.tracker.error_count, int(bool(s['skipped'])),
+                 str(s['lastreturn'])[:500] if s['lastreturn'] is not None else None)
+            )
+            conn.execute(
+                "DELETE FROM worker_runs WHERE name = ? AND id NOT IN "
+                "(SELECT id FROM worker_runs WHERE name = ? ORDER BY id DESC LIMIT ?)",
+                (worker.name, worker.name, self.retention)
+            )
+            conn.commit()
+
+    def history(self, name, limit=50):
+        '''最近的运行记录 (新在前)'''
+        with self._lock:
+            cursor = self._connect().execute(
+                "SELECT run_id, started_at, finished_at, duration, status_code, items, errors, skipped, result "
+                "FROM worker_runs WHERE name = ? ORDER BY id DESC LIMIT ?",
+                (name, limit)
+            )
+            columns = [c[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Play, Repeat, StopCircle, Save, Activity, Clock, CheckCircle, AlertCircle } from 'lucide-react';
 
 // Reusing style logic from previous WorkerProgressPanel but adapting for inline
@@ -6,7 +6,7 @@ const DetailProgressPanel = ({ workerData }) => {
   if (!workerData) return <div style={{padding: '20px', color: '#6b7280', textAlign: 'center'}}>选择 worker 并查看详情</div>;
 
   const { display_name, status_code, status_text, progress, log_preview } = workerData;
-  const { percent = 0, current = 0, total = 0, speed = 0, eta_seconds = 0, error } = progress || {};
+  const { percent = 0, current = 0, total = 0, total_estimated = false, speed = 0, eta_seconds = 0, latency_p95 = 0, error } = progress || {};
 
   const getStatusColor = (code) => {
     switch (code) {
@@ -56,11 +56,12 @@ const DetailProgressPanel = ({ workerData }) => {
       <div style={styles.statsGrid}>
         <div style={styles.statItem}>
           <span style={styles.statLabel}><CheckCircle size={12} /> 进度</span>
-          <span style={styles.statValue}>{current} / {total} ({percent}%)</span>
+          <span style={styles.statValue}>{current} / {total_estimated ? '~' : ''}{total} ({percent}%)</span>
         </div>
         <div style={styles.statItem}>
           <span style={styles.statLabel}><Activity size={12} /> 速率</span>
           <span style={styles.statValue}>{speed}/s</span>
+          {latency_p95 > 0 && <span style={styles.statLabel}>p95 {latency_p95}s</span>}
         </div>
         <div style={styles.statItem}>
           <span style={styles.statLabel}><Clock size={12} /> 估算 ETA</span>
@@ -183,11 +184,14 @@ const WorkerScheduler = () => {
         iconBtn: { background: 'none', border: 'none', cursor: 'pointer', color: '#22c55e', padding: '4px', display: 'flex', alignItems: 'center' }
     };
 
+    const versionRef = useRef(0);
+
     const fetchWorkers = async () => {
         try {
             if (window.pywebview && window.pywebview.api) {
-                const data = await window.pywebview.api.get_workers_status();
-                setWorkers(data || []);
+                const snapshot = await window.pywebview.api.get_workers_snapshot();
+                versionRef.current = snapshot ? snapshot.version : 0;
+                setWorkers((snapshot && snapshot.workers) || []);
             } else {
                 // Mock data
                 setWorkers([
@@ -203,9 +207,31 @@ const WorkerScheduler = () => {
     };
 
     useEffect(() => {
+        // 后端推送差分: 版本连续时合并, 跳号时重新拉取快照
+        window.applyDashboardDiff = (payload) => {
+            if (payload.version <= versionRef.current) return;
+            if (payload.version !== versionRef.current + 1) {
+                fetchWorkers();
+                return;
+            }
+            versionRef.current = payload.version;
+            setWorkers(prev => {
+                const next = prev
+                    .filter(w => !payload.removed.includes(w.id))
+                    .map(w => payload.changes[w.id] ? { ...w, ...payload.changes[w.id] } : w);
+                Object.entries(payload.changes).forEach(([id, change]) => {
+                    if (!prev.some(w => w.id === id)) next.push({ id, ...change });
+                });
+                return next;
+            });
+        };
+
         fetchWorkers();
-        const interval = setInterval(fetchWorkers, 1000);
-        return () => clearInterval(interval);
+        window.addEventListener('pywebviewready', fetchWorkers);
+        return () => {
+            window.removeEventListener('pywebviewready', fetchWorkers);
+            delete window.applyDashboardDiff;
+        };
     }, []);
 
     const handleStartWorker = async (name, e) => {
@@ -353,7 +379,7 @@ const WorkerScheduler = () => {
                                             <div style={styles.progressBarFill(percent)}></div>
                                         </div>
                                         <div style={styles.progressStats}>
-                                            <span>{progress.current || 0} / {progress.total || '?'}</span>
+                                            <span>{progress.current || 0} / {progress.total_estimated ? '~' : ''}{progress.total || '?'}</span>
                                             <span>{progress.eta_seconds ? `ETA: ${progress.eta_seconds}s` : ''}</span>
                                         </div>
                                     </td>
@@ -188,12 +188,21 @@ const ConsolePanel = () => {
     console.error = (...args) => { originalError(...args); pushLog('error', args, 'UI'); sendToPython('error', args); };
 
     window.addLog = (level, message, source = 'PYTHON') => pushLog(level, [message], source);
+    // 后端按帧批量推送: [[level, message], ...], 一次 setLogs
+    window.addLogBatch = (records) => {
+      const time = new Date().toLocaleTimeString('en-US', { hour12: false });
+      setLogs(prev => [
+        ...prev,
+        ...records.map(([level, message]) => ({ id: Date.now() + Math.random(), level, message, source: 'PYTHON', time }))
+      ].slice(-200));
+    };
 
     return () => {
       console.log = originalLog;
       console.warn = originalWarn;
       console.error = originalError;
       delete window.addLog;
+      delete window.addLogBatch;
     };
   }, []);
 